@@ -3,6 +3,7 @@ from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from dotenv import load_dotenv
+from routing import RoutingSession
 
 load_dotenv()
 
@@ -13,59 +14,132 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['RECAPTCHA_PUBLIC_KEY'] = os.getenv('RECAPTCHA_PUBLIC_KEY')
 app.config['RECAPTCHA_PRIVATE_KEY'] = os.getenv('RECAPTCHA_PRIVATE_KEY')
-
-db = SQLAlchemy(app)
+app.config['FEED_PAGE_SIZE'] = int(os.getenv('FEED_PAGE_SIZE', 20))
+app.config['FRIEND_CACHE_TTL'] = int(os.getenv('FRIEND_CACHE_TTL', 60))
+app.config['SEARCH_PAGE_SIZE'] = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+app.config['CATALOG_VERSION_CHECK_INTERVAL'] = float(os.getenv('CATALOG_VERSION_CHECK_INTERVAL', 1))
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+app.config['BCRYPT_WORKERS'] = int(os.getenv('BCRYPT_WORKERS', os.cpu_count() or 1))
+app.config['BCRYPT_MAX_QUEUE'] = int(os.getenv('BCRYPT_MAX_QUEUE', 32))
+app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 30))
+app.config['LEADERBOARD_SIZE'] = int(os.getenv('LEADERBOARD_SIZE', 10))
+app.config['LEADERBOARD_WINDOW'] = int(os.getenv('LEADERBOARD_WINDOW', 5))
+app.config['LEADERBOARD_REBUILD_INTERVAL'] = float(os.getenv('LEADERBOARD_REBUILD_INTERVAL', 300))
+app.config['BATCH_CHUNK_SIZE'] = int(os.getenv('BATCH_CHUNK_SIZE', 10000))
+app.config['BATCH_CHUNK_PAUSE'] = float(os.getenv('BATCH_CHUNK_PAUSE', 0.02))
+app.config['BATCH_STALE_SECONDS'] = int(os.getenv('BATCH_STALE_SECONDS', 300))
+app.config['BATCH_CATCH_UP_DAYS'] = int(os.getenv('BATCH_CATCH_UP_DAYS', 7))
+app.config['SCHEDULER_ENABLED'] = os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true'
+app.config['SCHEDULER_INTERVAL'] = float(os.getenv('SCHEDULER_INTERVAL', 60))
+app.config['SHOPPING_LIST_MEALS'] = int(os.getenv('SHOPPING_LIST_MEALS', 2))
+app.config['SHOPPING_LIST_CACHE_SIZE'] = int(os.getenv('SHOPPING_LIST_CACHE_SIZE', 256))
+app.config['ETAG_RELEASE'] = os.getenv('ETAG_RELEASE', '')
+app.config['CONDITIONAL_STATS_LOG_EVERY'] = int(os.getenv('CONDITIONAL_STATS_LOG_EVERY', 1000))
+app.config['STREAM_PAGES'] = os.getenv('STREAM_PAGES', 'true').lower() == 'true'
+app.config['STREAM_CHUNK_SIZE'] = int(os.getenv('STREAM_CHUNK_SIZE', 4096))
+app.config['STREAM_YIELD_PER'] = int(os.getenv('STREAM_YIELD_PER', 100))
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+app.config['SQLITE_PRAGMAS'] = os.getenv('SQLITE_PRAGMAS', 'true').lower() == 'true'
+app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 10000))
+app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', -16000))
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+
+# engine and pool options, any that are not set keep SQLAlchemy's default for the database in use
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    option: convert(os.environ[variable]) for option, variable, convert in (
+        ('pool_size', 'DB_POOL_SIZE', int),
+        ('max_overflow', 'DB_POOL_MAX_OVERFLOW', int),
+        ('pool_timeout', 'DB_POOL_TIMEOUT', float),
+        ('pool_recycle', 'DB_POOL_RECYCLE', int),
+        ('pool_pre_ping', 'DB_POOL_PRE_PING', lambda value: value.lower() == 'true'),
+    ) if os.getenv(variable)
+}
+
+# read replicas, as a comma separated list of database URIs, see routing.py
+replicaURIs = [uri.strip() for uri in os.getenv('SQLALCHEMY_REPLICA_URIS', '').split(',') if uri.strip()]
+app.config['REPLICA_BINDS'] = [f'replica{number}' for number in range(len(replicaURIs))]
+app.config['SQLALCHEMY_BINDS'] = dict(zip(app.config['REPLICA_BINDS'], replicaURIs))
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 5))
+app.config['REPLICATION_INTERVAL'] = float(os.getenv('REPLICATION_INTERVAL', 0))
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+# sets up each SQLite connection, so it is imported before anything can connect
+import database
 
 login_manager = LoginManager()
 login_manager.login_view = 'users.login'
 login_manager.init_app(app)
 
 from models import User, Friendship
+from identity import load_identity
 
 
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    return load_identity(int(id))
 
 
 from users.views import users_blueprint
 
 app.register_blueprint(users_blueprint)
 
-from flask import render_template
+from flask import render_template, request
 from flask_login import current_user
-from models import Post
+from sqlalchemy.orm import joinedload
+from budgets import query_budget
+from feed import feed_page
+from streaming import stream_page
+from passwords import PasswordHasherBusy
+import assets
+import budgets
+import diagnostics
+import metrics
+import migrations
+import seed
+import synthetic
+import ledger
+import batch
+import replication
+
+if app.config['SCHEDULER_ENABLED']:
+    batch.start_scheduler()
+
+if app.config['REPLICATION_INTERVAL']:
+    replication.start_replicator()
 
 
 @app.route('/')
+@query_budget(6)
 def index():
-    posts = []
+    posts = None
+    receivedRequests = []
     sentRequests = []
     activeFriendships = []
 
     if current_user.is_authenticated:
-        posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.dateCreated.desc()).all()
-
-        friendships = Friendship.query.filter(
-            ((Friendship.requester_id == current_user.id) | (Friendship.requested_id == current_user.id)) &
-            (Friendship.status == 'accepted')
-        ).all()
-
-        friendIDs = [f.requester_id if f.requested_id == current_user.id else f.requested_id for f in friendships]
+        posts = feed_page(current_user.id, request.args.get('cursor'))
 
-        friendPosts = Post.query.filter(Post.user_id.in_(friendIDs), Post.public == True).order_by(
-            Post.dateCreated.desc()).all()
+        receivedRequests = (Friendship.query.options(joinedload(Friendship.requester))
+                            .filter_by(requested_id=current_user.id, status='pending').all())
 
-        posts.extend(friendPosts)
+        sentRequests = (Friendship.query.options(joinedload(Friendship.requested))
+                        .filter_by(requester_id=current_user.id, status='pending').all())
 
-        sentRequests = [f for f in friendships if f.requester_id == current_user.id and f.status == 'pending']
-        activeFriendships = [f for f in friendships if f.status == 'accepted']
-
-    posts.sort(key=lambda x: x.dateCreated, reverse=True)
+        activeFriendships = Friendship.query.options(
+            joinedload(Friendship.requester), joinedload(Friendship.requested)
+        ).filter(
+            ((Friendship.user_low_id == current_user.id) | (Friendship.user_high_id == current_user.id)) &
+            (Friendship.status == 'accepted')
+        ).all()
 
-    return render_template('main/index.html', posts=posts,
-                           sent_requests=sentRequests,
-                           confirmed_friendships=activeFriendships)
+    return stream_page('main/index.html', posts=posts,
+                       received_requests=receivedRequests,
+                       sent_requests=sentRequests,
+                       confirmed_friendships=activeFriendships)
 
 
 @app.errorhandler(400)
@@ -93,5 +167,10 @@ def serviceUnavailable_error(error):
     return render_template('errors/503.html')
 
 
+@app.errorhandler(PasswordHasherBusy)
+def passwordHasherBusy_error(error):
+    return render_template('errors/503.html'), 503, {'Retry-After': '1'}
+
+
 if __name__ == '__main__':
     app.run()
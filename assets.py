@@ -0,0 +1,162 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import sys
+import threading
+import click
+from flask import request, send_from_directory, url_for
+from app import app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+"""
+
+Static asset pipeline. Stylesheets live in static/css, and third party ones are vendored into static/vendor, so pages
+never wait on another host. "flask --app app build-assets" copies every stylesheet into static/build under a name
+that includes a hash of its content, alongside gzip and, if the brotli package is installed, brotli compressed copies,
+and records the names in static/build/manifest.json. Templates link to assets through static_url, which gives the
+fingerprinted URL once the assets are built. Those URLs change whenever the content does, so they are served with a
+year long immutable Cache-Control, and in the best compression the browser accepts.
+
+Earlier builds are left in place, so pages rendered before a deploy can still load the assets they link to.
+
+"""
+
+BUILD_FOLDER = os.path.join(app.static_folder, 'build')
+MANIFEST = os.path.join(BUILD_FOLDER, 'manifest.json')
+SOURCE_FOLDERS = ('css', 'vendor')
+
+# vendored files, which are committed to the repository, and where each copy came from
+VENDOR = {
+    'vendor/bulma.min.css': 'Bulma 0.7.2, MIT License, see static/vendor/bulma.LICENSE',
+}
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_manifest = None
+_manifestLock = threading.Lock()
+
+
+def minify_css(css):
+    """Removes comments and the whitespace that CSS does not need. Already minified files are left alone"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{};,>])\s*', r'\1', css).replace(';}', '}').strip()
+
+
+def _sources():
+    for folder in SOURCE_FOLDERS:
+        directory = os.path.join(app.static_folder, folder)
+        for filename in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+            if filename.endswith('.css'):
+                yield f'{folder}/{filename}'
+
+
+def _write(path, content):
+    if not os.path.exists(path):
+        with open(path, 'wb') as file:
+            file.write(content)
+
+
+def missing_vendored():
+    """Returns the vendored files that are not in static/vendor"""
+    return [name for name in VENDOR if not os.path.isfile(os.path.join(app.static_folder, name))]
+
+
+def build_assets():
+    """Writes the fingerprinted and compressed copy of every stylesheet, and the manifest, returning the manifest"""
+    global _manifest
+
+    missing = missing_vendored()
+    if missing:
+        raise FileNotFoundError(f'Vendored files are missing from {app.static_folder}: {", ".join(missing)}')
+
+    os.makedirs(BUILD_FOLDER, exist_ok=True)
+    manifest = {}
+    for name in _sources():
+        with open(os.path.join(app.static_folder, name), encoding='utf-8') as file:
+            css = file.read()
+        content = (css if name.endswith('.min.css') else minify_css(css)).encode('utf-8')
+
+        root, extension = os.path.splitext(name)
+        built = f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+        path = os.path.join(BUILD_FOLDER, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write(path, content)
+        # mtime=0 so that the same content always compresses to the same bytes
+        _write(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(path + '.br', brotli.compress(content, quality=11))
+        manifest[name] = built
+
+    with open(MANIFEST, 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    with _manifestLock:
+        _manifest = manifest
+    return manifest
+
+
+def manifest():
+    """Returns the logical name to fingerprinted name mapping from the last build, read once per process"""
+    global _manifest
+    if _manifest is None:
+        with _manifestLock:
+            if _manifest is None:
+                try:
+                    with open(MANIFEST) as file:
+                        _manifest = json.load(file)
+                except FileNotFoundError:
+                    logging.warning('ASSETS - %s not found, run "flask --app app build-assets"', MANIFEST)
+                    _manifest = {}
+    return _manifest
+
+
+@app.template_global()
+def static_url(name):
+    """The URL for a static asset, fingerprinted if the assets have been built"""
+    built = manifest().get(name)
+    if built:
+        return url_for('built_asset', filename=built)
+    return url_for('static', filename=name)
+
+
+@app.route('/static/build/<path:filename>')
+def built_asset(filename):
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(BUILD_FOLDER, filename + suffix)):
+            response = send_from_directory(BUILD_FOLDER, filename + suffix, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(BUILD_FOLDER, filename, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprints and precompresses the static assets."""
+    missing = missing_vendored()
+    if missing:
+        for name in missing:
+            click.echo(f'MISSING  static/{name} ({VENDOR[name]}), commit it before building', err=True)
+        sys.exit(1)
+
+    for name, built in build_assets().items():
+        path = os.path.join(BUILD_FOLDER, built)
+        sizes = [f'{os.path.getsize(path + suffix)} bytes {label}' for suffix, label in
+                 (('', 'raw'), ('.gz', 'gzip'), ('.br', 'brotli')) if os.path.exists(path + suffix)]
+        click.echo(f'{name} -> {built} ({", ".join(sizes)})')
+    if brotli is None:
+        click.echo('brotli is not installed, only gzip copies were written')
@@ -0,0 +1,57 @@
+import json
+from sqlalchemy import select
+from app import db
+from models import QuizAttempt
+from catalog import get_answer_key, get_questions
+
+"""
+
+Quiz attempts. Each submission is graded in a single pass over the quiz's answer key from the catalog cache, without
+querying the questions, and stored as one QuizAttempt row holding the answers as a compact JSON object. The review page
+renders from that row alone, and every attempt is kept so users can retake quizzes and look back over their history.
+
+"""
+
+
+def encode_answers(answers):
+    return json.dumps({str(questionID): answer for questionID, answer in answers.items()}, separators=(',', ':'))
+
+
+def decode_answers(text):
+    return {int(questionID): answer for questionID, answer in json.loads(text).items()}
+
+
+def grade_attempt(user_id, quizID, form):
+    """Grades the submitted form against the quiz's answer key, returning an unsaved QuizAttempt"""
+    answerKey = get_answer_key(quizID)
+    answers = {}
+    score = 0
+    for questionID, correctAnswer in answerKey.items():
+        answer = form.get(f'question_{questionID}')
+        if answer is not None:
+            answers[questionID] = answer
+            score += answer == correctAnswer
+
+    return QuizAttempt(user_id=user_id, quizID=quizID, answers=encode_answers(answers), score=score,
+                       totalQuestions=len(answerKey))
+
+
+def review_attempt(attempt):
+    """Returns (question, answer, isCorrect) for each question in the attempt's quiz, in question order"""
+    answers = decode_answers(attempt.answers)
+    review = []
+    for question in get_questions(attempt.quizID):
+        answer = answers.get(question.questionID)
+        review.append((question, answer, answer == question.correctAnswer))
+    return review
+
+
+def attempt_history_query(user_id, quizID):
+    return (select(QuizAttempt)
+            .where(QuizAttempt.user_id == user_id, QuizAttempt.quizID == quizID)
+            .order_by(QuizAttempt.id.desc()))
+
+
+def attempt_history(user_id, quizID):
+    """Returns the user's attempts at a quiz, most recent first"""
+    return db.session.execute(attempt_history_query(user_id, quizID)).scalars().all()
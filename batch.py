@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+from datetime import date, datetime, timedelta
+import click
+from sqlalchemy import select, update, insert, func, case, exists
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import User, LedgerEntry, BatchRun
+from identity import clear_identities
+from conditional import progress_values
+
+"""
+
+Nightly batch jobs. The daily rollover runs once for each day that has ended: a user's streak goes up by one if they
+earned anything in the ledger that day and back to zero if they did not, and everyone's daily XP starts again from
+what they have earned so far today.
+It runs as one UPDATE per chunk of BATCH_CHUNK_SIZE users, ordered by ID, committing after each chunk so web requests
+only ever wait for one short write. Each (job, day) is recorded in batch_runs, so running it twice, or from several
+workers at once, never processes a day twice, and a run that stops part way carries on from its last chunk.
+
+Run with "flask --app app daily-rollover", from cron or similar, or set SCHEDULER_ENABLED to have each worker check
+every SCHEDULER_INTERVAL seconds for days that still need processing.
+
+"""
+
+DAILY_ROLLOVER = 'daily_rollover'
+
+
+def _claim(job, day):
+    """Returns the BatchRun to work on for the day, or None if it is finished or another worker is running it"""
+    try:
+        db.session.execute(insert(BatchRun).values(job=job, day=day, status='running', started=datetime.utcnow(),
+                                                   updated=datetime.utcnow()))
+        db.session.commit()
+        return db.session.execute(select(BatchRun).filter_by(job=job, day=day)).scalar_one()
+    except IntegrityError:
+        db.session.rollback()
+
+    # someone else started this day, only take it over if their run has stopped updating it
+    stale = datetime.utcnow() - timedelta(seconds=app.config['BATCH_STALE_SECONDS'])
+    claimed = db.session.execute(
+        update(BatchRun)
+        .where(BatchRun.job == job, BatchRun.day == day, BatchRun.status == 'running', BatchRun.updated < stale)
+        .values(updated=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return None
+    return db.session.execute(select(BatchRun).filter_by(job=job, day=day)).scalar_one()
+
+
+def rollover_statement(day, lowID, highID, today=None):
+    start = datetime.combine(day, datetime.min.time())
+    todayStart = datetime.combine(today or datetime.utcnow().date(), datetime.min.time())
+    # an opening balance is not activity, it is everything earned before the ledger existed
+    wasActive = exists().where(LedgerEntry.user_id == User.id, LedgerEntry.created >= start,
+                               LedgerEntry.created < start + timedelta(days=1), LedgerEntry.reason != 'opening_balance')
+    # anything earned since midnight, before the job got round to this user, still counts towards today
+    earnedToday = (select(func.coalesce(func.sum(LedgerEntry.experiencePoints), 0))
+                   .where(LedgerEntry.user_id == User.id, LedgerEntry.created >= todayStart)
+                   .scalar_subquery())
+    return (update(User)
+            .where(User.id > lowID, User.id <= highID)
+            .values(streak=case((wasActive, func.coalesce(User.streak, 0) + 1), else_=0),
+                    daily_experience=earnedToday, **progress_values())
+            .execution_options(synchronize_session=False))
+
+
+def daily_rollover(day, chunkSize=None):
+    """Runs the daily rollover for the day, returning its timing metrics, or None if there was nothing to do"""
+    chunkSize = chunkSize or app.config['BATCH_CHUNK_SIZE']
+    run = _claim(DAILY_ROLLOVER, day)
+    if run is None:
+        return None
+
+    started = time.perf_counter()
+    chunks = 0
+    lastUserID, users = run.lastUserID, run.users
+    # users who sign up during the run have nothing to roll over for the day, so the run ends at the highest ID now
+    maxUserID = db.session.execute(select(func.max(User.id))).scalar() or 0
+    while lastUserID < maxUserID:
+        # the chunk's upper bound is the ID chunkSize users along, so gaps in the IDs never make a chunk bigger
+        highID = db.session.execute(
+            select(User.id).where(User.id > lastUserID).order_by(User.id).offset(chunkSize - 1).limit(1)
+        ).scalar()
+        if highID is None or highID > maxUserID:
+            highID = maxUserID
+
+        updated = db.session.execute(rollover_statement(day, lastUserID, highID)).rowcount
+        lastUserID, users, chunks = highID, users + updated, chunks + 1
+        db.session.execute(update(BatchRun).where(BatchRun.id == run.id)
+                           .values(lastUserID=lastUserID, users=users, updated=datetime.utcnow())
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+
+        if lastUserID < maxUserID and app.config['BATCH_CHUNK_PAUSE']:
+            time.sleep(app.config['BATCH_CHUNK_PAUSE'])
+
+    seconds = time.perf_counter() - started
+    db.session.execute(update(BatchRun).where(BatchRun.id == run.id)
+                       .values(status='done', seconds=BatchRun.seconds + seconds, finished=datetime.utcnow(),
+                               updated=datetime.utcnow())
+                       .execution_options(synchronize_session=False))
+    db.session.commit()
+    clear_identities()
+
+    metrics = {'job': DAILY_ROLLOVER, 'day': day.isoformat(), 'users': users, 'chunks': chunks,
+               'seconds': round(seconds, 3), 'usersPerSecond': round(users / seconds) if seconds else users}
+    logging.info('BATCH - %s', metrics)
+    return metrics
+
+
+def due_days(job, today=None):
+    """Returns the days that have ended but not been processed yet, oldest first, going back at most
+    BATCH_CATCH_UP_DAYS days"""
+    today = today or datetime.utcnow().date()
+    earliest = today - timedelta(days=app.config['BATCH_CATCH_UP_DAYS'])
+    done = set(db.session.execute(
+        select(BatchRun.day).where(BatchRun.job == job, BatchRun.status == 'done', BatchRun.day >= earliest)
+    ).scalars())
+    return [earliest + timedelta(days=offset) for offset in range((today - earliest).days)
+            if earliest + timedelta(days=offset) not in done]
+
+
+def run_due_jobs():
+    """Runs the rollover for each due day in order, stopping at the first day another worker is running, as each day's
+    streaks build on the day before"""
+    results = []
+    for day in due_days(DAILY_ROLLOVER):
+        metrics = daily_rollover(day)
+        if metrics is None:
+            break
+        results.append(metrics)
+    return results
+
+
+class Scheduler(threading.Thread):
+    """Background thread that runs any due batch jobs every SCHEDULER_INTERVAL seconds"""
+
+    def __init__(self):
+        super().__init__(name='batch-scheduler', daemon=True)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(app.config['SCHEDULER_INTERVAL']):
+            try:
+                with app.app_context():
+                    run_due_jobs()
+            except Exception:
+                logging.exception('BATCH - scheduled run failed')
+
+    def stop(self):
+        self.stopped.set()
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+        _scheduler.start()
+    return _scheduler
+
+
+@app.cli.command('daily-rollover')
+@click.option('--day', help='Day to process as YYYY-MM-DD, otherwise every day that is due.')
+@click.option('--chunk-size', type=int, help='Users updated per transaction.')
+def daily_rollover_command(day, chunk_size):
+    """Updates streaks and resets daily XP for each day that has ended."""
+    days = [date.fromisoformat(day)] if day else due_days(DAILY_ROLLOVER)
+    for rolloverDay in days:
+        metrics = daily_rollover(rolloverDay, chunk_size)
+        if metrics is None:
+            click.echo(f'{rolloverDay}: already done or running elsewhere')
+            break
+        click.echo(f'{rolloverDay}: {metrics["users"]} users in {metrics["chunks"]} chunks, '
+                   f'{metrics["seconds"]}s ({metrics["usersPerSecond"]} users/s)')
+    if not days:
+        click.echo('Nothing to do')
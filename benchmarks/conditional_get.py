@@ -0,0 +1,69 @@
+"""
+
+Conditional GET benchmark. Seeds a throwaway database, logs in the test user and fetches each page that supports
+ETags, first in full and then with the ETag from the previous response, and reports the time per request for both
+along with the share of revalidations that were answered with 304 Not Modified.
+
+    python benchmarks/conditional_get.py --repeat 200
+
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGES = ['/profile', '/mealTree', '/mealTree?safe=1', '/meal_detail/1', '/knowledgeBase', '/quiz_detail/1',
+         '/termsAndConditions']
+
+
+def timed(client, url, repeat, headers=None):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        response = client.get(url, headers=headers)
+    return (time.perf_counter() - started) / repeat, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200, help='requests per page and mode')
+    args = parser.parse_args()
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+    from app import app
+    from migrations import upgrade
+    from seed import seed
+    from conditional import conditional_stats, reset_conditional_stats
+    logging.disable(logging.WARNING)
+
+    with app.app_context():
+        upgrade()
+        seed(True)
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    client.post('/login', data={'email': 'test@emailUser.com', 'password': 'userPassword!'})
+    # the login flashes the daily bonus, show it once so the pages below can be revalidated
+    client.get('/profile')
+    reset_conditional_stats()
+
+    print(f'{"page":<22} {"full ms":>9} {"304 ms":>9} {"speed up":>9}')
+    for url in PAGES:
+        full, response = timed(client, url, args.repeat)
+        revalidated, notModified = timed(client, url, args.repeat, {'If-None-Match': response.headers['ETag']})
+        assert notModified.status_code == 304, f'{url} returned {notModified.status_code}'
+        print(f'{url:<22} {full * 1000:>9.2f} {revalidated * 1000:>9.2f} {full / revalidated:>8.1f}x')
+
+    print()
+    for endpoint, counts in conditional_stats().items():
+        print(f'{endpoint:<28} {counts["notModified"]:>6} not modified {counts["rendered"]:>6} rendered '
+              f'hit rate {counts["hitRate"]:.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+
+Daily rollover benchmark. Creates a throwaway database with a large number of users, a share of whom earned XP
+yesterday, then times the nightly streak and daily XP job while another thread keeps awarding XP the way web requests
+do, and reports how long those awards had to wait for the job.
+
+    python benchmarks/daily_rollover.py --users 1000000 --active 0.3 --chunk-size 10000
+
+Set BATCH_CHUNK_PAUSE=0 to see how long awards wait when the chunks run back to back.
+
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def populate(connection, users, active):
+    yesterday = datetime.utcnow() - timedelta(days=1)
+    batch = 50000
+    for first in range(1, users + 1, batch):
+        ids = range(first, min(first + batch, users + 1))
+        connection.exec_driver_sql(
+            'INSERT INTO users (id, email, firstname, lastname, password, role, completed_onboarding, '
+            '"experiencePoints", streak, daily_experience, "progressDifficulty", "progressMealID", allergen_mask) '
+            'VALUES (?, ?, ?, ?, ?, ?, 1, 0, ?, 5, 0, 0, 0)',
+            [(user_id, f'user{user_id}@example.com', 'Bench', str(user_id), 'x', 'user', random.randint(0, 30))
+             for user_id in ids])
+        connection.exec_driver_sql(
+            'INSERT INTO ledger_entries (user_id, reason, "experiencePoints", meals_completed, quizzes_completed, '
+            '"totalMeatCo2", "totalVeganCo2", created) VALUES (?, ?, 2, 0, 0, 0, 0, ?)',
+            [(user_id, 'daily_login', yesterday) for user_id in ids if random.random() < active])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--active', type=float, default=0.3, help='share of users who earned XP yesterday')
+    parser.add_argument('--chunk-size', type=int, help='defaults to BATCH_CHUNK_SIZE')
+    args = parser.parse_args()
+
+    databaseFile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{databaseFile}'
+
+    from app import app, db
+    from migrations import upgrade
+    from batch import daily_rollover
+    from ledger import award
+    logging.disable(logging.WARNING)
+
+    with app.app_context():
+        upgrade()
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            populate(connection, args.users, args.active)
+        print(f'populated {args.users} users in {time.perf_counter() - started:.1f}s')
+
+    done = threading.Event()
+    awardLatencies = []
+
+    def keep_awarding():
+        with app.app_context():
+            while not done.is_set():
+                started = time.perf_counter()
+                award(random.randint(1, args.users), 'bench', experiencePoints=1)
+                db.session.commit()
+                awardLatencies.append(time.perf_counter() - started)
+                time.sleep(0.005)
+
+    writer = threading.Thread(target=keep_awarding)
+    writer.start()
+    with app.app_context():
+        metrics = daily_rollover((datetime.utcnow() - timedelta(days=1)).date(), args.chunk_size)
+    done.set()
+    writer.join()
+
+    print(f'rollover:        {metrics["users"]} users in {metrics["chunks"]} chunks, {metrics["seconds"]:.2f}s '
+          f'({metrics["usersPerSecond"]} users/s)')
+    print(f'awards during:   {len(awardLatencies)}')
+    print(f'award p50:       {percentile(awardLatencies, 0.50) * 1000:.1f} ms')
+    print(f'award p99:       {percentile(awardLatencies, 0.99) * 1000:.1f} ms')
+    print(f'award max:       {max(awardLatencies, default=0) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+"""
+
+Route level load benchmark. Builds a throwaway database with the base catalog and synthetic.py's generated users,
+then drives each route in turn from --concurrency threads for --seconds, every thread signed in as a different
+generated user, and reports each route's throughput and p50/p95/p99 latency.
+
+    python benchmarks/load.py --users 10000 --quizzes 20 --concurrency 8 --seconds 10
+
+By default the requests go through Flask's test client in this process. With --server the application runs in a
+separate process behind werkzeug's threaded development server, and the requests are made over HTTP, so the client
+threads do not compete with the application for the interpreter lock.
+
+Save a run with --save-baseline results.json, and compare a later run against it with --baseline results.json: any
+route whose throughput falls, or whose p95 rises, by more than --tolerance is reported and the exit status is 1.
+Use --database to run against an existing database instead of generating one.
+
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ROUTES = ('index', 'mealTree', 'knowledgeBase', 'search_users', 'complete_meal', 'complete_quiz')
+REFLECTION = 'Cooked this again for the benchmark and it turned out just as well as last time.'
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def populate(args):
+    from app import app
+    from migrations import upgrade
+    from seed import seed
+    from synthetic import generate
+
+    with app.app_context():
+        upgrade()
+        seed(with_test_users=True)
+        started = time.perf_counter()
+        counts = generate(args.users, args.quizzes, seed=args.seed)
+        print(', '.join(f'{count} {name}' for name, count in counts.items()) +
+              f' generated in {time.perf_counter() - started:.1f}s')
+
+
+def load_fixtures():
+    """Returns the generated user IDs, and what the routes need to build their requests"""
+    from sqlalchemy import select
+    from app import app, db
+    from models import User
+    from catalog import get_catalog, get_questions
+    from synthetic import SYNTHETIC_DOMAIN, FIRST_NAMES
+
+    with app.app_context():
+        userIDs = db.session.execute(
+            select(User.id).where(User.email.like(f'%@{SYNTHETIC_DOMAIN}'))
+        ).scalars().all()
+        catalog = get_catalog()
+        quizzes = {quiz.quizID: {f'question_{question.questionID}': question.correctAnswer
+                                 for question in get_questions(quiz.quizID)} for quiz in catalog.quizzes}
+        return userIDs, {'meals': [meal.mealID for meal in catalog.meals], 'quizzes': quizzes,
+                         'names': list(FIRST_NAMES)}
+
+
+def build_request(route, rng, fixtures):
+    """Returns (method, path, form) for one request to the route"""
+    if route == 'index':
+        return 'GET', '/', None
+    if route == 'mealTree':
+        return 'GET', '/mealTree', None
+    if route == 'knowledgeBase':
+        return 'GET', '/knowledgeBase', None
+    if route == 'search_users':
+        query = rng.choice(fixtures['names'])[:rng.randint(2, 5)]
+        return 'GET', '/search_users?' + urlencode({'query': query}), None
+    if route == 'complete_meal':
+        return 'POST', f'/complete_meal/{rng.choice(fixtures["meals"])}', {'reflection': REFLECTION,
+                                                                          'make_public': 'true'}
+    quizID = rng.choice(list(fixtures['quizzes']))
+    return 'POST', f'/complete_quiz/{quizID}', fixtures['quizzes'][quizID]
+
+
+def session_cookie(user_id):
+    """A signed session cookie for the user, as Flask-Login would set after they signed in"""
+    from app import app
+    return app.session_interface.get_signing_serializer(app).dumps({'_user_id': str(user_id), '_fresh': True})
+
+
+class TestClientSender:
+    def __init__(self, user_id):
+        from app import app
+        self.client = app.test_client()
+        self.client.set_cookie(app.config['SESSION_COOKIE_NAME'], session_cookie(user_id))
+
+    def send(self, method, path, form):
+        response = self.client.open(path, method=method, data=form)
+        response.get_data()
+        return response.status_code, response.headers.get('Location', '')
+
+
+class HttpSender:
+    def __init__(self, user_id, port):
+        from app import app
+        self.port = port
+        self.cookie = f'{app.config["SESSION_COOKIE_NAME"]}={session_cookie(user_id)}'
+        self.connection = http.client.HTTPConnection('127.0.0.1', port)
+
+    def send(self, method, path, form):
+        headers = {'Cookie': self.cookie}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port)
+            raise
+        return response.status, response.getheader('Location', '')
+
+
+def run_route(route, senders, seconds, fixtures, seed):
+    """Sends requests to the route from one thread per sender for the given time. Returns (latencies, errors,
+    elapsed). A response with an unexpected status, or a redirect to the login page, is an error"""
+    expected = 302 if route.startswith('complete_') else 200
+    latencies, errors = [], []
+    start = threading.Barrier(len(senders) + 1)
+
+    def work(number, sender):
+        rng = random.Random(seed * 1000 + number)
+        mine, failed = [], 0
+        start.wait()
+        stop = time.monotonic() + seconds
+        while time.monotonic() < stop:
+            method, path, form = build_request(route, rng, fixtures)
+            began = time.perf_counter()
+            try:
+                status, location = sender.send(method, path, form)
+            except Exception:
+                status, location = None, ''
+            mine.append(time.perf_counter() - began)
+            failed += status != expected or '/login' in location
+        latencies.extend(mine)
+        errors.append(failed)
+
+    threads = [threading.Thread(target=work, args=(number, sender)) for number, sender in enumerate(senders)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, sum(errors), time.perf_counter() - began
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(port):
+    server = subprocess.Popen([sys.executable, __file__, '--serve', str(port)], env=os.environ,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError('The application server did not start')
+
+
+def serve(port):
+    from werkzeug.serving import run_simple
+    from app import app
+    logging.disable(logging.WARNING)
+    app.config.update(WTF_CSRF_ENABLED=False)
+    run_simple('127.0.0.1', port, app, threaded=True)
+
+
+def compare(results, baseline, tolerance):
+    """Prints each route's change from the baseline, returning the routes that regressed"""
+    regressions = []
+    print(f'\n{"route":<16} {"req/s":>16} {"p95":>16}')
+    for route, result in results.items():
+        before = baseline['routes'].get(route)
+        if before is None:
+            print(f'{route:<16} {"no baseline":>16}')
+            continue
+        throughput = result['throughput'] / before['throughput'] - 1 if before['throughput'] else 0.0
+        p95 = result['p95'] / before['p95'] - 1 if before['p95'] else 0.0
+        regressed = throughput < -tolerance or p95 > tolerance
+        if regressed:
+            regressions.append(route)
+        print(f'{route:<16} {throughput:>+15.1%} {p95:>+15.1%} {"REGRESSED" if regressed else ""}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000, help='synthetic users to generate')
+    parser.add_argument('--quizzes', type=int, default=20, help='synthetic quizzes to generate')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='database URI to use instead of generating one')
+    parser.add_argument('--routes', nargs='+', choices=ROUTES, default=list(ROUTES))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10, help='how long to drive each route for')
+    parser.add_argument('--server', action='store_true', help='send requests over HTTP to a separate server process')
+    parser.add_argument('--baseline', help='results file to compare this run against')
+    parser.add_argument('--save-baseline', help='file to save this run\'s results to')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='fraction throughput may fall, or p95 rise, before a route counts as regressed')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = args.database or \
+        f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    from app import app
+    app.config.update(WTF_CSRF_ENABLED=False)
+    logging.disable(logging.WARNING)
+
+    if not args.database:
+        populate(args)
+    userIDs, fixtures = load_fixtures()
+    if len(userIDs) < args.concurrency:
+        parser.error(f'the database has {len(userIDs)} synthetic users, fewer than --concurrency')
+    signedIn = random.Random(args.seed).sample(userIDs, args.concurrency)
+
+    port = free_port() if args.server else None
+    server = start_server(port) if port else None
+    try:
+        results = {}
+        print(f'{"route":<16} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50":>9} {"p95":>9} {"p99":>9}')
+        for route in args.routes:
+            senders = [HttpSender(user_id, port) if server else TestClientSender(user_id)
+                       for user_id in signedIn]
+            latencies, errors, elapsed = run_route(route, senders, args.seconds, fixtures, args.seed)
+            results[route] = {'requests': len(latencies), 'errors': errors, 'throughput': len(latencies) / elapsed,
+                              'p50': percentile(latencies, 0.5), 'p95': percentile(latencies, 0.95),
+                              'p99': percentile(latencies, 0.99)}
+            result = results[route]
+            print(f'{route:<16} {result["requests"]:>9} {errors:>7} {result["throughput"]:>9.1f} '
+                  f'{result["p50"] * 1000:>7.1f}ms {result["p95"] * 1000:>7.1f}ms {result["p99"] * 1000:>7.1f}ms')
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    settings = {'users': args.users, 'quizzes': args.quizzes, 'concurrency': args.concurrency,
+                'seconds': args.seconds, 'server': args.server, 'database': bool(args.database)}
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump({'settings': settings, 'routes': results}, file, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['settings'] != settings:
+            print(f'\nThe baseline was run with different settings: {baseline["settings"]}')
+        regressions = compare(results, baseline, args.tolerance)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
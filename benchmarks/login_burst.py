@@ -0,0 +1,87 @@
+"""
+
+Login burst benchmark. Runs a number of threads that log in over and over while other threads keep requesting an
+ordinary page, then reports how many logins per second got through and the latency of the other page while they ran.
+Run from the project root against a throwaway database, for example:
+
+    python benchmarks/login_burst.py --login-threads 8 --page-threads 4 --seconds 10 --rounds 12
+
+Compare runs with different BCRYPT_WORKERS / BCRYPT_MAX_QUEUE settings to see the effect of the bounded hashing pool.
+
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--login-threads', type=int, default=8)
+    parser.add_argument('--page-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt work factor to benchmark')
+    parser.add_argument('--page', default='/termsAndConditions', help='route requested alongside the logins')
+    args = parser.parse_args()
+
+    databaseFile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{databaseFile}'
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.rounds)
+
+    from app import app
+    from migrations import upgrade
+    from seed import seed
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        upgrade()
+        seed(with_test_users=True)
+    logging.disable(logging.WARNING)
+
+    stop = time.monotonic() + args.seconds
+    logins = []
+    rejected = []
+    pageLatencies = []
+
+    def log_in():
+        client = app.test_client()
+        while time.monotonic() < stop:
+            response = client.post('/login', data={'email': 'test@emailUser.com', 'password': 'userPassword!'})
+            (rejected if response.status_code == 503 else logins).append(1)
+            client.get('/logout')
+
+    def browse():
+        client = app.test_client()
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            client.get(args.page)
+            pageLatencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=log_in) for _ in range(args.login_threads)]
+    threads += [threading.Thread(target=browse) for _ in range(args.page_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f'bcrypt rounds:        {args.rounds}')
+    print(f'bcrypt workers/queue: {app.config["BCRYPT_WORKERS"]}/{app.config["BCRYPT_MAX_QUEUE"]}')
+    print(f'logins/sec:           {len(logins) / args.seconds:.1f} ({len(rejected)} turned away with 503)')
+    print(f'{args.page} requests: {len(pageLatencies)}')
+    print(f'{args.page} p50:      {percentile(pageLatencies, 0.50) * 1000:.1f} ms')
+    print(f'{args.page} p99:      {percentile(pageLatencies, 0.99) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
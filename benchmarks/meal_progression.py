@@ -0,0 +1,119 @@
+"""
+
+Meal progression check. Seeds a throwaway database and, signed in as the test user, completes the first two meals, so
+their progression cursor has gone past both. Then checks what the meal tree and shopping list offer them:
+
+    a new meal added below the cursor     offered as the next meal, not shown as completed
+    completing the new meal               the cursor moves on past every completed meal again
+    an uncompleted meal moved below it    offered as the next meal, not shown as completed
+
+A user whose cursor is still before the new meal must not be moved. Exits with a non-zero status if any check fails.
+
+    python benchmarks/meal_progression.py
+
+"""
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "progression.db")}'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+    from flask import template_rendered
+    from sqlalchemy import select
+    from app import app, db
+    from migrations import upgrade
+    from models import User, Meal
+    from seed import seed
+    logging.disable(logging.WARNING)
+
+    with app.app_context():
+        upgrade()
+        seed(True)
+        userID = db.session.execute(select(User.id).where(User.email == 'test@emailUser.com')).scalar_one()
+        otherID = db.session.execute(select(User.id).where(User.email == 'test@email.com')).scalar_one()
+        positions = [tuple(row) for row in db.session.execute(
+            select(Meal.mealDifficulty, Meal.mealID).order_by(Meal.mealDifficulty, Meal.mealID))]
+        meals = [mealID for _, mealID in positions]
+
+    app.config.update(TESTING=True)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(userID)
+        session['_fresh'] = True
+
+    rendered = {}
+
+    def record(sender, template, context, **extra):
+        rendered[template.name] = context
+
+    template_rendered.connect(record, app)
+
+    def cursor(user_id):
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            return user.progressDifficulty, user.progressMealID
+
+    def offered():
+        """Returns (the next meal on the meal tree, whether it shows as completed, the shopping list's first meal)"""
+        client.get('/mealTree').get_data()
+        tree = rendered['users/mealTree.html']
+        client.get('/shoppingList?meals=1').get_data()
+        shopping = rendered['users/shoppingList.html']
+        nextMeal = tree['next_meal'].mealID if tree['next_meal'] else None
+        return (nextMeal, nextMeal in tree['completed_meals_ids'],
+                shopping['meals'][0].mealID if shopping['meals'] else None)
+
+    def complete(meal_id):
+        response = client.post(f'/complete_meal/{meal_id}',
+                               data={'reflection': 'A reflective account of the progression check.'})
+        assert response.status_code == 302, response.status_code
+
+    failures = []
+
+    def check(name, actual, expected):
+        ok = actual == expected
+        failures.extend([] if ok else [name])
+        print(f'{name:<48} {str(actual):<24} {"ok" if ok else f"expected {expected}"}')
+
+    for meal_id in meals[:2]:
+        complete(meal_id)
+    check('cursor after the first two meals', cursor(userID), positions[2])
+    otherCursor = cursor(otherID)
+
+    with app.app_context():
+        # one difficulty below the cursor, so it lands before it in the progression
+        difficulty = cursor(userID)[0] - 1
+        newMeal = Meal(mealName='Weeknight Lentil Soup', mealDescription='A new meal added to the catalog.',
+                       recipe='1 cup of red lentils,1 onion,2 carrots', recipeInstructions='1. Simmer everything.',
+                       mealDifficulty=difficulty, veganCo2=0.8, meatCo2=2.0)
+        db.session.add(newMeal)
+        db.session.commit()
+        newMealID = newMeal.mealID
+
+    check('new meal: cursor moved back to it', cursor(userID), (difficulty, newMealID))
+    check('new meal: next, completed, shopping list', offered(), (newMealID, False, newMealID))
+    check('new meal: cursor before it left alone', cursor(otherID), otherCursor)
+
+    complete(newMealID)
+    check('completed it: next, completed, shopping list', offered(), (meals[2], False, meals[2]))
+    check('completed it: cursor moved past it', cursor(userID), positions[2])
+
+    with app.app_context():
+        meal = db.session.get(Meal, meals[2])
+        meal.mealDifficulty = 0
+        db.session.commit()
+
+    check('moved meal: cursor moved back to it', cursor(userID), (0, meals[2]))
+    check('moved meal: next, completed, shopping list', offered(), (meals[2], False, meals[2]))
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
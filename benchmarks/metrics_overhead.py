@@ -0,0 +1,98 @@
+"""
+
+Metrics overhead benchmark. Seeds a throwaway database, then fetches the same pages as the test user over and over,
+with METRICS_ENABLED false and true in turn, each in a fresh process, and reports the time per request for each page
+and how much recording the metrics added to it. Each page is timed in rounds and the quickest round of any process
+counts, since timings on a shared machine vary by more than the difference being measured.
+
+    python benchmarks/metrics_overhead.py --requests 100 --rounds 10 --processes 3
+
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGES = ['/', '/mealTree', '/knowledgeBase', '/leaderboard', '/termsAndConditions']
+
+
+def populate():
+    from app import app, db
+    from migrations import upgrade
+    from seed import seed
+
+    with app.app_context():
+        upgrade()
+        seed(True)
+        db.session.commit()
+
+
+def serve(requests, rounds):
+    """Runs in the child process, fetches every page and prints the quickest round's time per request as JSON"""
+    from sqlalchemy import select
+    from app import app, db
+    from models import User
+
+    with app.app_context():
+        userID = db.session.execute(select(User.id).where(User.email == 'test@emailUser.com')).scalar_one()
+    app.config.update(TESTING=True)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(userID)
+        session['_fresh'] = True
+
+    results = {}
+    for url in PAGES:
+        for _ in range(20):
+            client.get(url).get_data()
+        quickest = None
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get(url).get_data()
+            elapsed = (time.perf_counter() - started) / requests
+            quickest = elapsed if quickest is None else min(quickest, elapsed)
+        results[url] = quickest
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help='requests per page in each round')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=3, help='processes to run for each setting')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        serve(args.requests, args.rounds)
+        return
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    populate()
+
+    results = {'false': {}, 'true': {}}
+    for _ in range(args.processes):
+        for mode in ('false', 'true'):
+            output = subprocess.run([sys.executable, __file__, '--child', '--requests', str(args.requests),
+                                     '--rounds', str(args.rounds)],
+                                    env={**os.environ, 'METRICS_ENABLED': mode}, capture_output=True, text=True,
+                                    check=True).stdout
+            for url, elapsed in json.loads(output.strip().splitlines()[-1]).items():
+                results[mode][url] = min(results[mode].get(url, elapsed), elapsed)
+
+    print(f'{"page":<22} {"disabled":>10} {"enabled":>10} {"overhead":>10}')
+    for url in PAGES:
+        disabled, enabled = results['false'][url], results['true'][url]
+        print(f'{url:<22} {disabled * 1000:>8.3f}ms {enabled * 1000:>8.3f}ms '
+              f'{(enabled - disabled) * 1000000:>8.0f}us')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+"""
+
+Query budget check. Seeds a throwaway database, then fetches every page and sends every form as the test user, first
+with the seeded data and again after giving them many friends, friend requests, posts, completed quizzes and awards,
+counting the SQL statements each request runs both with the process caches warm and with them emptied before the
+request, as the first request after a restart or a catalog change sees it. Forms are sent without following the
+redirect they answer with, and each is sent to a target it has not been sent to before where there is one, so the
+first completion of a meal or quiz and a new friend request are what get counted. Exits with a non-zero status if any
+request goes over the budget its view declares with query_budget, or runs more statements on the larger database,
+which means something is being loaded one row at a time.
+
+    python benchmarks/query_budgets.py --scale 200
+
+Add --verbose to print the statements each page ran.
+
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGES = ['/', '/profile', '/mealTree', '/mealTree?safe=1', '/meal_detail/1', '/knowledgeBase',
+         '/quiz_detail/1', '/review_quiz/1', '/shoppingList', '/shoppingList?meals=5', '/leaderboard',
+         '/leaderboard?scope=friends', '/co2', '/co2?scope=friends', '/api/co2?scope=friends', '/updateAllergies',
+         '/onboarding', '/termsAndConditions', '/search_users?query=friend', '/search_users']
+
+
+def grow(user_id, scale):
+    """Gives the user `scale` more friends who each have a post, incoming and outgoing friend requests, posts of their
+    own, quiz attempts and awards"""
+    from app import db
+    from models import User, Friendship, Post, QuizAttempt
+    from ledger import award
+
+    me = db.session.get(User, user_id)
+    offset = db.session.query(User).count()
+    for number in range(offset, offset + scale * 3):
+        other = User(email=f'friend{number}@example.com', firstname='Friend', lastname=str(number), password='x',
+                     role='user', completed_onboarding=True)
+        db.session.add(other)
+        db.session.flush()
+        kind = number % 3
+        if kind == 0:
+            db.session.add(Friendship(other.id, user_id, other.email, me.email, status='accepted'))
+            db.session.add(Post(user_id=other.id, email=other.email, title=f'Post by friend {number}',
+                                body='A reflective account', public=True))
+            award(other.id, 'meal', experiencePoints=number, meals_completed=1, totalMeatCo2=2.0, totalVeganCo2=0.5)
+        elif kind == 1:
+            db.session.add(Friendship(other.id, user_id, other.email, me.email))
+        else:
+            db.session.add(Friendship(user_id, other.id, me.email, other.email))
+
+    for number in range(scale):
+        db.session.add(Post(user_id=user_id, email=me.email, title=f'My post {number}',
+                            body='Another reflective account', public=number % 2 == 0))
+        db.session.add(QuizAttempt(user_id=user_id, quizID=1, score=1, totalQuestions=2, answers='{}'))
+        award(user_id, 'quiz', reference=1, experiencePoints=2, quizzes_completed=1)
+    db.session.commit()
+    clear_caches()
+
+
+def _stranger(number):
+    from app import db
+    from models import User
+
+    other = User(email=f'stranger{number}@example.com', firstname='Stranger', lastname=str(number), password='x',
+                 role='user', completed_onboarding=True)
+    db.session.add(other)
+    db.session.flush()
+    return other
+
+
+def _allergies(user_id):
+    from app import db
+    from models import User, ALLERGEN_BITS
+
+    # always a change, and never to no allergies, so the safe meal tree is measured filtering the same way every run
+    allergens = ['sesame'] if db.session.get(User, user_id).allergen_mask == ALLERGEN_BITS['gluten'] else ['gluten']
+    return '/updateAllergies', {'allergen': allergens}
+
+
+def _onboarding(user_id):
+    from app import db
+    from models import User
+    from identity import evict_identity
+
+    db.session.get(User, user_id).completed_onboarding = False
+    db.session.commit()
+    evict_identity(user_id)
+    return '/onboarding', {'completed_onboarding': 'true'}
+
+
+def _next_meal(user_id):
+    from app import db
+    from models import User
+    from progression import next_meal_ids, progress_cursor
+
+    mealIDs = next_meal_ids(user_id, progress_cursor(db.session.get(User, user_id)))
+    return f'/complete_meal/{mealIDs[0] if mealIDs else 1}', {'reflection': 'A reflective account of the budget check.'}
+
+
+def _next_quiz(user_id):
+    from sqlalchemy import select
+    from app import db
+    from models import UserQuiz
+    from catalog import get_catalog, get_answer_key
+
+    completed = set(db.session.execute(select(UserQuiz.quizID).filter_by(user_id=user_id, completed=True)).scalars())
+    quizIDs = [quiz.quizID for quiz in get_catalog().quizzes if quiz.quizID not in completed] or [1]
+    return f'/complete_quiz/{quizIDs[0]}', {f'question_{questionID}': answer
+                                            for questionID, answer in get_answer_key(quizIDs[0]).items()}
+
+
+def _friend_request(user_id):
+    from app import db
+    from models import User
+
+    other = _stranger(db.session.query(User).count())
+    db.session.commit()
+    return f'/send_friend_request/{other.id}', {}
+
+
+def _incoming_request(action):
+    def build(user_id):
+        from app import db
+        from models import User, Friendship
+
+        me = db.session.get(User, user_id)
+        other = _stranger(db.session.query(User).count())
+        friendship = Friendship(other.id, user_id, other.email, me.email)
+        db.session.add(friendship)
+        db.session.commit()
+        return f'/{action}_friend_request/{friendship.id}', {}
+    return build
+
+
+# (label, build), build returns the URL and form of the next POST to send
+FORMS = [
+    ('/updateAllergies', _allergies),
+    ('/onboarding', _onboarding),
+    ('/complete_meal/<next>', _next_meal),
+    ('/complete_quiz/<next>', _next_quiz),
+    ('/send_friend_request/<new>', _friend_request),
+    ('/accept_friend_request/<new>', _incoming_request('accept')),
+    ('/decline_friend_request/<new>', _incoming_request('decline')),
+]
+
+
+def clear_caches():
+    import catalog
+    from friends import clear_friend_cache
+    from leaderboard import clear_rankings
+    from identity import clear_identities
+    from shopping import clear_shopping_lists
+
+    clear_friend_cache()
+    clear_rankings()
+    clear_identities()
+    clear_shopping_lists()
+    catalog._snapshot = catalog._checkedVersion = None
+
+
+def requests(user_id):
+    """Yields (label, method, url, form) for every page and form, building each form when it is reached"""
+    from app import app
+
+    for url in PAGES:
+        yield url, 'GET', url, None
+    for label, build in FORMS:
+        with app.app_context():
+            url, form = build(user_id)
+        yield 'POST ' + label, 'POST', url, form
+
+
+def measure(client, user_id, cold, verbose):
+    from budgets import count_statements, budget_for, endpoint_for
+
+    # every page once first, so the process caches are warm and each page is measured as most requests see it
+    for url in PAGES:
+        client.get(url).get_data()
+
+    results = {}
+    for label, method, url, form in requests(user_id):
+        if cold:
+            clear_caches()
+        with count_statements() as counter:
+            response = client.open(url, method=method, data=form)
+            # streamed pages render as the body is read
+            response.get_data()
+        results[label] = (response.status_code, counter.count, budget_for(endpoint_for(url, method)))
+        if verbose:
+            print(f'{method} {url} ({"cold" if cold else "warm"}):')
+            for statement in counter.statements:
+                print('    ' + ' '.join(statement.split())[:150])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=200, help='friends, requests and posts to add for the second run')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+    from sqlalchemy import select
+    from app import app, db
+    from migrations import upgrade
+    from models import User, ALLERGEN_BITS
+    from seed import seed
+    logging.disable(logging.WARNING)
+
+    with app.app_context():
+        upgrade()
+        seed(True)
+        user = db.session.execute(select(User).where(User.email == 'test@emailUser.com')).scalar_one()
+        user.allergen_mask = ALLERGEN_BITS['gluten']
+        userID = user.id
+        grow(userID, 1)
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(userID)
+        session['_fresh'] = True
+
+    small = {cold: measure(client, userID, cold, args.verbose) for cold in (False, True)}
+    with app.app_context():
+        grow(userID, args.scale)
+    large = {cold: measure(client, userID, cold, args.verbose) for cold in (False, True)}
+
+    failures = 0
+    print(f'{"":<41} {"warm":^14}{"cold":^14}')
+    print(f'{"request":<34} {"status":>6} {"small":>6} {"large":>6} {"small":>6} {"large":>6} {"budget":>7}')
+    for label in small[False]:
+        status, _, budget = small[False][label]
+        counts = [runs[cold][label][1] for cold in (False, True) for runs in (small, large)]
+        problems = []
+        if budget is None:
+            problems.append('no budget')
+        elif max(counts) > budget:
+            problems.append('over budget')
+        if counts[1] > counts[0] or counts[3] > counts[2]:
+            problems.append('grows with the data')
+        failures += bool(problems)
+        print(f'{label:<34} {status:>6} {"".join(f"{count:>7}" for count in counts)} '
+              f'{budget if budget is not None else "-":>7} {", ".join(problems)}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+
+Question loading micro-benchmark. Fills two throwaway SQLite tables with the same quiz questions, one storing the
+options the old way as a PickleType and one as JSON, then times loading a quiz's questions the way quiz_detail does:
+
+    pickle        - the old ORM-style load, one pickle.loads per question
+    json per row  - a JSON column decoded one question at a time
+    json batch    - catalog.load_questions, raw JSON text decoded once per quiz
+
+followed by the decode step timed on its own.
+
+    python benchmarks/question_loading.py --quizzes 200 --questions 20 --repeat 5
+
+"""
+import argparse
+import json
+import pickle
+import time
+import timeit
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Text, String, PickleType, JSON, select
+from sqlalchemy import type_coerce
+
+
+def build(engine, quizzes, questions):
+    metadata = MetaData()
+    tables = {}
+    for name, optionsType in (('pickled', PickleType), ('json', JSON)):
+        tables[name] = Table(f'questions_{name}', metadata,
+                             Column('questionID', Integer, primary_key=True),
+                             Column('quizID', Integer, nullable=False, index=True),
+                             Column('questionText', Text, nullable=False),
+                             Column('correctAnswer', String(100), nullable=False),
+                             Column('otherOptions', optionsType))
+    metadata.create_all(engine)
+
+    rows = [dict(quizID=quizID, questionText=f'Question {number} of quiz {quizID}?', correctAnswer='Soybeans',
+                 otherOptions=['Wheat', 'Rice', f'Almonds {number}'])
+            for quizID in range(1, quizzes + 1) for number in range(questions)]
+    with engine.begin() as connection:
+        for table in tables.values():
+            connection.execute(table.insert(), rows)
+    return tables
+
+
+def load_per_row(connection, table, quizID):
+    return [dict(row._mapping) for row in connection.execute(select(table).where(table.c.quizID == quizID))]
+
+
+def load_batch(connection, table, quizID):
+    # mirrors catalog.load_questions: read the options as text, decode the whole quiz with one json.loads
+    columns = [type_coerce(column, Text) if column.key == 'otherOptions' else column for column in table.columns]
+    rows = connection.execute(select(*columns).where(table.c.quizID == quizID)).all()
+    options = json.loads('[' + ','.join(row.otherOptions or 'null' for row in rows) + ']')
+    return [{**row._mapping, 'otherOptions': rowOptions} for row, rowOptions in zip(rows, options)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quizzes', type=int, default=200)
+    parser.add_argument('--questions', type=int, default=20, help='questions per quiz')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine('sqlite://')
+    tables = build(engine, args.quizzes, args.questions)
+
+    cases = [('pickle', load_per_row, tables['pickled']),
+             ('json per row', load_per_row, tables['json']),
+             ('json batch', load_batch, tables['json'])]
+
+    with engine.connect() as connection:
+        expected = load_per_row(connection, tables['pickled'], 1)
+        for name, loader, table in cases:
+            assert loader(connection, table, 1) == expected, name
+
+        for name, loader, table in cases:
+            best = None
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                for quizID in range(1, args.quizzes + 1):
+                    loader(connection, table, quizID)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            total = args.quizzes * args.questions
+            print(f'{name:13} {total / best:10.0f} questions/s   {best / args.quizzes * 1e6:8.1f} us per quiz')
+
+    # the decode step on its own, without the query and row handling around it
+    pickled = [pickle.dumps(['Wheat', 'Rice', f'Almonds {number}']) for number in range(args.questions)]
+    encoded = [json.dumps(['Wheat', 'Rice', f'Almonds {number}']) for number in range(args.questions)]
+    decoders = [('pickle', lambda: [pickle.loads(options) for options in pickled]),
+                ('json per row', lambda: [json.loads(options) for options in encoded]),
+                ('json batch', lambda: json.loads('[' + ','.join(encoded) + ']'))]
+    print('\ndecode only:')
+    for name, decode in decoders:
+        elapsed = timeit.timeit(decode, number=args.quizzes * args.repeat)
+        print(f'{name:13} {args.quizzes * args.repeat * args.questions / elapsed:10.0f} questions/s')
+
+
+if __name__ == '__main__':
+    main()
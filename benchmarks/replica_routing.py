@@ -0,0 +1,118 @@
+"""
+
+Replica routing check. Creates a throwaway primary and two replica SQLite files, fills the primary with the seeded
+catalog and synthetic users, copies it to the replicas with replication.py, and then, signed in as the test user,
+records which database served each statement of a sequence of requests:
+
+    a meal page                       read from a replica
+    completing the meal               written to the primary
+    the meal page straight after      read from the primary, and shows the meal completed
+    once the sticky window has passed read from a replica, which has not caught up yet
+    after the replicas are refreshed  read from a replica, and shows the meal completed
+
+Exits with a non-zero status if any request is served from the wrong database or shows the wrong state. Also reports
+how long a copy of the primary takes at the generated size.
+
+    python benchmarks/replica_routing.py --users 2000
+
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STICKY_SECONDS = 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(directory, "primary.db")}'
+    os.environ['SQLALCHEMY_REPLICA_URIS'] = ','.join(f'sqlite:///{os.path.join(directory, f"replica{number}.db")}'
+                                                     for number in range(2))
+    os.environ['REPLICA_STICKY_SECONDS'] = str(STICKY_SECONDS)
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+    from sqlalchemy import event, select
+    from app import app, db
+    from migrations import upgrade
+    from models import User
+    from seed import seed
+    from synthetic import generate
+    from replication import replicate
+    logging.disable(logging.WARNING)
+
+    served = []
+
+    def recorder(bind):
+        def record(connection, cursor, statement, parameters, context, executemany):
+            served.append(bind or 'primary')
+        return record
+
+    with app.app_context():
+        upgrade()
+        seed(True)
+        generate(args.users)
+        userID = db.session.execute(select(User.id).where(User.email == 'test@emailUser.com')).scalar_one()
+        print(f'Copied the primary to the replicas in {replicate() * 1000:.0f}ms')
+        for bind in [None] + app.config['REPLICA_BINDS']:
+            event.listen(db.engines[bind], 'before_cursor_execute', recorder(bind))
+
+    app.config.update(TESTING=True)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(userID)
+        session['_fresh'] = True
+
+    def meal_page():
+        return client.get('/meal_detail/1')
+
+    def complete_meal():
+        return client.post('/complete_meal/1', data={'reflection': 'A reflective account of the replica check.'})
+
+    def refresh_replicas():
+        with app.app_context():
+            replicate()
+        return meal_page()
+
+    def after_sticky_window():
+        time.sleep(STICKY_SECONDS + 0.1)
+        return meal_page()
+
+    steps = [
+        ('meal page', meal_page, 'replica', False),
+        ('complete the meal', complete_meal, 'primary', None),
+        ('meal page straight after', meal_page, 'primary', True),
+        ('meal page after the window', after_sticky_window, 'replica', False),
+        ('meal page, replicas copied', refresh_replicas, 'replica', True),
+    ]
+
+    failures = 0
+    print(f'{"request":<28} {"status":>6} {"served by":<20} {"completed":>9}')
+    for name, send, expectedSource, expectedCompleted in steps:
+        served.clear()
+        response = send()
+        body = response.get_data(as_text=True)
+        sources = sorted(set(served))
+        completed = 'Completed</button>' in body if expectedCompleted is not None else None
+
+        wrongSource = any(not source.startswith(expectedSource) for source in sources)
+        problems = [f'expected the {expectedSource}'] if wrongSource else []
+        if completed != expectedCompleted:
+            problems.append('shows the wrong state')
+        failures += bool(problems)
+        print(f'{name:<28} {response.status_code:>6} {", ".join(sources) or "-":<20} '
+              f'{"-" if completed is None else str(completed):>9} {", ".join(problems)}')
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
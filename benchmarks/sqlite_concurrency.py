@@ -0,0 +1,157 @@
+"""
+
+SQLite concurrency benchmark. Generates a database of synthetic users, then runs the same mix of page views and writes
+against a fresh copy of it twice: once with SQLite's own defaults (SQLITE_PRAGMAS=false, so a rollback journal and
+synchronous=FULL) and once with the settings database.py applies. The requests come from several worker processes
+with several threads each, the way the application runs behind a multi-process server, every thread signed in as a
+different generated user. Reports reads and writes per second, their latencies, how many requests failed and how many
+of those failed because the database was locked.
+
+    python benchmarks/sqlite_concurrency.py --processes 4 --threads 4 --seconds 10 --write-fraction 0.2
+
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+READS = ('index', 'mealTree', 'knowledgeBase')
+WRITES = ('complete_meal', 'complete_quiz', 'send_friend_request')
+
+
+def populate(users, quizzes):
+    from app import app, db
+    from migrations import upgrade
+    from seed import seed
+    from synthetic import generate
+
+    with app.app_context():
+        upgrade()
+        seed(with_test_users=True)
+        generate(users, quizzes)
+        db.engine.dispose()
+
+
+def work(args):
+    """Runs in each worker process, sending requests from its threads and printing what happened as JSON"""
+    from flask import got_request_exception
+    from app import app
+    from load import TestClientSender, build_request, load_fixtures
+
+    app.config.update(WTF_CSRF_ENABLED=False)
+    logging.disable(logging.CRITICAL)
+    userIDs, fixtures = load_fixtures()
+
+    locked = []
+
+    def count_locked(sender, exception, **extra):
+        if 'database is locked' in str(exception):
+            locked.append(exception)
+
+    got_request_exception.connect(count_locked, app)
+
+    latencies = {'read': [], 'write': []}
+    errors = []
+
+    def run(number):
+        rng = random.Random(args.worker * 1000 + number)
+        sender = TestClientSender(rng.choice(userIDs))
+        mine = {'read': [], 'write': []}
+        failed = 0
+        time.sleep(max(0.0, args.start_at - time.time()))
+        stop = args.start_at + args.seconds
+        while time.time() < stop:
+            kind = 'write' if rng.random() < args.write_fraction else 'read'
+            route = rng.choice(WRITES if kind == 'write' else READS)
+            if route == 'send_friend_request':
+                method, path, form = 'POST', f'/send_friend_request/{rng.choice(userIDs)}', {}
+            else:
+                method, path, form = build_request(route, rng, fixtures)
+
+            began = time.perf_counter()
+            try:
+                status, location = sender.send(method, path, form)
+            except Exception:
+                status, location = None, ''
+            mine[kind].append(time.perf_counter() - began)
+            # the application's error pages are sent with a 200, so a failed write shows up as a missing redirect
+            failed += status != (302 if kind == 'write' else 200) or '/login' in location
+        for kind, samples in mine.items():
+            latencies[kind].extend(samples)
+        errors.append(failed)
+
+    threads = [threading.Thread(target=run, args=(number,)) for number in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({'latencies': latencies, 'errors': sum(errors), 'locked': len(locked)}))
+
+
+def run_mode(template, pragmas, args):
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, 'bench.db')
+    shutil.copy(template, database)
+    env = {**os.environ, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}', 'SQLITE_PRAGMAS': pragmas}
+
+    startAt = time.time() + args.startup
+    workers = [subprocess.Popen([sys.executable, __file__, '--worker', str(number), '--start-at', str(startAt),
+                                 '--threads', str(args.threads), '--seconds', str(args.seconds),
+                                 '--write-fraction', str(args.write_fraction)],
+                                env=env, stdout=subprocess.PIPE, text=True)
+               for number in range(args.processes)]
+    results = [json.loads(worker.communicate()[0].strip().splitlines()[-1]) for worker in workers]
+    shutil.rmtree(directory)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--quizzes', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='threads in each process')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-fraction', type=float, default=0.2)
+    parser.add_argument('--startup', type=float, default=5, help='seconds the workers are given to start up')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        work(args)
+        return
+
+    from load import percentile
+
+    template = os.path.join(tempfile.mkdtemp(), 'template.db')
+    os.environ.update(SQLALCHEMY_DATABASE_URI=f'sqlite:///{template}', SQLITE_PRAGMAS='false')
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    populate(args.users, args.quizzes)
+
+    print(f'{args.processes} processes x {args.threads} threads, {args.write_fraction:.0%} writes, '
+          f'{args.seconds:g}s per run')
+    print(f'{"settings":<10} {"reads/s":>8} {"writes/s":>9} {"read p50":>9} {"read p95":>9} {"read p99":>9} '
+          f'{"write p50":>10} {"write p95":>10} {"write p99":>10} {"errors":>7} {"locked":>7}')
+    for label, pragmas in (('defaults', 'false'), ('tuned', 'true')):
+        results = run_mode(template, pragmas, args)
+        reads = [sample for result in results for sample in result['latencies']['read']]
+        writes = [sample for result in results for sample in result['latencies']['write']]
+        print(f'{label:<10} {len(reads) / args.seconds:>8.1f} {len(writes) / args.seconds:>9.1f} ' +
+              ' '.join(f'{percentile(samples, fraction) * 1000:>{width - 2}.1f}ms'
+                       for samples, width in ((reads, 9), (writes, 10)) for fraction in (0.5, 0.95, 0.99)) +
+              f' {sum(result["errors"] for result in results):>7} {sum(result["locked"] for result in results):>7}')
+
+
+if __name__ == '__main__':
+    main()
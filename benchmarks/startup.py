@@ -0,0 +1,96 @@
+"""
+
+Worker startup benchmark. Prepares a throwaway database with the migrations and seed data, then starts a number of
+fresh Python processes that each import the application the way a worker does and serve one request. Reports how long
+the import and first request took, and fails if any process ran a schema (DDL) statement or wrote to the database
+while starting, which workers must never do now that migrations and seeding are run from the CLI.
+
+    python benchmarks/startup.py --workers 10
+
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DDL = ('CREATE', 'DROP', 'ALTER')
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def boot():
+    """Runs in the child process, importing the app and serving one request while counting statements"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    statements = {'ddl': [], 'writes': []}
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in DDL:
+            statements['ddl'].append(statement)
+        elif verb in WRITES:
+            statements['writes'].append(statement)
+
+    started = time.perf_counter()
+    from app import app
+    imported = time.perf_counter()
+    app.test_client().get('/knowledgeBase')
+    served = time.perf_counter()
+
+    print(json.dumps({'import': imported - started, 'first_request': served - imported, **statements}))
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=10, help='number of worker processes to start, one at a time')
+    parser.add_argument('--boot', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.boot:
+        boot()
+        return
+
+    databaseFile = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    environment = {**os.environ, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{databaseFile}'}
+    for command in (['upgrade-db'], ['seed-db', '--with-test-users']):
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', *command], cwd=ROOT, env=environment,
+                       check=True, capture_output=True)
+
+    results = []
+    for _ in range(args.workers):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--boot'], cwd=ROOT, env=environment,
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process'] = time.perf_counter() - started
+        results.append(result)
+
+    for name in ('process', 'import', 'first_request'):
+        samples = [result[name] for result in results]
+        print(f'{name + ":":15} p50 {percentile(samples, 0.50) * 1000:7.1f} ms   '
+              f'p99 {percentile(samples, 0.99) * 1000:7.1f} ms')
+
+    ddl = [statement for result in results for statement in result['ddl']]
+    writes = [statement for result in results for statement in result['writes']]
+    print(f'DDL statements:   {len(ddl)}')
+    print(f'write statements: {len(writes)}')
+    for statement in (ddl + writes)[:10]:
+        print('   ', ' '.join(statement.split())[:100])
+    if ddl or writes:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
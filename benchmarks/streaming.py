@@ -0,0 +1,98 @@
+"""
+
+Streamed rendering benchmark. Creates a throwaway database with one user whose feed holds a large number of posts,
+sets FEED_PAGE_SIZE so the whole feed is one page, then fetches the home page once rendered in full before sending
+(STREAM_PAGES=false) and once streamed, each in a fresh process. Reports the time to the first byte, the time to the
+last byte and how much the process's peak RSS grew while serving the page.
+
+    python benchmarks/streaming.py --posts 20000
+
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def populate(posts):
+    from sqlalchemy import insert
+    from app import app, db
+    from migrations import upgrade
+    from models import User, Post
+
+    with app.app_context():
+        upgrade()
+        with db.engine.begin() as connection:
+            connection.execute(insert(User).values(id=1, email='reader@example.com', firstname='Bench',
+                                                   lastname='Reader', password='x', completed_onboarding=True))
+            started = datetime.utcnow()
+            connection.execute(insert(Post), [
+                dict(user_id=1, email='reader@example.com', dateCreated=started - timedelta(minutes=number),
+                     title=f'Reflective account {number}', public=True,
+                     body='Cooked something new today and wrote a few lines about how it went. ' * 4)
+                for number in range(posts)])
+
+
+def serve(posts):
+    """Runs in the child process, fetches the home page and prints its timings as JSON"""
+    from app import app
+
+    app.config.update(TESTING=True, FEED_PAGE_SIZE=posts)
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    client.get('/termsAndConditions')
+
+    before = peak_rss_mb()
+    started = time.perf_counter()
+    response = client.get('/', buffered=False)
+    chunks = iter(response.response)
+    size = len(next(chunks))
+    firstByte = time.perf_counter() - started
+    for chunk in chunks:
+        size += len(chunk)
+    lastByte = time.perf_counter() - started
+    response.close()
+
+    print(json.dumps({'firstByte': firstByte, 'lastByte': lastByte, 'bytes': size,
+                      'peakRss': peak_rss_mb(), 'rssGrowth': peak_rss_mb() - before}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        serve(args.posts)
+        return
+
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+    populate(args.posts)
+
+    print(f'{"mode":<10} {"first byte":>11} {"last byte":>10} {"page":>9} {"peak RSS":>9} {"RSS growth":>11}')
+    for mode, streamPages in (('full', 'false'), ('streamed', 'true')):
+        output = subprocess.run([sys.executable, __file__, '--child', '--posts', str(args.posts)],
+                                env={**os.environ, 'STREAM_PAGES': streamPages}, capture_output=True, text=True,
+                                check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{mode:<10} {result["firstByte"] * 1000:>9.1f}ms {result["lastByte"] * 1000:>8.1f}ms '
+              f'{result["bytes"] / 1024:>7.0f}kB {result["peakRss"]:>7.1f}MB {result["rssGrowth"]:>9.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from flask import request, g
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+"""
+
+SQL statement budgets for each page. A view declares with query_budget how many statements a request to it may run,
+counting everything run while its template renders or streams, and the number should not depend on how much data the
+page shows: a page that lists rows loads them, and anything the template shows about them, with a fixed number of
+queries. Every request to a view with a budget is counted, and one that goes over is logged as a warning.
+
+benchmarks/query_budgets.py fetches every page, and sends every form, on a small and a much larger seeded database and
+fails if a request goes over its view's budget or runs more statements as the data grows.
+
+"""
+
+_local = threading.local()
+
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+def _counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = []
+    return _local.counters
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(connection, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_statements():
+    """Counts the SQL statements this thread runs inside the block"""
+    counter = StatementCounter()
+    _counters().append(counter)
+    try:
+        yield counter
+    finally:
+        _counters().remove(counter)
+
+
+def query_budget(limit):
+    """Declares how many SQL statements a request to the view may run. Goes directly above the def, other decorators
+    copy it onto their wrappers"""
+
+    def decorator(view):
+        view.query_budget = limit
+        return view
+
+    return decorator
+
+
+def budget_for(endpoint):
+    return getattr(app.view_functions.get(endpoint), 'query_budget', None)
+
+
+def endpoint_for(url, method='GET'):
+    """Returns the endpoint that would handle a request for the URL"""
+    endpoint, _ = app.url_map.bind('localhost').match(urlsplit(url).path, method=method)
+    return endpoint
+
+
+@app.before_request
+def _start_counting():
+    if budget_for(request.endpoint) is not None:
+        g.statementCounter = StatementCounter()
+        _counters().append(g.statementCounter)
+
+
+@app.teardown_request
+def _check_budget(error):
+    # teardown waits for a streamed response to finish, so this includes the statements run while it rendered
+    counter = g.pop('statementCounter', None)
+    if counter is None:
+        return
+
+    if counter in _counters():
+        _counters().remove(counter)
+    budget = budget_for(request.endpoint)
+    if counter.count > budget:
+        logging.warning('QUERY BUDGET - %s ran %s SQL statements, over its budget of %s', request.endpoint,
+                        counter.count, budget)
@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from types import MappingProxyType
+from sqlalchemy import select, update, insert, type_coerce, Text
+from app import app, db
+from models import Meal, Quiz, Question, Ingredient, CatalogVersion
+
+"""
+
+Read-through, in-process cache of the meal and quiz catalog. The catalog is loaded into immutable snapshots that views
+can share between requests and threads without touching the database. Each snapshot is tagged with the catalog
+version from the database, which is bumped automatically in the same transaction as any change to a meal, quiz or
+question, so every worker process reloads its snapshot once content is edited. Only one thread loads a new snapshot at
+a time, other threads wait for it rather than all querying the database at once.
+
+"""
+
+MealSnapshot = namedtuple('MealSnapshot', [c.key for c in Meal.__table__.columns])
+QuizSnapshot = namedtuple('QuizSnapshot', [c.key for c in Quiz.__table__.columns])
+QuestionSnapshot = namedtuple('QuestionSnapshot', [c.key for c in Question.__table__.columns])
+
+Catalog = namedtuple('Catalog', ['version', 'updated', 'meals', 'mealsByID', 'quizzes', 'quizzesByID',
+                                 'questionsByQuiz', 'answerKeys'])
+
+_CATALOG_MODELS = (Meal, Quiz, Question, Ingredient)
+
+_snapshot = None
+_checkedVersion = None
+_checkedAt = 0.0
+_loadLock = threading.Lock()
+
+
+def _freeze(snapshotType, row):
+    values = [getattr(row, field) for field in snapshotType._fields]
+    return snapshotType(*[tuple(value) if isinstance(value, list) else value for value in values])
+
+
+def _decode_options(rawOptions):
+    # one json.loads call for every question in the quiz, rather than one per question
+    return json.loads('[' + ','.join(raw or 'null' for raw in rawOptions) + ']')
+
+
+def load_questions(quizID=None):
+    """Returns {quizID: [QuestionSnapshot, ...]} in question order, for one quiz or all of them. The options are read
+    as raw JSON text and decoded in one batch per quiz"""
+    columns = [type_coerce(column, Text) if column.key == 'otherOptions' else column
+               for column in Question.__table__.columns]
+    query = select(*columns).order_by(Question.quizID, Question.questionID)
+    if quizID is not None:
+        query = query.where(Question.quizID == quizID)
+
+    rowsByQuiz = {}
+    for row in db.session.execute(query):
+        rowsByQuiz.setdefault(row.quizID, []).append(row)
+
+    questionsByQuiz = {}
+    for rowsQuizID, rows in rowsByQuiz.items():
+        options = _decode_options(row.otherOptions for row in rows)
+        questionsByQuiz[rowsQuizID] = [
+            QuestionSnapshot(**{**row._mapping, 'otherOptions': tuple(rowOptions or ())})
+            for row, rowOptions in zip(rows, options)
+        ]
+    return questionsByQuiz
+
+
+def _load_catalog(version, updated):
+    meals = tuple(_freeze(MealSnapshot, meal) for meal in
+                  db.session.execute(select(Meal).order_by(Meal.mealDifficulty, Meal.mealID)).scalars())
+    quizzes = tuple(_freeze(QuizSnapshot, quiz) for quiz in
+                    db.session.execute(select(Quiz).order_by(Quiz.order, Quiz.quizID)).scalars())
+
+    questionsByQuiz = {quiz.quizID: [] for quiz in quizzes}
+    questionsByQuiz.update(load_questions())
+
+    return Catalog(
+        version=version,
+        updated=updated,
+        meals=meals,
+        mealsByID=MappingProxyType({meal.mealID: meal for meal in meals}),
+        quizzes=quizzes,
+        quizzesByID=MappingProxyType({quiz.quizID: quiz for quiz in quizzes}),
+        questionsByQuiz=MappingProxyType({quizID: tuple(questions) for quizID, questions in questionsByQuiz.items()}),
+        answerKeys=MappingProxyType({
+            quizID: MappingProxyType({question.questionID: question.correctAnswer for question in questions})
+            for quizID, questions in questionsByQuiz.items()
+        })
+    )
+
+
+def catalog_version():
+    """Returns the (version, updated) pair from the database, checking at most once every
+    CATALOG_VERSION_CHECK_INTERVAL seconds per process"""
+    global _checkedVersion, _checkedAt
+
+    now = time.monotonic()
+    if _checkedVersion is None or now - _checkedAt >= app.config['CATALOG_VERSION_CHECK_INTERVAL']:
+        row = db.session.execute(select(CatalogVersion.version, CatalogVersion.updated)).first()
+        _checkedVersion = tuple(row) if row else (0, None)
+        _checkedAt = now
+    return _checkedVersion
+
+
+def known_catalog_version():
+    """Returns the catalog version this process last saw, without asking the database"""
+    return _checkedVersion
+
+
+def get_catalog():
+    """Returns the current catalog snapshot, loading a new one if the catalog has changed since the last load"""
+    global _snapshot
+
+    version, updated = catalog_version()
+    snapshot = _snapshot
+    if snapshot and snapshot.version >= version:
+        return snapshot
+
+    with _loadLock:
+        snapshot = _snapshot
+        if not snapshot or snapshot.version < version:
+            snapshot = _snapshot = _load_catalog(version, updated)
+    return snapshot
+
+
+def get_meal(meal_id):
+    return get_catalog().mealsByID.get(meal_id)
+
+
+def get_quiz(quizID):
+    return get_catalog().quizzesByID.get(quizID)
+
+
+def get_questions(quizID):
+    return get_catalog().questionsByQuiz.get(quizID, ())
+
+
+def get_answer_key(quizID):
+    """Returns a read only mapping of question ID to correct answer for the quiz, in question order"""
+    return get_catalog().answerKeys.get(quizID, MappingProxyType({}))
+
+
+def safe_meals(mask):
+    """Returns the meals, in progression order, that contain none of the allergens in the mask. The check is a single
+    bitwise WHERE clause run by the database rather than a scan over the whole catalog in Python"""
+    if not mask:
+        return get_catalog().meals
+
+    meals = db.session.execute(
+        select(Meal).where(Meal.allergen_mask.op('&')(mask) == 0).order_by(Meal.mealDifficulty, Meal.mealID)
+    ).scalars()
+    return tuple(_freeze(MealSnapshot, meal) for meal in meals)
+
+
+def bump_catalog_version(connection):
+    """Increments the catalog version, creating the counter row if this is the first change to the catalog"""
+    global _checkedVersion
+
+    now = datetime.utcnow()
+    result = connection.execute(update(CatalogVersion).values(version=CatalogVersion.version + 1, updated=now))
+    if result.rowcount == 0:
+        connection.execute(insert(CatalogVersion).values(id=1, version=1, updated=now))
+
+    # make sure this process looks at the database again on its next read
+    _checkedVersion = None
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _bump_on_catalog_change(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    if any(isinstance(instance, _CATALOG_MODELS) for instance in changed):
+        bump_catalog_version(session.connection())
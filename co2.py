@@ -0,0 +1,132 @@
+from datetime import date, datetime, timedelta
+import click
+from sqlalchemy import select, update, insert, delete, func, or_, and_, union_all, literal
+from app import app, db
+from sqlalchemy.orm import aliased
+from models import Co2Daily, UserCo2Daily, LedgerEntry, UserMeal, Meal
+
+"""
+
+Daily rollups of meals completed and CO2, both across every user and per user. Each award that changes a user's meal
+count or CO2 totals also adds to that day's row in both rollup tables, in the same transaction, so any date range can
+be answered by reading one row per day (or one per user per day for a group of friends) instead of joining every
+completed meal to its meal. The rollups can be rebuilt with "flask --app app rebuild-co2-rollups", from the ledger and,
+for meals completed before the ledger existed, from user_meals, as the ledger only has one opening balance for those.
+
+"""
+
+MAX_RANGE_DAYS = 366
+
+
+def _add(model, key, meals, meatCo2, veganCo2):
+    # the caller has already written to users in this transaction, so no other writer can insert the same row between
+    # the UPDATE finding nothing and the INSERT
+    conditions = [getattr(model, column) == value for column, value in key.items()]
+    result = db.session.execute(
+        update(model).where(*conditions)
+        .values(meals=model.meals + meals, meatCo2=model.meatCo2 + meatCo2, veganCo2=model.veganCo2 + veganCo2)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.session.execute(insert(model).values(**key, meals=meals, meatCo2=meatCo2, veganCo2=veganCo2))
+
+
+def utc_today():
+    """The day the rollups file today's completions under. Days are UTC, like the ledger's timestamps, so the server's
+    own time zone never moves a completion into a different day"""
+    return datetime.utcnow().date()
+
+
+def record_co2(user_id, day, meals=0, meatCo2=0.0, veganCo2=0.0):
+    """Adds a completion's meals and CO2 to the (UTC) day's global and per user rollups. The caller commits"""
+    _add(Co2Daily, {'day': day}, meals, meatCo2, veganCo2)
+    _add(UserCo2Daily, {'user_id': user_id, 'day': day}, meals, meatCo2, veganCo2)
+
+
+def series_query(start, end, user_ids=None):
+    if user_ids is None:
+        return (select(Co2Daily.day, Co2Daily.meals, Co2Daily.meatCo2, Co2Daily.veganCo2)
+                .where(Co2Daily.day.between(start, end))
+                .order_by(Co2Daily.day))
+
+    return (select(UserCo2Daily.day, func.sum(UserCo2Daily.meals), func.sum(UserCo2Daily.meatCo2),
+                   func.sum(UserCo2Daily.veganCo2))
+            .where(UserCo2Daily.user_id.in_(user_ids), UserCo2Daily.day.between(start, end))
+            .group_by(UserCo2Daily.day)
+            .order_by(UserCo2Daily.day))
+
+
+def co2_series(start, end, user_ids=None):
+    """Returns one dict per day from start to end inclusive, for everyone or only the given users. Days without any
+    completions are included with zeros"""
+    rows = {row[0]: row for row in db.session.execute(series_query(start, end, user_ids))}
+
+    series = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        _, meals, meatCo2, veganCo2 = rows.get(day, (day, 0, 0.0, 0.0))
+        series.append({'day': day.isoformat(), 'meals': meals, 'meatCo2': round(meatCo2, 3),
+                       'veganCo2': round(veganCo2, 3), 'co2Saved': round(meatCo2 - veganCo2, 3)})
+    return series
+
+
+def co2_totals(series):
+    meatCo2 = sum(day['meatCo2'] for day in series)
+    veganCo2 = sum(day['veganCo2'] for day in series)
+    return {'meals': sum(day['meals'] for day in series), 'meatCo2': round(meatCo2, 3),
+            'veganCo2': round(veganCo2, 3), 'co2Saved': round(meatCo2 - veganCo2, 3)}
+
+
+def date_range(start, end, days=30):
+    """Parses ISO start and end dates, either of which may be missing, defaulting to the last `days` days. Raises
+    ValueError for dates that cannot be parsed or ranges that are backwards or too long"""
+    end = date.fromisoformat(end) if end else utc_today()
+    start = date.fromisoformat(start) if start else end - timedelta(days=days - 1)
+    if start > end or (end - start).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'The date range must run forwards and cover at most {MAX_RANGE_DAYS} days')
+    return start, end
+
+
+def rebuild_rollups(connection):
+    """Replaces both rollup tables with totals recalculated from the ledger. A user's opening balance is dated when the
+    ledger was added, so the meals it covers are filed under the days they were completed instead"""
+    fromLedger = (select(LedgerEntry.user_id, func.date(LedgerEntry.created).label('day'),
+                         LedgerEntry.meals_completed.label('meals'), LedgerEntry.totalMeatCo2.label('meatCo2'),
+                         LedgerEntry.totalVeganCo2.label('veganCo2'))
+                  .where(LedgerEntry.reason != 'opening_balance',
+                         or_(LedgerEntry.meals_completed != 0, LedgerEntry.totalMeatCo2 != 0,
+                             LedgerEntry.totalVeganCo2 != 0)))
+
+    opening = aliased(LedgerEntry)
+    fromCompletions = (select(UserMeal.user_id,
+                              func.date(func.coalesce(UserMeal.completion_date, opening.created)).label('day'),
+                              literal(1).label('meals'), func.coalesce(Meal.meatCo2, 0).label('meatCo2'),
+                              func.coalesce(Meal.veganCo2, 0).label('veganCo2'))
+                       .join(Meal, Meal.mealID == UserMeal.meal_id)
+                       .join(opening, and_(opening.user_id == UserMeal.user_id, opening.reason == 'opening_balance'))
+                       .where(UserMeal.completed.is_(True),
+                              or_(UserMeal.completion_date.is_(None), UserMeal.completion_date < opening.created)))
+
+    rows = union_all(fromLedger, fromCompletions).subquery()
+    connection.execute(delete(UserCo2Daily))
+    connection.execute(delete(Co2Daily))
+    connection.execute(insert(UserCo2Daily).from_select(
+        ['user_id', 'day', 'meals', 'meatCo2', 'veganCo2'],
+        select(rows.c.user_id, rows.c.day, func.sum(rows.c.meals), func.sum(rows.c.meatCo2),
+               func.sum(rows.c.veganCo2))
+        .group_by(rows.c.user_id, rows.c.day)
+    ))
+    connection.execute(insert(Co2Daily).from_select(
+        ['day', 'meals', 'meatCo2', 'veganCo2'],
+        select(UserCo2Daily.day, func.sum(UserCo2Daily.meals), func.sum(UserCo2Daily.meatCo2),
+               func.sum(UserCo2Daily.veganCo2))
+        .group_by(UserCo2Daily.day)
+    ))
+
+
+@app.cli.command('rebuild-co2-rollups')
+def rebuild_co2_rollups_command():
+    """Recalculates the daily CO2 rollups from the ledger and completed meals."""
+    with db.engine.begin() as connection:
+        rebuild_rollups(connection)
+    click.echo('CO2 rollups rebuilt')
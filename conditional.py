@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from sqlalchemy import select, update
+from sqlalchemy.orm import object_session
+from werkzeug.http import is_resource_modified
+from app import app, db
+from models import User, UserMeal, UserQuiz, QuizAttempt
+from catalog import catalog_version
+from assets import manifest
+
+"""
+
+Conditional GETs for pages that only change when the catalog or the logged in user's own progress does. Each user row
+carries a progress_version, bumped in the same transaction as anything that shows up on their pages: XP and CO2
+awards, completed meals and quizzes, quiz attempts, the progression cursor, the nightly streak update and edits to the
+row itself. A page's strong ETag is a hash of that version, the catalog version, the URL, the templates being served
+and anything else the view says it depends on, so the browser's copy can be checked with one primary key lookup and
+answered with 304 Not Modified before the view runs, without rendering the template or loading any relationships.
+
+Pages with flashed messages waiting to be shown are always rendered in full and never given an ETag. How many GETs of
+each view were answered with a 304 is logged every CONDITIONAL_STATS_LOG_EVERY requests.
+
+"""
+
+_PROGRESS_MODELS = (UserMeal, UserQuiz, QuizAttempt)
+
+_release = None
+_stats = {}
+_checked = 0
+_statsLock = threading.Lock()
+
+
+def progress_values():
+    """Column values for an UPDATE of users that changes something shown on the user's own pages"""
+    return {'progress_version': User.progress_version + 1, 'progress_updated': datetime.utcnow()}
+
+
+@db.event.listens_for(User, 'before_update')
+def _bump_edited_user(mapper, connection, target):
+    if object_session(target).is_modified(target, include_collections=False):
+        target.progress_version = User.progress_version + 1
+        target.progress_updated = datetime.utcnow()
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _bump_on_progress_change(session, flush_context):
+    changed = session.new | session.dirty | session.deleted
+    userIDs = {instance.user_id for instance in changed if isinstance(instance, _PROGRESS_MODELS)}
+    if userIDs:
+        session.connection().execute(update(User).where(User.id.in_(userIDs)).values(**progress_values()))
+
+
+def progress_version(user_id):
+    """Returns the user's (progress_version, progress_updated). Always read from the database, the identity cache can
+    be several seconds out of date"""
+    row = db.session.execute(
+        select(User.progress_version, User.progress_updated).where(User.id == user_id)
+    ).first()
+    return tuple(row) if row else (0, None)
+
+
+def release():
+    """Returns (digest, last modified) for the templates and built assets being served, so changing either changes
+    every ETag. Set ETAG_RELEASE on each deploy to cover changes to the code as well"""
+    global _release
+    if _release is None:
+        digest = hashlib.sha256(app.config['ETAG_RELEASE'].encode())
+        digest.update(repr(sorted(manifest().items())).encode())
+        modified = []
+        for name in sorted(app.jinja_env.list_templates()):
+            source, filename, _ = app.jinja_env.loader.get_source(app.jinja_env, name)
+            digest.update(name.encode() + b'\0' + source.encode())
+            if filename:
+                modified.append(datetime.utcfromtimestamp(os.path.getmtime(filename)))
+        _release = (digest.hexdigest()[:16], max(modified, default=None))
+    return _release
+
+
+def _count(endpoint, outcome):
+    global _checked
+    with _statsLock:
+        _stats.setdefault(endpoint, {'notModified': 0, 'rendered': 0, 'skipped': 0})[outcome] += 1
+        _checked += 1
+        logNow = app.config['CONDITIONAL_STATS_LOG_EVERY'] and _checked % app.config['CONDITIONAL_STATS_LOG_EVERY'] == 0
+    if logNow:
+        logging.info('CONDITIONAL - %s', conditional_stats())
+
+
+def conditional_stats():
+    """Returns, for each view, how many GETs were answered with 304, rendered in full or skipped because of flashed
+    messages, along with the share answered with 304"""
+    with _statsLock:
+        stats = {endpoint: dict(counts) for endpoint, counts in _stats.items()}
+    for counts in stats.values():
+        total = counts['notModified'] + counts['rendered'] + counts['skipped']
+        counts['hitRate'] = round(counts['notModified'] / total, 3) if total else 0.0
+    return stats
+
+
+def reset_conditional_stats():
+    global _checked
+    with _statsLock:
+        _stats.clear()
+        _checked = 0
+
+
+def conditional(extra=None):
+    """Answers GET requests for the view with 304 Not Modified when the browser's copy is still current. extra, if
+    given, returns anything else the page depends on, and is called before the view"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                _count(request.endpoint, 'skipped')
+                return view(*args, **kwargs)
+
+            releaseDigest, releaseModified = release()
+            catalogVersion, catalogUpdated = catalog_version()
+            userID = current_user.id if current_user.is_authenticated else None
+            progressVersion, progressUpdated = progress_version(userID) if userID else (0, None)
+
+            parts = [releaseDigest, request.full_path, userID, catalogVersion, progressVersion]
+            if extra:
+                parts.append(extra())
+            etag = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+            # anything extra has no timestamp, so those pages can only be revalidated by their ETag
+            lastModified = None if extra else max(
+                [moment for moment in (releaseModified, catalogUpdated, progressUpdated) if moment], default=None)
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=lastModified):
+                _count(request.endpoint, 'notModified')
+                response = app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                _count(request.endpoint, 'rendered')
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if lastModified:
+                response.last_modified = lastModified
+            # the page is only for this user, and the browser must check it is still current before showing it
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,69 @@
+import sqlite3
+import click
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from app import app, db
+
+"""
+
+SQLite connection settings. Every new SQLite connection the pool opens is set up with the pragmas below before it is
+used. In WAL mode readers never block the writer and the writer never blocks readers, and a write only syncs the
+log rather than the database file, so with synchronous=NORMAL a commit costs no fsync until the log is checkpointed.
+That is still safe against the application crashing, only a power cut can lose the last few commits. busy_timeout
+makes a connection that finds the database locked by another writer wait for it instead of failing with "database is
+locked", cache_size is the page cache each connection keeps (negative values are in KiB), and mmap_size lets reads
+come straight from the operating system's page cache.
+
+Each setting comes from the SQLITE_ configuration in app.py, and SQLITE_PRAGMAS=false leaves every connection with
+SQLite's own defaults. The engine and pool options are set with the DB_POOL_ variables, see app.py. Run
+"flask --app app sqlite-settings" to print the settings a pooled connection ends up with.
+
+"""
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def pragmas():
+    """Returns (name, value) for each pragma new connections are set up with"""
+    journalMode = app.config['SQLITE_JOURNAL_MODE'].upper()
+    synchronous = app.config['SQLITE_SYNCHRONOUS'].upper()
+    if journalMode not in JOURNAL_MODES:
+        raise ValueError(f'SQLITE_JOURNAL_MODE must be one of {", ".join(JOURNAL_MODES)}')
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f'SQLITE_SYNCHRONOUS must be one of {", ".join(SYNCHRONOUS_MODES)}')
+
+    return [
+        # the journal mode is stored in the database file, so this only changes anything on the first connection
+        ('journal_mode', journalMode),
+        ('synchronous', synchronous),
+        ('busy_timeout', int(app.config['SQLITE_BUSY_TIMEOUT'])),
+        ('cache_size', int(app.config['SQLITE_CACHE_SIZE'])),
+        ('mmap_size', int(app.config['SQLITE_MMAP_SIZE'])),
+    ]
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not app.config['SQLITE_PRAGMAS']:
+        return
+
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+@app.cli.command('sqlite-settings')
+def sqlite_settings_command():
+    """Prints the SQLite settings and pool options connections are using."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo(f'The database is {db.engine.dialect.name}, not SQLite')
+        return
+
+    with db.engine.connect() as connection:
+        for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size'):
+            click.echo(f'{name} = {connection.execute(text(f"PRAGMA {name}")).scalar()}')
+    click.echo(f'pool = {db.engine.pool.status()}')
@@ -0,0 +1,119 @@
+import re
+import sys
+from datetime import datetime, date
+import click
+from sqlalchemy import select
+from app import app, db
+from models import User, Meal, UserMeal, Quiz, UserQuiz, Question, Friendship, QuizAttempt
+from feed import feed_query
+from friends import friend_ids_query
+from search import search_query
+from progression import next_meals_query, completed_from_cursor_query
+from attempts import attempt_history_query
+from leaderboard import top_query, above_query, below_query, changed_users_query, experience_query
+from co2 import series_query
+from batch import rollover_statement
+from shopping import shopping_list_query
+
+"""
+
+Query plan checks for the statements behind each view. Every hot query is run through SQLite's EXPLAIN QUERY PLAN
+against the configured, seeded database, and any query that falls back to a full scan of a table is reported.
+Run with "flask --app app check-query-plans", which exits with a non-zero status if any query fails the check.
+
+"""
+
+# listing the whole catalog is expected to read every row, the top of the leaderboard stops after the first N rows of
+# its index, and rebuilding the rank tree reads every user's XP from the index, so these are allowed to scan as long as
+# they use an index
+CATALOG_LISTINGS = {'mealTree: meals', 'knowledgeBase: quizzes', 'leaderboard: top', 'leaderboard: rebuild'}
+
+_scanPattern = re.compile(r'^SCAN (\w+)(.*)$')
+
+
+def hot_queries(user_id=1, other_id=2, meal_id=1, quizID=1):
+    """Returns (name, statement) pairs for the queries each view runs on every request"""
+    return [
+        ('load_user: users', select(User).where(User.id == user_id)),
+        ('conditional: progress version',
+         select(User.progress_version, User.progress_updated).where(User.id == user_id)),
+        ('login: users', select(User).where(User.email == 'test@emailUser.com')),
+        ('index: friend ids', friend_ids_query(user_id)),
+        ('index: feed', feed_query(user_id, [other_id])),
+        ('index: feed next page', feed_query(user_id, [other_id], (datetime.utcnow(), 1))),
+        ('index: sent requests', select(Friendship).filter_by(requester_id=user_id, status='pending')),
+        ('index: received requests', select(Friendship).filter_by(requested_id=user_id, status='pending')),
+        ('index: friendships', select(Friendship).where(
+            ((Friendship.user_low_id == user_id) | (Friendship.user_high_id == user_id)) &
+            (Friendship.status == 'accepted'))),
+        ('search_users: users', search_query('jan', user_id)),
+        ('send_friend_request: pair', select(Friendship).filter_by(user_low_id=user_id, user_high_id=other_id)),
+        ('accept_friend_request: friendship', select(Friendship).where(Friendship.id == 1)),
+        ('mealTree: meals', select(Meal).order_by(Meal.mealDifficulty)),
+        ('mealTree: next meal', next_meals_query(user_id, (1, 1))),
+        ('mealTree: completed from cursor', completed_from_cursor_query(user_id, (1, 1))),
+        ('shopping_list: next safe meals', next_meals_query(user_id, (1, 1), 2, allergen_mask=3)),
+        ('shopping_list: ingredients', shopping_list_query([meal_id, meal_id + 1])),
+        ('meal_detail: meal', select(Meal).where(Meal.mealID == meal_id)),
+        ('meal_detail: user meal', select(UserMeal).filter_by(user_id=user_id, meal_id=meal_id)),
+        ('knowledgeBase: quizzes', select(Quiz).order_by(Quiz.order)),
+        ('knowledgeBase: completed quizzes', select(UserQuiz).filter_by(user_id=user_id, completed=True)),
+        ('quiz_detail: quiz', select(Quiz).where(Quiz.quizID == quizID)),
+        ('quiz_detail: questions', select(Question).filter_by(quizID=quizID)),
+        ('quiz_detail: attempts', attempt_history_query(user_id, quizID)),
+        ('complete_quiz: user quiz', select(UserQuiz).filter_by(user_id=user_id, quizID=quizID)),
+        ('reviewQuiz: attempt', select(QuizAttempt).where(QuizAttempt.id == 1)),
+        ('leaderboard: new ledger entries', changed_users_query(1)),
+        ('leaderboard: rebuild', experience_query()),
+        ('leaderboard: top', top_query(10)),
+        ('leaderboard: above me', above_query(10, user_id, 5)),
+        ('leaderboard: below me', below_query(10, user_id, 5)),
+        ('co2: everyone', series_query(date(2024, 1, 1), date(2024, 1, 31))),
+        ('daily_rollover: chunk', rollover_statement(date(2024, 1, 1), 0, 10000)),
+        ('co2: friends', series_query(date(2024, 1, 1), date(2024, 1, 31), [user_id, other_id])),
+    ]
+
+
+def explain(statement):
+    """Returns the detail column of SQLite's EXPLAIN QUERY PLAN output for a statement"""
+    compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).all()
+    return [row[3] for row in rows]
+
+
+def full_table_scans(name, plan):
+    """Returns the plan lines that read a whole table without the help of an index"""
+    scans = []
+    for line in plan:
+        match = _scanPattern.match(line)
+        if not match or match.group(1) not in db.metadata.tables:
+            continue
+        if name in CATALOG_LISTINGS and 'USING' in match.group(2):
+            continue
+        scans.append(line)
+    return scans
+
+
+def check_query_plans():
+    """Explains every hot query and returns a dict of query name to the full table scans found in its plan"""
+    failures = {}
+    for name, statement in hot_queries():
+        scans = full_table_scans(name, explain(statement))
+        if scans:
+            failures[name] = scans
+    return failures
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fails if any view query falls back to a full table scan."""
+    failures = check_query_plans()
+
+    for name, scans in failures.items():
+        click.echo(f'FULL SCAN  {name}: {"; ".join(scans)}')
+
+    if failures:
+        sys.exit(1)
+    click.echo('All query plans use an index')
@@ -0,0 +1,69 @@
+import base64
+from datetime import datetime
+from sqlalchemy import select, union_all, and_, or_
+from sqlalchemy.orm import joinedload
+from app import app
+from models import Post
+from friends import get_friend_ids
+from streaming import PageStream
+
+
+def encode_cursor(post):
+    """Turns the position of the last post on a page into an opaque token that can be handed back to the client"""
+    raw = f'{post.dateCreated.isoformat()}|{post.id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Reverses encode_cursor, returning None for anything that is missing or has been tampered with"""
+    if not cursor:
+        return None
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        dateCreated, postID = raw.split('|')
+        return datetime.fromisoformat(dateCreated), int(postID)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _before_cursor(dateColumn, idColumn, position):
+    """Keyset predicate that only matches rows strictly older than the (dateCreated, id) position"""
+    dateCreated, postID = position
+    return or_(dateColumn < dateCreated, and_(dateColumn == dateCreated, idColumn < postID))
+
+
+def feed_query(user_id, friend_ids, position=None, page_size=20):
+    """Builds the single statement behind a feed page, fetching one extra row so the caller can tell whether another
+    page follows. Both halves of the feed are combined with UNION ALL and ordered newest first by (dateCreated, id), and
+    the cursor position is applied inside each half so the cost of a page does not depend on how long the user's
+    history is.
+    """
+    ownPosts = select(Post.id, Post.dateCreated).where(Post.user_id == user_id)
+    friendPosts = select(Post.id, Post.dateCreated).where(Post.user_id.in_(list(friend_ids)), Post.public == True)
+
+    if position:
+        ownPosts = ownPosts.where(_before_cursor(Post.dateCreated, Post.id, position))
+        friendPosts = friendPosts.where(_before_cursor(Post.dateCreated, Post.id, position))
+
+    ordering = (Post.dateCreated.desc(), Post.id.desc())
+    ownPage = ownPosts.order_by(*ordering).limit(page_size + 1).subquery()
+    friendPage = friendPosts.order_by(*ordering).limit(page_size + 1).subquery()
+    feed = union_all(select(ownPage.c.id, ownPage.c.dateCreated),
+                     select(friendPage.c.id, friendPage.c.dateCreated)).subquery()
+
+    return (select(Post).join(feed, Post.id == feed.c.id)
+            .order_by(feed.c.dateCreated.desc(), feed.c.id.desc())
+            .limit(page_size + 1))
+
+
+def feed_page(user_id, cursor=None, page_size=None):
+    """Returns a single page of the home feed, made up of the user's own posts and the public posts of their friends,
+    as a PageStream that reads the posts as they are rendered. Its next_cursor is the cursor for the next page, or None
+    once the feed is exhausted.
+    """
+    page_size = page_size or app.config['FEED_PAGE_SIZE']
+    # the feed shows each post's author, load them in the same query rather than one at a time as the page renders
+    statement = (feed_query(user_id, get_friend_ids(user_id), decode_cursor(cursor), page_size)
+                 .options(joinedload(Post.user)))
+    return PageStream(statement, page_size, encode_cursor)
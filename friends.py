@@ -0,0 +1,65 @@
+import threading
+import time
+from sqlalchemy import select, union_all
+from app import app, db
+from models import Friendship
+
+"""
+
+Per-process cache of each user's accepted friends, so that "who are my friends" is a dictionary lookup rather than a
+query over the friendships table on every page view. Entries are updated in place when this process accepts or
+declines a request, and expire after FRIEND_CACHE_TTL seconds so that changes made by other worker processes are
+picked up as well.
+
+"""
+
+_friendIDs = {}
+_lock = threading.Lock()
+
+
+def friend_ids_query(user_id):
+    return union_all(
+        select(Friendship.user_high_id).where(Friendship.user_low_id == user_id, Friendship.status == 'accepted'),
+        select(Friendship.user_low_id).where(Friendship.user_high_id == user_id, Friendship.status == 'accepted')
+    )
+
+
+def _load_friend_ids(user_id):
+    return frozenset(db.session.execute(friend_ids_query(user_id)).scalars())
+
+
+def get_friend_ids(user_id):
+    """Returns the IDs of everyone the user is friends with as a frozenset, loading it from the database on a miss"""
+    entry = _friendIDs.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+
+    friendIDs = _load_friend_ids(user_id)
+    with _lock:
+        _friendIDs[user_id] = (time.monotonic() + app.config['FRIEND_CACHE_TTL'], friendIDs)
+    return friendIDs
+
+
+def _update(user_id, friend_id, adding):
+    with _lock:
+        entry = _friendIDs.get(user_id)
+        if entry:
+            friendIDs = entry[1] | {friend_id} if adding else entry[1] - {friend_id}
+            _friendIDs[user_id] = (entry[0], friendIDs)
+
+
+def friendship_accepted(friendship):
+    """Adds a newly accepted friendship to both users' cached friend sets"""
+    _update(friendship.user_low_id, friendship.user_high_id, True)
+    _update(friendship.user_high_id, friendship.user_low_id, True)
+
+
+def friendship_declined(friendship):
+    """Removes a declined friendship from both users' cached friend sets"""
+    _update(friendship.user_low_id, friendship.user_high_id, False)
+    _update(friendship.user_high_id, friendship.user_low_id, False)
+
+
+def clear_friend_cache():
+    with _lock:
+        _friendIDs.clear()
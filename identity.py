@@ -0,0 +1,101 @@
+import threading
+import time
+from flask_login import UserMixin
+from sqlalchemy import select
+from sqlalchemy.orm import object_session
+from app import app, db
+from models import User
+from catalog import known_catalog_version
+
+"""
+
+Lightweight stand-in for the logged in user that Flask-Login hands out as current_user. It only holds the handful of
+columns almost every page needs, which are cached per process for USER_CACHE_TTL seconds so most requests do not touch
+the users table at all. Anything else, such as XP, CO2 totals or allergies, is loaded from the full User row the first
+time it is read or written during a request, and writes go straight through to that row. Cached entries are dropped
+whenever the user's row is updated or deleted through the ORM, and are not used once this process has seen the catalog
+version change, as a new meal can move the progression cursors cached with them, see progression.py.
+
+"""
+
+IDENTITY_COLUMNS = ('id', 'email', 'firstname', 'lastname', 'role', 'completed_onboarding', 'progressDifficulty',
+                    'progressMealID')
+
+_identities = {}
+_lock = threading.Lock()
+
+
+class UserIdentity(UserMixin):
+    """The cached identity columns of a user, with lazy access to the rest of their row"""
+
+    def __init__(self, values):
+        self.__dict__['_values'] = values
+        self.__dict__['_row'] = None
+
+    def __getattr__(self, name):
+        values = self.__dict__['_values']
+        if name in values:
+            return values[name]
+        return getattr(self.row, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.row, name, value)
+        if name in self.__dict__['_values']:
+            self.__dict__['_values'] = {**self.__dict__['_values'], name: value}
+
+    @property
+    def row(self):
+        """The full User row, loaded once per request on first use"""
+        if self.__dict__['_row'] is None:
+            self.__dict__['_row'] = db.session.get(User, self.__dict__['_values']['id'])
+        return self.__dict__['_row']
+
+    def __repr__(self):
+        return f'<UserIdentity {self.id}>'
+
+
+def load_identity(user_id):
+    """Returns a UserIdentity for the user, from the cache if a fresh entry exists, or None if there is no such user"""
+    entry = _identities.get(user_id)
+    if entry and entry[0] > time.monotonic() and entry[2] == known_catalog_version():
+        return UserIdentity(entry[1])
+
+    row = db.session.execute(
+        select(*[getattr(User, column) for column in IDENTITY_COLUMNS]).where(User.id == user_id)
+    ).first()
+    if row is None:
+        return None
+
+    values = dict(zip(IDENTITY_COLUMNS, row))
+    with _lock:
+        _identities[user_id] = (time.monotonic() + app.config['USER_CACHE_TTL'], values, known_catalog_version())
+    return UserIdentity(values)
+
+
+def evict_identity(user_id):
+    with _lock:
+        _identities.pop(user_id, None)
+
+
+def clear_identities():
+    with _lock:
+        _identities.clear()
+
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def _evict_written_user(mapper, connection, target):
+    evict_identity(target.id)
+    # evict again once the transaction commits, in case another request cached the old row in the meantime
+    object_session(target).info.setdefault('written_user_ids', set()).add(target.id)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _evict_committed_users(session):
+    for user_id in session.info.pop('written_user_ids', ()):
+        evict_identity(user_id)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _forget_rolled_back_users(session):
+    session.info.pop('written_user_ids', None)
@@ -0,0 +1,273 @@
+import logging
+import threading
+import time
+from flask import g
+from sqlalchemy import select, func, or_
+from app import app, db
+from models import User, LedgerEntry
+from friends import get_friend_ids
+
+"""
+
+XP leaderboards. Each process keeps a Fenwick (binary indexed) tree counting how many users have each XP total, so a
+user's rank is one O(log n) lookup rather than a COUNT over the users table. The tree is built from the users' XP
+totals, read through ix_users_experience without touching the table, starting from the newest ledger entry at the
+time. It is then kept up to date from the ledger: every read first finds the users with ledger entries written since
+the last one it saw, which an index range on the entry ID makes cheap, and sets their XP from their users row, so
+awards made by any worker show up on the next read and applying an entry twice does no harm.
+
+It is rebuilt every LEADERBOARD_REBUILD_INTERVAL seconds to pick up anything the ledger does not record, such as
+deleted users. The rebuild runs in a background thread while requests keep using the old tree, and the new one is
+swapped in when it is ready, so only a worker's first request waits for a build. The top N and the users either side
+of a given user are also read through ix_users_experience.
+
+"""
+
+
+class Fenwick:
+    """Counts of users per XP total, supporting point updates and prefix sums in O(log n)"""
+
+    def __init__(self, size=1024):
+        self.tree = [0] * (size + 1)
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Builds the tree from a dict of value to count in O(n), rather than adding the values one at a time"""
+        fenwick = cls(max([1024] + [value + 1 for value in counts]))
+        tree = fenwick.tree
+        for value, count in counts.items():
+            tree[value + 1] += count
+        for position in range(1, len(tree)):
+            parent = position + (position & -position)
+            if parent < len(tree):
+                tree[parent] += tree[position]
+        return fenwick
+
+    def _grow(self, size):
+        counts = [self.count_between(value, value) for value in range(len(self.tree) - 1)]
+        self.tree = [0] * (size + 1)
+        for value, count in enumerate(counts):
+            if count:
+                self.add(value, count)
+
+    def add(self, value, count=1):
+        if value >= len(self.tree) - 1:
+            self._grow(max(value + 1, 2 * (len(self.tree) - 1)))
+        position = value + 1
+        while position < len(self.tree):
+            self.tree[position] += count
+            position += position & -position
+
+    def count_at_most(self, value):
+        position = min(value + 1, len(self.tree) - 1)
+        total = 0
+        while position > 0:
+            total += self.tree[position]
+            position -= position & -position
+        return total
+
+    def count_between(self, low, high):
+        return self.count_at_most(high) - (self.count_at_most(low - 1) if low > 0 else 0)
+
+
+class Rankings:
+    """The rank tree for every user, along with how far through the ledger and users table it has read"""
+
+    def __init__(self):
+        self.tree = Fenwick()
+        self.experience = {}
+        self.lastEntryID = 0
+        self.lastUserID = 0
+        self.builtAt = time.monotonic()
+
+    def set(self, user_id, experiencePoints):
+        previous = self.experience.get(user_id)
+        if previous is not None:
+            self.tree.add(previous, -1)
+        self.experience[user_id] = max(experiencePoints, 0)
+        self.tree.add(self.experience[user_id])
+
+    def rank(self, experiencePoints):
+        """Competition rank: one more than the number of users with more XP"""
+        return len(self.experience) - self.tree.count_at_most(experiencePoints) + 1
+
+    def apply_ledger(self):
+        for user_id, experiencePoints, entryID in db.session.execute(changed_users_query(self.lastEntryID)):
+            if self.experience.get(user_id) != max(experiencePoints or 0, 0):
+                self.set(user_id, experiencePoints or 0)
+            self.lastEntryID = max(self.lastEntryID, entryID)
+
+    def apply_new_users(self):
+        newUsers = db.session.execute(
+            select(User.id, User.experiencePoints).where(User.id > self.lastUserID)
+        )
+        for user_id, experiencePoints in newUsers:
+            if user_id not in self.experience:
+                self.set(user_id, experiencePoints or 0)
+            self.lastUserID = max(self.lastUserID, user_id)
+
+
+def changed_users_query(lastEntryID):
+    """The XP of the user behind each ledger entry after lastEntryID, with the entry's ID, read in one statement so the
+    XP includes every entry up to that ID. A user with several new entries comes back once for each, grouping them
+    would stop the database ranging over the entry IDs"""
+    return (select(User.id, User.experiencePoints, LedgerEntry.id)
+            .join(LedgerEntry, LedgerEntry.user_id == User.id)
+            .where(LedgerEntry.id > lastEntryID))
+
+
+def experience_query():
+    # both columns are in ix_users_experience, so this reads the index rather than the table
+    return select(User.id, User.experiencePoints).order_by(User.experiencePoints.desc(), User.id)
+
+
+def build_rankings():
+    """Builds a new rank tree from every user's XP"""
+    rankings = Rankings()
+    # read before the users, so any award made while they are read is applied again on the next read, never missed
+    rankings.lastEntryID = db.session.execute(select(func.coalesce(func.max(LedgerEntry.id), 0))).scalar()
+
+    counts = {}
+    for user_id, experiencePoints in db.session.execute(experience_query()):
+        experiencePoints = max(experiencePoints or 0, 0)
+        rankings.experience[user_id] = experiencePoints
+        counts[experiencePoints] = counts.get(experiencePoints, 0) + 1
+    rankings.tree = Fenwick.from_counts(counts)
+    rankings.lastUserID = max(rankings.experience, default=0)
+    return rankings
+
+
+_rankings = None
+_lock = threading.Lock()
+_buildLock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild():
+    global _rankings, _rebuilding
+    try:
+        with app.app_context():
+            rankings = build_rankings()
+        with _lock:
+            _rankings = rankings
+    except Exception:
+        logging.exception('LEADERBOARD - rebuilding the rank tree failed')
+    finally:
+        _rebuilding = False
+
+
+def _start_rebuild():
+    global _rebuilding
+    with _lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild, name='leaderboard-rebuild', daemon=True).start()
+
+
+def get_rankings():
+    """Returns this process's rank tree, brought up to date with the ledger once per request"""
+    global _rankings
+
+    rankings = _rankings
+    if rankings is None:
+        # nothing to serve yet, so the first request builds the tree, and any arriving meanwhile wait for it
+        with _buildLock:
+            if _rankings is None:
+                rankings = build_rankings()
+                with _lock:
+                    _rankings = rankings
+                g.rankingsSynced = True
+        rankings = _rankings
+    elif time.monotonic() - rankings.builtAt >= app.config['LEADERBOARD_REBUILD_INTERVAL']:
+        _start_rebuild()
+
+    if g.get('rankingsSynced'):
+        return rankings
+
+    with _lock:
+        # the newest tree, unless clear_rankings has just thrown it away
+        rankings = _rankings or rankings
+        rankings.apply_ledger()
+        rankings.apply_new_users()
+        g.rankingsSynced = True
+        return rankings
+
+
+def rank_of(user_id):
+    """Returns (rank, XP) for the user"""
+    rankings = get_rankings()
+    experiencePoints = rankings.experience.get(user_id, 0)
+    return rankings.rank(experiencePoints), experiencePoints
+
+
+def _entries(rankings, users):
+    return [(rankings.rank(user.experiencePoints or 0), user) for user in users]
+
+
+_leaderboardColumns = (User.id, User.firstname, User.lastname, User.experiencePoints)
+
+
+def top_query(limit):
+    return select(*_leaderboardColumns).order_by(User.experiencePoints.desc(), User.id).limit(limit)
+
+
+def above_query(experiencePoints, user_id, limit):
+    # the leading range on experiencePoints on its own lets the database seek into ix_users_experience
+    return (select(*_leaderboardColumns)
+            .where(User.experiencePoints >= experiencePoints,
+                   or_(User.experiencePoints > experiencePoints, User.id < user_id))
+            .order_by(User.experiencePoints, User.id.desc())
+            .limit(limit))
+
+
+def below_query(experiencePoints, user_id, limit):
+    return (select(*_leaderboardColumns)
+            .where(User.experiencePoints <= experiencePoints,
+                   or_(User.experiencePoints < experiencePoints, User.id > user_id))
+            .order_by(User.experiencePoints.desc(), User.id)
+            .limit(limit))
+
+
+def top(limit=None):
+    """Returns (rank, user) for the users with the most XP"""
+    rankings = get_rankings()
+    users = db.session.execute(top_query(limit or app.config['LEADERBOARD_SIZE'])).all()
+    return _entries(rankings, users)
+
+
+def around(user_id, window=None):
+    """Returns (rank, user) for the user and up to window users either side of them"""
+    window = window or app.config['LEADERBOARD_WINDOW']
+    rankings = get_rankings()
+    me = db.session.execute(select(*_leaderboardColumns).where(User.id == user_id)).first()
+    if me is None:
+        return []
+
+    experiencePoints = me.experiencePoints or 0
+    above = db.session.execute(above_query(experiencePoints, user_id, window)).all()
+    below = db.session.execute(below_query(experiencePoints, user_id, window)).all()
+    return _entries(rankings, list(reversed(above)) + [me] + below)
+
+
+def friends(user_id):
+    """Returns (rank among friends, user) for the user and their friends"""
+    users = db.session.execute(
+        select(*_leaderboardColumns)
+        .where(User.id.in_(get_friend_ids(user_id) | {user_id}))
+        .order_by(User.experiencePoints.desc(), User.id)
+    ).all()
+
+    entries = []
+    for position, user in enumerate(users):
+        if position and (user.experiencePoints or 0) == (users[position - 1].experiencePoints or 0):
+            entries.append((entries[-1][0], user))
+        else:
+            entries.append((position + 1, user))
+    return entries
+
+
+def clear_rankings():
+    global _rankings
+    with _lock:
+        _rankings = None
@@ -0,0 +1,156 @@
+import math
+import sys
+from datetime import datetime
+import click
+from sqlalchemy import select, update, insert, func, case, or_, literal
+from sqlalchemy.orm.util import identity_key
+from app import app, db
+from models import User, LedgerEntry
+from identity import evict_identity, clear_identities
+from co2 import record_co2
+from conditional import progress_values
+
+"""
+
+XP, completion counts and CO2 totals. Every award is written as a row in the append-only ledger_entries table, and
+added to the totals on the user's row with a single "UPDATE users SET column = column + ?" in the same transaction, so
+concurrent requests can never overwrite each other's increments and the users row is only locked for that one
+statement. The totals can be audited against, and rebuilt from, the ledger with "flask --app app audit-ledger" and
+"flask --app app rebuild-totals".
+
+"""
+
+COUNTERS = ('experiencePoints', 'meals_completed', 'quizzes_completed', 'totalMeatCo2', 'totalVeganCo2')
+DERIVED = ('co2Reduction', 'co2ReductionPercent')
+
+
+def _co2_values(meat, vegan):
+    return {
+        'co2Reduction': meat - vegan,
+        'co2ReductionPercent': case((vegan > 0, meat / vegan * 100), else_=0),
+    }
+
+
+def _expire_user(user_id, columns):
+    # the UPDATE bypasses the session, so a User row already loaded in this request must reload what it changed
+    user = db.session.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        db.session.expire(user, columns)
+
+
+def award(user_id, reason, reference=None, where=None, values=None, **amounts):
+    """Adds the amounts, keyed by counter name, to the user's totals and records them in the ledger. Extra conditions
+    for the update can be given in where, and other columns to set at the same time in values. Returns False, without
+    recording anything, if the conditions did not match. The caller commits"""
+    unknown = set(amounts) - set(COUNTERS)
+    if unknown:
+        raise ValueError(f'Unknown counters: {", ".join(sorted(unknown))}')
+
+    totals = {column: func.coalesce(getattr(User, column), 0) + amount
+              for column, amount in amounts.items() if amount}
+    if amounts.get('experiencePoints'):
+        # today's XP, set back to zero each night by the daily rollover in batch.py
+        totals['daily_experience'] = func.coalesce(User.daily_experience, 0) + amounts['experiencePoints']
+    if 'totalMeatCo2' in totals or 'totalVeganCo2' in totals:
+        totals.update(_co2_values(totals.get('totalMeatCo2', func.coalesce(User.totalMeatCo2, 0)),
+                                  totals.get('totalVeganCo2', func.coalesce(User.totalVeganCo2, 0))))
+
+    totals.update(progress_values())
+
+    query = update(User).where(User.id == user_id)
+    if where is not None:
+        query = query.where(where)
+    result = db.session.execute(query.values(**totals, **(values or {})).execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        return False
+
+    now = datetime.utcnow()
+    db.session.execute(insert(LedgerEntry).values(user_id=user_id, reason=reason, reference=reference, created=now,
+                                                  **{column: amounts.get(column, 0) for column in COUNTERS}))
+    if amounts.get('meals_completed') or amounts.get('totalMeatCo2') or amounts.get('totalVeganCo2'):
+        record_co2(user_id, now.date(), amounts.get('meals_completed', 0), amounts.get('totalMeatCo2', 0.0),
+                   amounts.get('totalVeganCo2', 0.0))
+    _expire_user(user_id, list(totals) + list(values or ()))
+    evict_identity(user_id)
+    return True
+
+
+def claim_daily_reward(user_id, today, experiencePoints):
+    """Awards the daily login bonus at most once per day, even if the user logs in from two places at once"""
+    return award(user_id, 'daily_login', where=or_(User.lastLogin.is_(None), User.lastLogin != today),
+                 values={'lastLogin': today}, experiencePoints=experiencePoints)
+
+
+def ledger_totals():
+    return (select(LedgerEntry.user_id,
+                   *[func.sum(getattr(LedgerEntry, column)).label(column) for column in COUNTERS])
+            .group_by(LedgerEntry.user_id)
+            .subquery())
+
+
+def audit_totals():
+    """Returns (user_id, counter, stored total, ledger total) for every total that does not match the ledger"""
+    totals = ledger_totals()
+    rows = db.session.execute(
+        select(User.id, *[getattr(User, column) for column in COUNTERS],
+               *[func.coalesce(getattr(totals.c, column), 0) for column in COUNTERS])
+        .outerjoin(totals, totals.c.user_id == User.id)
+    )
+
+    mismatches = []
+    for row in rows:
+        stored, expected = row[1:1 + len(COUNTERS)], row[1 + len(COUNTERS):]
+        for column, storedTotal, expectedTotal in zip(COUNTERS, stored, expected):
+            if not math.isclose(storedTotal or 0, expectedTotal, abs_tol=1e-6):
+                mismatches.append((row.id, column, storedTotal, expectedTotal))
+    return mismatches
+
+
+def rebuild_totals(user_id=None):
+    """Recalculates the totals on users from the ledger with one UPDATE, for one user or everyone. Returns the number
+    of users updated. The caller commits"""
+    sums = {column: select(func.coalesce(func.sum(getattr(LedgerEntry, column)), 0))
+            .where(LedgerEntry.user_id == User.id)
+            .scalar_subquery()
+            for column in COUNTERS}
+
+    query = update(User).values(**sums, **_co2_values(sums['totalMeatCo2'], sums['totalVeganCo2']), **progress_values())
+    if user_id is not None:
+        query = query.where(User.id == user_id)
+    result = db.session.execute(query.execution_options(synchronize_session=False))
+
+    db.session.expire_all()
+    if user_id is None:
+        clear_identities()
+    else:
+        evict_identity(user_id)
+    return result.rowcount
+
+
+def opening_balances():
+    """Records each user's existing totals as their first ledger entry, for databases created before the ledger"""
+    return insert(LedgerEntry).from_select(
+        ['user_id', 'reason', *COUNTERS, 'created'],
+        select(User.id, literal('opening_balance'), *[func.coalesce(getattr(User, column), 0) for column in COUNTERS],
+               func.current_timestamp())
+    )
+
+
+@app.cli.command('audit-ledger')
+def audit_ledger_command():
+    """Checks that every user's totals match their ledger."""
+    mismatches = audit_totals()
+    for user_id, column, stored, expected in mismatches:
+        click.echo(f'user {user_id}: {column} is {stored}, ledger total is {expected}')
+    if mismatches:
+        sys.exit(1)
+    click.echo('All totals match the ledger')
+
+
+@app.cli.command('rebuild-totals')
+@click.option('--user-id', type=int, help='Only rebuild this user.')
+def rebuild_totals_command(user_id):
+    """Recalculates users' totals from the ledger."""
+    updated = rebuild_totals(user_id)
+    db.session.commit()
+    click.echo(f'Rebuilt totals for {updated} users')
@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+from flask import Response, before_render_template, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+"""
+
+Per endpoint request metrics in the Prometheus text format, served at /metrics for a Prometheus server to scrape.
+Each request records how long it took until its response had been sent, how many SQL statements it ran and how long
+they took, and how long each template it rendered took, all labelled with the endpoint that handled it.
+
+Off unless METRICS_ENABLED is true. When it is off none of the hooks below are installed and /metrics does not exist,
+so requests do no extra work at all. If METRICS_TOKEN is set, /metrics answers only requests that send it as a bearer
+token.
+
+A streamed page's render time runs until its last chunk has been sent, and includes the SQL its rows are read with.
+
+"""
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class Histogram:
+    """Observations grouped by label values, exposed with cumulative buckets the way Prometheus expects"""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labelValues, value):
+        with _lock:
+            series = self.series.get(labelValues)
+            if series is None:
+                series = self.series[labelValues] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with _lock:
+            series = [(labelValues, list(counts), total, count)
+                      for labelValues, (counts, total, count) in sorted(self.series.items())]
+        for labelValues, counts, total, count in series:
+            labels = _labels(self.labels, labelValues)
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets, counts):
+                cumulative += bucketCount
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def increment(self, labelValues, amount=1):
+        with _lock:
+            self.series[labelValues] = self.series.get(labelValues, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with _lock:
+            series = sorted(self.series.items())
+        for labelValues, value in series:
+            lines.append(f'{self.name}{{{_labels(self.labels, labelValues)}}} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+REQUESTS = Counter('app_requests_total', 'Requests handled, by endpoint, method and response status.',
+                   ('endpoint', 'method', 'status'))
+REQUEST_DURATION = Histogram('app_request_duration_seconds',
+                             'Time from the start of a request until its response has been sent.',
+                             ('endpoint', 'method'), LATENCY_BUCKETS)
+SQL_STATEMENTS = Histogram('app_request_sql_statements', 'SQL statements run by a request.',
+                           ('endpoint',), SQL_COUNT_BUCKETS)
+SQL_DURATION = Histogram('app_request_sql_duration_seconds', 'Time a request spent running SQL statements.',
+                         ('endpoint',), SQL_TIME_BUCKETS)
+TEMPLATE_DURATION = Histogram('app_template_render_duration_seconds', 'Time taken to render a template.',
+                              ('endpoint', 'template'), LATENCY_BUCKETS)
+
+METRICS = (REQUESTS, REQUEST_DURATION, SQL_STATEMENTS, SQL_DURATION, TEMPLATE_DURATION)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sqlTime = 0.0
+        self.status = 500
+        self.templates = []
+
+
+def _endpoint():
+    # unmatched URLs are grouped together, so they do not each get their own series
+    return request.endpoint or 'none'
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    # the start time goes on the statement's own execution context, which is thrown away with it however it ends
+    if context is not None and getattr(_local, 'current', None) is not None:
+        context.metricsStarted = time.perf_counter()
+
+
+def _statement_finished(context):
+    current = getattr(_local, 'current', None)
+    started = getattr(context, 'metricsStarted', None)
+    if current is not None and started is not None:
+        context.metricsStarted = None
+        current.statements += 1
+        current.sqlTime += time.perf_counter() - started
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    _statement_finished(context)
+
+
+def _handle_error(exceptionContext):
+    # a statement that raises never reaches after_cursor_execute, but still ran and took time
+    if exceptionContext.execution_context is not None:
+        _statement_finished(exceptionContext.execution_context)
+
+
+def _template_started(sender, template, context, **extra):
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current.templates.append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    current = getattr(_local, 'current', None)
+    if current is not None and current.templates:
+        TEMPLATE_DURATION.observe((_endpoint(), template.name or 'string'),
+                                  time.perf_counter() - current.templates.pop())
+
+
+def _start_request():
+    _local.current = RequestMetrics()
+
+
+def _record_status(response):
+    current = getattr(_local, 'current', None)
+    if current is not None:
+        current.status = response.status_code
+    return response
+
+
+def _finish_request(error):
+    # teardown waits for a streamed response to finish, so this is the time until its last chunk was sent
+    current = getattr(_local, 'current', None)
+    if current is None:
+        return
+    _local.current = None
+
+    endpoint = _endpoint()
+    REQUESTS.increment((endpoint, request.method, current.status))
+    REQUEST_DURATION.observe((endpoint, request.method), time.perf_counter() - current.started)
+    SQL_STATEMENTS.observe((endpoint,), current.statements)
+    SQL_DURATION.observe((endpoint,), current.sqlTime)
+
+
+def exposition():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(exposition(), mimetype='text/plain; version=0.0.4')
+
+
+def install():
+    """Starts recording metrics and adds the /metrics endpoint"""
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    # ahead of the other before_request functions, so the time they take is counted
+    app.before_request_funcs.setdefault(None, []).insert(0, _start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+if app.config['METRICS_ENABLED']:
+    install()
@@ -0,0 +1,243 @@
+import click
+import json
+import pickle
+from datetime import datetime
+from sqlalchemy import inspect, text, select, insert, LargeBinary
+from app import app, db
+from models import ALLERGENS, USER_SEARCH_INDEX, SchemaMigration
+from models import QuizAttempt, LedgerEntry, Co2Daily, UserCo2Daily, BatchRun, Ingredient
+
+"""
+
+Versioned schema migrations. Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table, so running the upgrade again only applies migrations that are new since the last run. The
+application never changes the schema when it starts, run "flask --app app upgrade-db" when deploying instead, followed
+by "flask --app app seed-db" to load any new catalog content (see seed.py).
+
+New migrations are appended to MIGRATIONS with the next version number, and must never be reordered or edited once
+they have been released.
+
+"""
+
+
+def _columns(connection, table):
+    return {column['name'] for column in inspect(connection).get_columns(table)}
+
+
+def add_column(connection, table, column, definition):
+    """Adds a column unless the table already has it"""
+    if column not in _columns(connection, table):
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN "{column}" {definition}'))
+
+
+def create_tables(connection, *tables):
+    """Creates the given model tables, and their indexes, if they do not exist yet"""
+    db.metadata.create_all(connection, tables=[model.__table__ for model in tables], checkfirst=True)
+
+
+def create_schema(connection):
+    """Creates every table that does not exist yet. On a new database this is the whole schema, on one created before
+    versioned migrations it only adds the newer tables, and the next migration brings the existing ones up to date"""
+    db.metadata.create_all(connection, checkfirst=True)
+
+
+def _mask_expression(prefix):
+    return ' | '.join(f'(CASE WHEN {prefix}{allergen} THEN {1 << position} ELSE 0 END)'
+                      for position, allergen in enumerate(ALLERGENS))
+
+
+def migrate_allergen_masks(connection):
+    """Folds the old per-allergen boolean columns on users and meals into a single indexed allergen_mask column.
+    Tables that have already been migrated are left alone"""
+    for table, prefix in (('users', 'allergic_to_'), ('meals', 'contains_')):
+        columns = _columns(connection, table)
+        if f'{prefix}{ALLERGENS[0]}' not in columns:
+            continue
+
+        add_column(connection, table, 'allergen_mask', 'INTEGER NOT NULL DEFAULT 0')
+        connection.execute(text(f'UPDATE {table} SET allergen_mask = {_mask_expression(prefix)}'))
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_allergen_mask ON {table} (allergen_mask)'))
+
+        for allergen in ALLERGENS:
+            connection.execute(text(f'ALTER TABLE {table} DROP COLUMN {prefix}{allergen}'))
+
+
+def add_progress_cursor(connection):
+    """Adds the meal progression cursor to users. The default of (0, 0) is before every meal, which is always a valid
+    starting point, and the cursor moves forward the next time each user completes a meal"""
+    for column in ('progressDifficulty', 'progressMealID'):
+        add_column(connection, 'users', column, 'INTEGER NOT NULL DEFAULT 0')
+
+
+def add_friendship_pairs(connection):
+    """Adds the canonical (lowest ID, highest ID) pair to existing friendships, keeping only the first friendship
+    between any two users, so that the unique pair index can be created"""
+    if 'user_low_id' in _columns(connection, 'friendships'):
+        return
+
+    add_column(connection, 'friendships', 'user_low_id', 'INTEGER REFERENCES users (id)')
+    add_column(connection, 'friendships', 'user_high_id', 'INTEGER REFERENCES users (id)')
+    connection.execute(text(
+        'UPDATE friendships SET '
+        'user_low_id = CASE WHEN requester_id < requested_id THEN requester_id ELSE requested_id END, '
+        'user_high_id = CASE WHEN requester_id < requested_id THEN requested_id ELSE requester_id END'
+    ))
+    connection.execute(text(
+        'DELETE FROM friendships WHERE id NOT IN '
+        '(SELECT MIN(id) FROM friendships GROUP BY user_low_id, user_high_id)'
+    ))
+
+
+def add_unique_pairs(connection):
+    """Removes duplicate completion rows and adds the unique indexes that now stop them being created"""
+    for table, name, columns in (('friendships', 'uq_friendships_pair', 'user_low_id, user_high_id'),
+                                 ('user_meals', 'uq_user_meals_user_meal', 'user_id, meal_id'),
+                                 ('user_quizzes', 'uq_user_quizzes_user_quiz', 'user_id, "quizID"')):
+        inspector = inspect(connection)
+        existing = {constraint['name'] for constraint in inspector.get_unique_constraints(table)}
+        existing |= {index['name'] for index in inspector.get_indexes(table)}
+        if name in existing:
+            continue
+
+        connection.execute(text(
+            f'DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {columns})'
+        ))
+        connection.execute(text(f'CREATE UNIQUE INDEX {name} ON {table} ({columns})'))
+
+
+def create_indexes(connection):
+    """Creates any index declared on the models that is missing from the database, skipping tables that a later
+    migration creates"""
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def create_search_index(connection):
+    """Creates and fills the users full text index, on databases created before it existed"""
+    if connection.dialect.name != 'sqlite' or inspect(connection).has_table('users_fts'):
+        return
+    for statement in USER_SEARCH_INDEX:
+        connection.execute(text(statement))
+
+
+def upgrade_legacy_schema(connection):
+    migrate_allergen_masks(connection)
+    add_progress_cursor(connection)
+    add_friendship_pairs(connection)
+    add_unique_pairs(connection)
+    create_indexes(connection)
+    create_search_index(connection)
+
+
+def add_quiz_attempts(connection):
+    create_tables(connection, QuizAttempt)
+
+
+def options_to_json(connection):
+    """Converts the pickled Question.otherOptions into JSON text. This is the only place that still unpickles them,
+    and it only runs against the application's own database"""
+    column = next(column for column in inspect(connection).get_columns('questions')
+                  if column['name'] == 'otherOptions')
+    if not isinstance(column['type'], LargeBinary):
+        return
+
+    add_column(connection, 'questions', 'otherOptionsJSON', 'JSON')
+    rows = connection.execute(text('SELECT "questionID", "otherOptions" FROM questions')).all()
+    for questionID, pickled in rows:
+        options = pickle.loads(pickled) if pickled is not None else None
+        connection.execute(text('UPDATE questions SET "otherOptionsJSON" = :options WHERE "questionID" = :questionID'),
+                           {'options': json.dumps(options), 'questionID': questionID})
+    connection.execute(text('ALTER TABLE questions DROP COLUMN "otherOptions"'))
+    connection.execute(text('ALTER TABLE questions RENAME COLUMN "otherOptionsJSON" TO "otherOptions"'))
+
+
+def add_ledger(connection):
+    from ledger import opening_balances
+    create_tables(connection, LedgerEntry)
+    connection.execute(opening_balances())
+
+
+def add_co2_rollups(connection):
+    from co2 import rebuild_rollups
+    create_tables(connection, Co2Daily, UserCo2Daily)
+    rebuild_rollups(connection)
+
+
+def add_batch_runs(connection):
+    create_tables(connection, BatchRun)
+    create_indexes(connection)
+
+
+def add_ingredients(connection):
+    """Creates the ingredients table and fills it by parsing every meal's recipe"""
+    from recipes import parse_recipe
+    create_tables(connection, Ingredient)
+    for mealID, recipe in connection.execute(text('SELECT "mealID", recipe FROM meals')).all():
+        parsed = [{**ingredient._asdict(), 'meal_id': mealID} for ingredient in parse_recipe(recipe)]
+        if parsed:
+            connection.execute(insert(Ingredient), parsed)
+
+
+def add_progress_version(connection):
+    add_column(connection, 'users', 'progress_version', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(connection, 'users', 'progress_updated', 'DATETIME')
+
+
+def reparse_ingredients(connection):
+    """Adds the display name to ingredients, and parses every meal's recipe again, so that preparations written after a
+    comma are kept with their ingredient instead of being listed as ingredients of their own"""
+    add_column(connection, 'ingredients', 'display_name', 'VARCHAR(100)')
+    connection.execute(text('DELETE FROM ingredients'))
+    add_ingredients(connection)
+
+
+MIGRATIONS = [
+    (1, 'Create schema', create_schema),
+    (2, 'Upgrade databases created before versioned migrations', upgrade_legacy_schema),
+    (3, 'Add quiz attempts', add_quiz_attempts),
+    (4, 'Store question options as JSON', options_to_json),
+    (5, 'Add the XP and CO2 ledger', add_ledger),
+    (6, 'Index users by XP for the leaderboards', create_indexes),
+    (7, 'Add daily CO2 rollups', add_co2_rollups),
+    (8, 'Add batch runs for the nightly jobs', add_batch_runs),
+    (9, 'Parse recipes into ingredients', add_ingredients),
+    (10, 'Version each user\'s progress for conditional GETs', add_progress_version),
+    (11, 'Keep ingredient display names and comma separated preparations', reparse_ingredients),
+]
+
+
+def applied_versions(connection):
+    create_tables(connection, SchemaMigration)
+    return set(connection.execute(select(SchemaMigration.version)).scalars())
+
+
+def upgrade():
+    """Applies every migration that has not been applied yet, in order, each in its own transaction. Returns the
+    versions that were applied"""
+    with db.engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    upgraded = []
+    for version, description, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        with db.engine.begin() as connection:
+            migration(connection)
+            connection.execute(insert(SchemaMigration).values(version=version, description=description,
+                                                              applied=datetime.utcnow()))
+        upgraded.append(version)
+    return upgraded
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Upgrades the database to the current schema."""
+    upgraded = upgrade()
+    if upgraded:
+        click.echo(f'Applied migrations {", ".join(str(version) for version in upgraded)}')
+    else:
+        click.echo('Database is up to date')
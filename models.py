@@ -1,26 +1,86 @@
 from datetime import datetime
 from functools import wraps
-import bcrypt
+from sqlalchemy import DDL
 from flask import render_template
 from flask_login import UserMixin, current_user
 from app import app, db
+from passwords import hash_password
+from recipes import parse_recipe
 
 
 class Friendship(db.Model):
+    """A friend request between two users. Alongside who sent the request, each pair is also stored in a canonical
+    (lowest ID, highest ID) order, so a pair can only ever have one friendship row regardless of who asked first"""
     __tablename__ = 'friendships'
+    __table_args__ = (
+        db.UniqueConstraint('user_low_id', 'user_high_id', name='uq_friendships_pair'),
+        db.Index('ix_friendships_user_high_id', 'user_high_id'),
+        db.Index('ix_friendships_requested_status', 'requested_id', 'status'),
+        db.Index('ix_friendships_requester_status', 'requester_id', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     requester_email = db.Column(db.String(100), nullable=False)
     requested_email = db.Column(db.String(100), nullable=False)
     requester_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     requested_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_low_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_high_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     status = db.Column(db.String(10), default='pending')
 
     requester = db.relationship('User', foreign_keys=[requester_id], back_populates='requested_friendships')
     requested = db.relationship('User', foreign_keys=[requested_id], back_populates='received_friendships')
 
+    def __init__(self, requester_id, requested_id, requester_email, requested_email, status='pending'):
+        self.requester_id = requester_id
+        self.requested_id = requested_id
+        self.requester_email = requester_email
+        self.requested_email = requested_email
+        self.user_low_id, self.user_high_id = canonical_pair(requester_id, requested_id)
+        self.status = status
+
+    def other_user_id(self, user_id):
+        return self.user_high_id if self.user_low_id == user_id else self.user_low_id
+
+
+def canonical_pair(first_id, second_id):
+    """Orders two user IDs the way a friendship pair is stored, lowest first"""
+    return (first_id, second_id) if first_id <= second_id else (second_id, first_id)
+
+
+# The allergens the application asks users about, each stored as one bit of an allergen_mask column on users and
+# meals. Only ever append to this list, the position of each allergen is its bit in masks already stored
+ALLERGENS = ('celery', 'gluten', 'lupin', 'mustard', 'peanuts', 'sesame', 'soybeans', 'sulphur_dioxide', 'tree_nuts')
+ALLERGEN_BITS = {allergen: 1 << position for position, allergen in enumerate(ALLERGENS)}
+
+
+def allergen_mask(allergens):
+    """Combines allergen names into a mask, ignoring any names that are not known allergens"""
+    mask = 0
+    for allergen in allergens:
+        mask |= ALLERGEN_BITS.get(allergen, 0)
+    return mask
+
+
+def _allergen_flag(allergen):
+    """Boolean attribute backed by one bit of the model's allergen_mask column"""
+    bit = ALLERGEN_BITS[allergen]
+
+    def get_flag(self):
+        return bool((self.allergen_mask or 0) & bit)
+
+    def set_flag(self, value):
+        mask = self.allergen_mask or 0
+        self.allergen_mask = mask | bit if value else mask & ~bit
+
+    return property(get_flag, set_flag)
+
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        db.Index('ix_posts_user_date', 'user_id', 'dateCreated', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -57,37 +117,81 @@ class User(db.Model, UserMixin):
     co2Reduction = db.Column(db.Float, default=0)
     co2ReductionPercent = db.Column(db.Float, default=0)
 
-    allergic_to_celery = db.Column(db.Boolean, default=False)
-    allergic_to_gluten = db.Column(db.Boolean, default=False)
-    allergic_to_lupin = db.Column(db.Boolean, default=False)
-    allergic_to_mustard = db.Column(db.Boolean, default=False)
-    allergic_to_peanuts = db.Column(db.Boolean, default=False)
-    allergic_to_sesame = db.Column(db.Boolean, default=False)
-    allergic_to_soybeans = db.Column(db.Boolean, default=False)
-    allergic_to_sulphur_dioxide = db.Column(db.Boolean, default=False)
-    allergic_to_tree_nuts = db.Column(db.Boolean, default=False)
+    # position in the meal progression, every meal before (progressDifficulty, progressMealID) has been completed
+    progressDifficulty = db.Column(db.Integer, default=0, nullable=False)
+    progressMealID = db.Column(db.Integer, default=0, nullable=False)
 
-    user_meals = db.relationship('UserMeal', back_populates='user', lazy='dynamic')
-    user_quizzes = db.relationship('UserQuiz', back_populates='user', lazy='dynamic')
-    posts = db.relationship('Post', back_populates='user', lazy='dynamic')
+    # bumped by every change that shows up on the user's own pages, so they can be revalidated with an ETag
+    progress_version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    progress_updated = db.Column(db.DateTime)
+
+    allergen_mask = db.Column(db.Integer, default=0, nullable=False, index=True)
+
+    allergic_to_celery = _allergen_flag('celery')
+    allergic_to_gluten = _allergen_flag('gluten')
+    allergic_to_lupin = _allergen_flag('lupin')
+    allergic_to_mustard = _allergen_flag('mustard')
+    allergic_to_peanuts = _allergen_flag('peanuts')
+    allergic_to_sesame = _allergen_flag('sesame')
+    allergic_to_soybeans = _allergen_flag('soybeans')
+    allergic_to_sulphur_dioxide = _allergen_flag('sulphur_dioxide')
+    allergic_to_tree_nuts = _allergen_flag('tree_nuts')
+
+    # these collections are never loaded on access, so a template cannot quietly run a query for each user it shows.
+    # Views query the rows they need, or load them up front with loader options
+    user_meals = db.relationship('UserMeal', back_populates='user', lazy='raise_on_sql')
+    user_quizzes = db.relationship('UserQuiz', back_populates='user', lazy='raise_on_sql')
+    posts = db.relationship('Post', back_populates='user', lazy='raise_on_sql')
 
     requested_friendships = db.relationship('Friendship', foreign_keys=[Friendship.requester_id],
-                                            back_populates='requester', lazy='dynamic')
+                                            back_populates='requester', lazy='raise_on_sql')
     received_friendships = db.relationship('Friendship', foreign_keys=[Friendship.requested_id],
-                                           back_populates='requested', lazy='dynamic')
+                                           back_populates='requested', lazy='raise_on_sql')
 
     def __init__(self, email, firstname, lastname, password, role, completed_onboarding):
         self.email = email
         self.firstname = firstname
         self.lastname = lastname
-        self.password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        self.password = hash_password(password)
         self.role = role
         self.completed_onboarding = completed_onboarding
 
 
+# the leaderboards read the top N and the users either side of someone in XP order, see leaderboard.py
+db.Index('ix_users_experience', User.experiencePoints, User.id.desc())
+
+
+# Full text index over users for search. It is an external content table over users, so it stores no copy of the
+# rows, and the triggers keep it in step whenever a user registers, changes an indexed column, or is deleted
+USER_SEARCH_INDEX = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "firstname, lastname, email, content='users', content_rowid='id', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, firstname, lastname, email) "
+    "VALUES (new.id, new.firstname, new.lastname, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, firstname, lastname, email) "
+    "VALUES ('delete', old.id, old.firstname, old.lastname, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF firstname, lastname, email ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, firstname, lastname, email) "
+    "VALUES ('delete', old.id, old.firstname, old.lastname, old.email); "
+    "INSERT INTO users_fts(rowid, firstname, lastname, email) "
+    "VALUES (new.id, new.firstname, new.lastname, new.email); END",
+    "INSERT INTO users_fts(users_fts) VALUES ('rebuild')",
+]
+
+for statement in USER_SEARCH_INDEX:
+    db.event.listen(User.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+db.event.listen(User.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS users_fts').execute_if(dialect='sqlite'))
+
+
 class Meal(db.Model):
     __tablename__ = 'meals'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_meals_difficulty', 'mealDifficulty', 'mealID'),
+        {'extend_existing': True}
+    )
 
     mealID = db.Column(db.Integer, primary_key=True)
     mealName = db.Column(db.String(100), nullable=False)
@@ -97,19 +201,24 @@ class Meal(db.Model):
     mealDifficulty = db.Column(db.Integer, default=1)
     imageUrl = db.Column(db.String(255), default=None)
 
-    contains_celery = db.Column(db.Boolean, default=False)
-    contains_gluten = db.Column(db.Boolean, default=False)
-    contains_lupin = db.Column(db.Boolean, default=False)
-    contains_mustard = db.Column(db.Boolean, default=False)
-    contains_peanuts = db.Column(db.Boolean, default=False)
-    contains_sesame = db.Column(db.Boolean, default=False)
-    contains_soybeans = db.Column(db.Boolean, default=False)
-    contains_sulphur_dioxide = db.Column(db.Boolean, default=False)
-    contains_tree_nuts = db.Column(db.Boolean, default=False)
+    allergen_mask = db.Column(db.Integer, default=0, nullable=False, index=True)
+
+    contains_celery = _allergen_flag('celery')
+    contains_gluten = _allergen_flag('gluten')
+    contains_lupin = _allergen_flag('lupin')
+    contains_mustard = _allergen_flag('mustard')
+    contains_peanuts = _allergen_flag('peanuts')
+    contains_sesame = _allergen_flag('sesame')
+    contains_soybeans = _allergen_flag('soybeans')
+    contains_sulphur_dioxide = _allergen_flag('sulphur_dioxide')
+    contains_tree_nuts = _allergen_flag('tree_nuts')
 
     veganCo2 = db.Column(db.Float, nullable=False)
     meatCo2 = db.Column(db.Float, nullable=False)
 
+    ingredients = db.relationship('Ingredient', back_populates='meal', cascade='all, delete-orphan',
+                                  order_by='Ingredient.position')
+
     def __init__(self, mealName, mealDescription, recipe, recipeInstructions, mealDifficulty=1, imageUrl=None,
                  contains_celery=False, contains_gluten=False, contains_lupin=False, contains_mustard=False,
                  contains_peanuts=False, contains_sesame=False, contains_soybeans=False,
@@ -120,6 +229,7 @@ class Meal(db.Model):
         self.recipe = recipe
         self.recipeInstructions = recipeInstructions
         self.mealDifficulty = mealDifficulty
+        self.allergen_mask = 0
         self.contains_celery = contains_celery
         self.contains_gluten = contains_gluten
         self.contains_lupin = contains_lupin
@@ -133,10 +243,39 @@ class Meal(db.Model):
         self.meatCo2 = meatCo2
 
 
+class Ingredient(db.Model):
+    """One line of a meal's recipe, parsed into quantity, unit and name so the shopping list can add up the same
+    ingredient across meals. These are rebuilt whenever Meal.recipe is set, see recipes.py"""
+    __tablename__ = 'ingredients'
+    __table_args__ = (
+        db.Index('ix_ingredients_meal', 'meal_id', 'position'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    meal_id = db.Column(db.Integer, db.ForeignKey('meals.mealID'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Float)
+    unit = db.Column(db.String(20))
+    name = db.Column(db.String(100), nullable=False)
+    display_name = db.Column(db.String(100))
+    preparation = db.Column(db.String(255))
+    text = db.Column(db.String(255), nullable=False)
+
+    meal = db.relationship('Meal', back_populates='ingredients')
+
+
+@db.event.listens_for(Meal.recipe, 'set')
+def _parse_recipe(meal, recipe, oldRecipe, initiator):
+    meal.ingredients = [Ingredient(**parsed._asdict()) for parsed in parse_recipe(recipe)]
+
+
 class UserMeal(db.Model):
     """Tracks the meals in which a user has completed within the meal progression tree"""
     __tablename__ = 'user_meals'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'meal_id', name='uq_user_meals_user_meal'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -161,7 +300,10 @@ class UserMeal(db.Model):
 class Quiz(db.Model):
     """Quiz model that is used to create new quizzes within the knowledge base page"""
     __tablename__ = 'quizzes'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_quizzes_order', 'order', 'quizID'),
+        {'extend_existing': True}
+    )
 
     quizID = db.Column(db.Integer, primary_key=True)
     quizName = db.Column(db.String(100), nullable=False)
@@ -182,13 +324,16 @@ class Quiz(db.Model):
 class Question(db.Model):
     """Defines questions that can be added to each quiz"""
     __tablename__ = 'questions'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_questions_quiz', 'quizID', 'questionID'),
+        {'extend_existing': True}
+    )
 
     questionID = db.Column(db.Integer, primary_key=True)
     quizID = db.Column(db.Integer, db.ForeignKey('quizzes.quizID'), nullable=False)
     questionText = db.Column(db.Text, nullable=False)
     correctAnswer = db.Column(db.String(100), nullable=False)
-    otherOptions = db.Column(db.PickleType)  # easier than jsonify, which kept breaking
+    otherOptions = db.Column(db.JSON)  # JSON array of the wrong answers, catalog.py decodes a whole quiz's at once
 
     def __init__(self, quizID, questionText, correctAnswer, otherOptions):
         self.quizID = quizID
@@ -200,7 +345,10 @@ class Question(db.Model):
 class UserQuiz(db.Model):
     """Tracks the quizzes in which a user has completed within the knowledge base or quizzes page"""
     __tablename__ = 'user_quizzes'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'quizID', name='uq_user_quizzes_user_quiz'),
+        {'extend_existing': True}
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -222,141 +370,126 @@ class UserQuiz(db.Model):
             self.completionDate = completionDate
 
 
-def init_db():
-    """Initialises the database with a base user, that is useful when testing the application. Also includes some base
-    meals and content for the meal progression tree, and initialises some quizzes within the knowledge base or quiz
-    page. New quizzes, or meal recipes can be added here as desired, and get processed to the application automatically
-    when the project is run. THIS FUNCTION WILL CLEAR EXISTING INFORMATION IN THE DATABASE AND RESET IT!
+class QuizAttempt(db.Model):
+    """One submission of a quiz by a user. The answers are stored as a compact JSON object of question ID to the
+    chosen option, so the review page and attempt history only ever need this one row, see attempts.py"""
+    __tablename__ = 'quiz_attempts'
+    __table_args__ = (
+        db.Index('ix_quiz_attempts_user_quiz', 'user_id', 'quizID', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    quizID = db.Column(db.Integer, db.ForeignKey('quizzes.quizID'), nullable=False)
+    answers = db.Column(db.Text, nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    totalQuestions = db.Column(db.Integer, nullable=False)
+    expAwarded = db.Column(db.Integer, nullable=False, default=0)
+    completionDate = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __init__(self, user_id, quizID, answers, score, totalQuestions, expAwarded=0):
+        self.user_id = user_id
+        self.quizID = quizID
+        self.answers = answers
+        self.score = score
+        self.totalQuestions = totalQuestions
+        self.expAwarded = expAwarded
+        self.completionDate = datetime.utcnow()
+
+
+class LedgerEntry(db.Model):
+    """Append-only record of every change to a user's XP, completion counts and CO2 totals. The totals on the users
+    row are a running sum of these entries and can always be rebuilt from them, see ledger.py"""
+    __tablename__ = 'ledger_entries'
+    __table_args__ = (
+        db.Index('ix_ledger_entries_user', 'user_id', 'id'),
+        db.Index('ix_ledger_entries_user_created', 'user_id', 'created'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    reason = db.Column(db.String(50), nullable=False)
+    reference = db.Column(db.Integer)  # the meal or quiz the entry is for, if any
+    experiencePoints = db.Column(db.Integer, nullable=False, default=0)
+    meals_completed = db.Column(db.Integer, nullable=False, default=0)
+    quizzes_completed = db.Column(db.Integer, nullable=False, default=0)
+    totalMeatCo2 = db.Column(db.Float, nullable=False, default=0)
+    totalVeganCo2 = db.Column(db.Float, nullable=False, default=0)
+    created = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
 
-    It is important to note, that quiz and meal content have been generated by OpenAI’s ‘Chat Generative Pre-Trained
-    Transformer, model 3.5’, and not by myself. This is for prototype demonstration purposes, and each meal recipe,
-    quiz title, quiz questions and answers have been generated using artificial intelligence This is because I am not
-    an expert in designing quiz questions or meal recipes, and the focus of this project is the computer science
-    and software engineering aspects applied in creating this project, which have all been written by myself alone.
+class Co2Daily(db.Model):
+    """Meals completed and CO2 totals across every user for one day, kept up to date with each award, see co2.py"""
+    __tablename__ = 'co2_daily'
 
-    Once again, quiz and meal recipe content, is purely mock up data.
+    day = db.Column(db.Date, primary_key=True)
+    meals = db.Column(db.Integer, nullable=False, default=0)
+    meatCo2 = db.Column(db.Float, nullable=False, default=0)
+    veganCo2 = db.Column(db.Float, nullable=False, default=0)
 
+
+class UserCo2Daily(db.Model):
+    """Meals completed and CO2 totals for one user on one day"""
+    __tablename__ = 'user_co2_daily'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    meals = db.Column(db.Integer, nullable=False, default=0)
+    meatCo2 = db.Column(db.Float, nullable=False, default=0)
+    veganCo2 = db.Column(db.Float, nullable=False, default=0)
+
+
+class BatchRun(db.Model):
+    """One run of a scheduled batch job for one day. The unique (job, day) pair means each day is only processed once,
+    however many workers try, and lastUserID lets an interrupted run carry on from its last finished chunk"""
+    __tablename__ = 'batch_runs'
+    __table_args__ = (
+        db.UniqueConstraint('job', 'day', name='uq_batch_runs_job_day'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='running')
+    lastUserID = db.Column(db.Integer, nullable=False, default=0)
+    users = db.Column(db.Integer, nullable=False, default=0)
+    seconds = db.Column(db.Float, nullable=False, default=0)
+    started = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished = db.Column(db.DateTime)
+
+
+class CatalogVersion(db.Model):
+    """Single row counter that is bumped whenever meal, quiz or question content changes, so that every worker process
+    knows when its cached copy of the catalog is out of date"""
+    __tablename__ = 'catalog_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+class SchemaMigration(db.Model):
+    """One row per schema migration applied to this database, see migrations.py"""
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    description = db.Column(db.String(200), nullable=False)
+    applied = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
+def init_db():
+    """Initialises the database with a base user, that is useful when testing the application. Also includes some base
+    meals and content for the meal progression tree, and initialises some quizzes within the knowledge base or quiz
+    page, see seed.py. THIS FUNCTION WILL CLEAR EXISTING INFORMATION IN THE DATABASE AND RESET IT! It is no longer run
+    when the application starts, use "flask --app app reset-db" to call it.
     """
-    from users.quizQuestions import easy_quiz, intermediate_quiz, advanced_quiz
+    from migrations import upgrade
+    from seed import seed
     with app.app_context():
         db.drop_all()
-        db.create_all()
-
-        user = User(
-            email='test@emailUser.com',
-            firstname='Max',
-            lastname='Ramage',
-            password='userPassword!',
-            role='user',
-            completed_onboarding=True
-        )
-        baseUser = User(
-            email='test@email.com',
-            firstname='Jane',
-            lastname='Doe',
-            password='userPassword!',
-            role='user',
-            completed_onboarding=False
-        )
-
-        easyMeal = Meal(mealName="Simple Stir Fry", mealDescription="A simple and tasty stir fry meal, which is a "
-                                                                    "core foundation in any home chefs repertoire of "
-                                                                    "recipes!",
-                        recipe="1 cup of cooked brown rice,"
-                               "2 tablespoons olive oil,"
-                               "1 sliced bell pepper,"
-                               "1 cup of broccoli florets,"
-                               "2 cloves of minced garlic,"
-                               "2 tablespoons of soy sauce,"
-                               "salt and pepper",
-                        recipeInstructions="1. Heat the olive oil in a large pan over medium heat,"
-                                           "2. Add the bell pepper, carrot, broccoli, and mushrooms. Sauté for about "
-                                           "5-7 minutes or until vegetables are tender "
-                                           "3. Add the minced garlic and sauté for another minute,"
-                                           "4. In a small bowl, mix the soy sauce and maple syrup. Pour this mixture "
-                                           "over the vegetables, "
-                                           "5. Stir well to combine everything and cook for another 2 minutes,"
-                                           "6. Serve the stir-fry over the cooked brown rice.",
-                        mealDifficulty=1,
-                        imageUrl="https://www.eatingbyelaine.com/wp-content/uploads/2023/10/EBE-Veggie-Stir-Fry-34.jpg",
-                        veganCo2=1.5, meatCo2=2.3)
-
-        intermediateMeal = Meal(mealName="Intermediate Vegetable Curry",
-                                mealDescription="An intermediate vegetable curry, "
-                                                "that is full of flavour and is "
-                                                "guarenteed to enhance your cooking "
-                                                "skills!",
-                                recipe="2 tablespoons of coconut oil,"
-                                       "1 chopped onion,"
-                                       "1 chopped bell pepper,"
-                                       "1 chopped carrot,"
-                                       "1 cup of broccoli florets,"
-                                       "1 cup of diced tomatoes (canned or fresh),"
-                                       "1 tablespoon of curry powder,"
-                                       "1 teaspoon of turmeric,"
-                                       "1 can of coconut milk,"
-                                       "Salt and pepper",
-                                recipeInstructions="1. Use the cooked brown rice set aside from the "
-                                                   "previous recipe or cook a fresh batch,"
-                                                   "2. Heat coconut oil in a large pot over medium "
-                                                   "heat, "
-                                                   "3. Add the onion and sauté until translucent,"
-                                                   "4. Add the bell pepper, carrot, and broccoli. "
-                                                   "Cook for about 5 minutes, "
-                                                   "5. Stir in the curry powder and turmeric, "
-                                                   "cooking for another minute until fragrant, "
-                                                   "6. Add the diced tomatoes and coconut milk. "
-                                                   "Bring to a simmer, "
-                                                   "7. Reduce heat and let it simmer for 15-20 "
-                                                   "minutes, or until the vegetables are tender "
-                                                   "and the flavors have melded together, "
-                                                   "8. Season with salt and pepper,"
-                                                   "9. Serve the curry over brown rice.",
-                                mealDifficulty=2,
-                                imageUrl="https://fullofplants.com/wp-content/uploads/2019/07/easy-spicy-vietnamese"
-                                         "-curry-vegan-vegetarian-with-tofu-mushrooms-broccoli-taro-eggplant-24"
-                                         "-1400x2100.jpg", veganCo2=1.2, meatCo2=2.6)
-
-        advancedMeal = Meal(mealName="Advanced Stuffed Peppers",
-                            mealDescription="An advanced and tasty recipe, that will provide a challenge to your "
-                                            "vegan cooking skills, and enhance your overall ability nicely.",
-                            recipe="4 large bell peppers, tops cut off and seeds removed,"
-                                   "1 tablespoon olive oil,"
-                                   "1 diced onion,"
-                                   "2 cloves of minced garlic,"
-                                   "1 diced carrot,"
-                                   "1 cup of chopped mushrooms,"
-                                   "1 cup of finely chopped broccoli florets,"
-                                   "1 teaspoon of cumin,"
-                                   "1 teaspoon of paprika,"
-                                   "1 and a half cups of cooked brown rice,"
-                                   "Salt and pepper",
-                            recipeInstructions="1. Preheat the oven to 375°F (190°C),"
-                                               "2. In a skillet, heat olive oil over medium heat. Add onion and "
-                                               "garlic, and saute until onion is translucent, "
-                                               "3. Add the carrot, mushrooms, and broccoli. Cook until vegetables are "
-                                               "slightly tender, "
-                                               "4. Stir in cumin, paprika, and then the cooked rice and mix well, "
-                                               "5. Add the diced tomatoes and season with salt and pepper. Cook for a "
-                                               "few more minutes until everything is heated through, "
-                                               "6. Stuff the mixture into the hollowed-out bell peppers, "
-                                               "7. Place the stuffed peppers in a baking dish and cover with foil, "
-                                               "8. Bake for 30-35 minutes, or until the peppers are tender,"
-                                               "9. Serve hot, possibly with a side of green salad",
-                            mealDifficulty=3,
-                            imageUrl="https://www.aheadofthyme.com/wp-content/uploads/2018/07/vegan-stuffed-peppers.jpg", veganCo2=2.3, meatCo2=3.4)
-
-        easy_quiz()
-        intermediate_quiz()
-        advanced_quiz()
-
-        db.session.add(user)
-        db.session.add(baseUser)
-        db.session.add(easyMeal)
-        db.session.add(intermediateMeal)
-        db.session.add(advancedMeal)
-
-        db.session.commit()
+        upgrade()
+        seed(with_test_users=True)
 
 
 def clear_db():
@@ -364,6 +497,3 @@ def clear_db():
     with app.app_context():
         db.drop_all()
 
-
-# init_db() WILL RESET AND CLEAR THE DATABASE, COMMENT IT OUT IF YOU WANT TO PERSIST INFORMATION ACROSS RUN SESSIONS!
-init_db()
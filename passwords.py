@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from app import app
+
+"""
+
+Password hashing and verification. bcrypt is deliberately slow, so rather than running it on whichever thread is
+serving the request, every hash and check is handed to a small, bounded pool of worker threads. At most
+BCRYPT_WORKERS hashes run at once and at most BCRYPT_MAX_QUEUE more may wait for a worker, beyond which callers are
+turned away with PasswordHasherBusy instead of piling up, so a burst of logins cannot take every request thread with it.
+
+"""
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already running or waiting"""
+
+
+_executor = None
+_slots = None
+_executorLock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _slots
+
+    # created on first use rather than at import, so a forking server starts the threads in each worker
+    if _executor is None:
+        with _executorLock:
+            if _executor is None:
+                workers = app.config['BCRYPT_WORKERS']
+                _slots = threading.BoundedSemaphore(workers + app.config['BCRYPT_MAX_QUEUE'])
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+    return _executor
+
+
+def _run(function, *args):
+    executor = _get_executor()
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+
+    future = executor.submit(function, *args)
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def _as_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def hash_password(password):
+    """Hashes a password with the configured BCRYPT_LOG_ROUNDS work factor"""
+    salt = bcrypt.gensalt(rounds=app.config['BCRYPT_LOG_ROUNDS'])
+    return _run(bcrypt.hashpw, _as_bytes(password), salt)
+
+
+def check_password(password, hashed):
+    return _run(bcrypt.checkpw, _as_bytes(password), _as_bytes(hashed))
+
+
+def hash_cost(hashed):
+    """Reads the work factor a stored hash was created with, e.g. 12 from $2b$12$..."""
+    return int(_as_bytes(hashed).split(b'$')[2])
+
+
+def needs_rehash(hashed):
+    return hash_cost(hashed) != app.config['BCRYPT_LOG_ROUNDS']
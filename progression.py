@@ -0,0 +1,133 @@
+from sqlalchemy import select, update, and_, or_, inspect
+from app import db
+from models import User, Meal, UserMeal
+from identity import evict_identity, clear_identities
+from conditional import progress_values
+
+"""
+
+Each user's place in the meal progression is stored on their row as a (difficulty, mealID) cursor, with the guarantee
+that every meal before the cursor has been completed. The meal tree and shopping list only ever need the meals from the
+cursor onwards, so they can find the user's next meals with one small indexed query instead of loading every meal and
+every completed meal. complete_meal moves the cursor forward with a single UPDATE that can only ever advance it, so
+concurrent completions cannot move it backwards.
+
+A meal added to the catalog, or moved to an easier difficulty, can land before cursors that have already gone past
+it. In the same flush, every such cursor is moved back to the meal unless the user has completed it, which keeps the
+guarantee, and the moved users' meal tree and shopping list offer it as their next meal.
+
+"""
+
+
+def _at_or_after(difficulty, mealID):
+    # the leading range on mealDifficulty on its own lets the database seek into ix_meals_difficulty
+    return and_(Meal.mealDifficulty >= difficulty, or_(Meal.mealDifficulty > difficulty, Meal.mealID >= mealID))
+
+
+def _cursor_after(difficulty, mealID):
+    return or_(User.progressDifficulty > difficulty,
+               and_(User.progressDifficulty == difficulty, User.progressMealID > mealID))
+
+
+def _cursor_at_or_after(difficulty, mealID):
+    return or_(User.progressDifficulty > difficulty,
+               and_(User.progressDifficulty == difficulty, User.progressMealID >= mealID))
+
+
+def _completed_meal_ids(user_id):
+    return select(UserMeal.meal_id).where(UserMeal.user_id == user_id, UserMeal.completed == True)
+
+
+def progress_cursor(user):
+    return user.progressDifficulty or 0, user.progressMealID or 0
+
+
+def next_meals_query(user_id, cursor, limit=1, allergen_mask=0):
+    query = (select(Meal.mealID)
+             .where(_at_or_after(*cursor), Meal.mealID.not_in(_completed_meal_ids(user_id)))
+             .order_by(Meal.mealDifficulty, Meal.mealID)
+             .limit(limit))
+    if allergen_mask:
+        query = query.where(Meal.allergen_mask.op('&')(allergen_mask) == 0)
+    return query
+
+
+def next_meal_ids(user_id, cursor, limit=1, allergen_mask=0):
+    """Returns the IDs of the user's next uncompleted meals in progression order, optionally skipping meals that
+    contain any allergen in allergen_mask"""
+    return db.session.execute(next_meals_query(user_id, cursor, limit, allergen_mask)).scalars().all()
+
+
+def completed_from_cursor_query(user_id, cursor):
+    return (select(UserMeal.meal_id).join(Meal, Meal.mealID == UserMeal.meal_id)
+            .where(UserMeal.user_id == user_id, UserMeal.completed == True, _at_or_after(*cursor)))
+
+
+def completed_from_cursor(user_id, cursor):
+    """Returns the IDs of meals the user completed out of order, at or after their cursor"""
+    return set(db.session.execute(completed_from_cursor_query(user_id, cursor)).scalars())
+
+
+def is_completed(meal, cursor, completedFromCursor):
+    return (meal.mealDifficulty, meal.mealID) < cursor or meal.mealID in completedFromCursor
+
+
+def advance_progress(user_id, cursor):
+    """Moves the user's cursor up to their first uncompleted meal. Must be called after the completed UserMeal has been
+    flushed, and never moves the cursor backwards if another request has already advanced it further"""
+    nextMeal = db.session.execute(
+        next_meals_query(user_id, cursor).with_only_columns(Meal.mealDifficulty, Meal.mealID)
+    ).first()
+    if nextMeal is None or tuple(nextMeal) == cursor:
+        return
+
+    difficulty, mealID = nextMeal
+    db.session.execute(
+        update(User)
+        # never past the next meal, and not at all if a new meal has moved the cursor back before the one read
+        .where(User.id == user_id, ~_cursor_at_or_after(difficulty, mealID), _cursor_at_or_after(*cursor))
+        .values(progressDifficulty=difficulty, progressMealID=mealID, **progress_values())
+        .execution_options(synchronize_session=False)
+    )
+    evict_identity(user_id)
+
+
+def rewind_cursors(connection, difficulty, mealID):
+    """Moves every cursor past the meal at (difficulty, mealID) back to it, unless the user has completed it"""
+    return connection.execute(
+        update(User)
+        .where(_cursor_after(difficulty, mealID),
+               User.id.not_in(select(UserMeal.user_id).where(UserMeal.meal_id == mealID, UserMeal.completed == True)))
+        .values(progressDifficulty=difficulty, progressMealID=mealID, **progress_values())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def _moved_meals(session):
+    for instance in session.new | session.dirty:
+        if isinstance(instance, Meal) and (instance in session.new or
+                                           inspect(instance).attrs.mealDifficulty.history.has_changes()):
+            yield instance
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _rewind_on_new_meal(session, flush_context):
+    moved = 0
+    for meal in _moved_meals(session):
+        moved += rewind_cursors(session.connection(), meal.mealDifficulty, meal.mealID)
+    if moved:
+        # the cursors are cached with the identities, and rewinding touched an unknown set of users
+        clear_identities()
+        session.info['rewound_cursors'] = True
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _forget_rewound_identities(session):
+    # again once committed, in case another request cached an identity from before the rewind in the meantime
+    if session.info.pop('rewound_cursors', False):
+        clear_identities()
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _forget_rewind(session):
+    session.info.pop('rewound_cursors', None)
@@ -0,0 +1,169 @@
+import re
+from collections import namedtuple
+
+"""
+
+Parses the comma separated ingredient lists in Meal.recipe into quantity, unit and name, so that the same ingredient in
+different meals can be added up on the shopping list. Preparation words, such as "chopped" or "minced", are kept
+separately from the name, so "1 chopped onion" and "1 diced onion" are both counted as onions, and so is a clause after
+the comma with no quantity, such as the "finely chopped" in "1 onion, finely chopped". Names are matched in the singular,
+and the name as written is kept for display, so "1 cup of mushrooms" is still listed as mushrooms. Anything that cannot
+be parsed is kept as written, with no quantity.
+
+"""
+
+ParsedIngredient = namedtuple('ParsedIngredient', ['position', 'quantity', 'unit', 'name', 'display_name',
+                                                   'preparation', 'text'])
+
+UNITS = {
+    'cup': 'cup', 'cups': 'cup',
+    'tablespoon': 'tablespoon', 'tablespoons': 'tablespoon', 'tbsp': 'tablespoon',
+    'teaspoon': 'teaspoon', 'teaspoons': 'teaspoon', 'tsp': 'teaspoon',
+    'clove': 'clove', 'cloves': 'clove',
+    'can': 'can', 'cans': 'can', 'tin': 'can', 'tins': 'can',
+    'pinch': 'pinch', 'pinches': 'pinch',
+    'handful': 'handful', 'handfuls': 'handful',
+    'block': 'block', 'blocks': 'block',
+    'slice': 'slice', 'slices': 'slice',
+    'g': 'g', 'gram': 'g', 'grams': 'g',
+    'kg': 'kg', 'ml': 'ml', 'l': 'l', 'litre': 'l', 'litres': 'l',
+}
+
+PREPARATIONS = {'chopped', 'diced', 'sliced', 'minced', 'grated', 'cooked', 'finely', 'roughly', 'large', 'medium',
+                'small', 'fresh', 'frozen', 'crushed', 'peeled', 'drained', 'rinsed'}
+
+WORD_NUMBERS = {'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'half': 0.5}
+
+_quantityPattern = re.compile(
+    r'^(?P<whole>\d+(?:\.\d+)?)?\s*(?:(?P<numerator>\d+)/(?P<denominator>\d+))?'
+    r'(?P<half>\s+and\s+a\s+half)?\s+'
+)
+_wordQuantityPattern = re.compile(r'^(?P<word>a|an|one|two|three|four|five|six|half)\s+', re.IGNORECASE)
+_bracketPattern = re.compile(r'\s*\(([^)]*)\)')
+
+
+def split_recipe(recipe):
+    """Splits a recipe on the commas that are not inside brackets"""
+    parts, depth, current = [], 0, []
+    for character in recipe or '':
+        if character == '(':
+            depth += 1
+        elif character == ')':
+            depth = max(depth - 1, 0)
+        if character == ',' and depth == 0:
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(character)
+    parts.append(''.join(current))
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _singular(word):
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def parse_quantity(text):
+    """Returns (quantity, rest of the text), or (None, text) if it does not start with a quantity"""
+    match = _quantityPattern.match(text)
+    if match and (match.group('whole') or match.group('numerator')):
+        quantity = float(match.group('whole') or 0)
+        if match.group('numerator'):
+            quantity += int(match.group('numerator')) / int(match.group('denominator'))
+        if match.group('half'):
+            quantity += 0.5
+        return quantity, text[match.end():]
+
+    match = _wordQuantityPattern.match(text)
+    if match:
+        return float(WORD_NUMBERS[match.group('word').lower()]), text[match.end():]
+    return None, text
+
+
+def parse_ingredient(text, position=0):
+    quantity, rest = parse_quantity(text)
+
+    notes = _bracketPattern.findall(rest)
+    rest = _bracketPattern.sub('', rest)
+
+    words = rest.split()
+    unit = None
+    if quantity is not None and words and words[0].lower() in UNITS:
+        unit = UNITS[words.pop(0).lower()]
+        if words and words[0].lower() == 'of':
+            words.pop(0)
+
+    preparation = []
+    while len(words) > 1 and words[0].lower() in PREPARATIONS:
+        preparation.append(words.pop(0).lower())
+
+    name = displayName = ' '.join(words).lower()
+    if quantity is not None and words:
+        # "2 onions" and "1 onion" are the same ingredient
+        name = ' '.join(words[:-1] + [_singular(words[-1])]).lower()
+
+    preparation = ' '.join(preparation + notes) or None
+    return ParsedIngredient(position, quantity, unit, name or text.lower(), displayName or text.lower(), preparation,
+                            text)
+
+
+def is_preparation(text):
+    """Whether a part of a recipe with no quantity describes how to prepare the ingredient before it, such as "finely
+    chopped" or "tops cut off and seeds removed", rather than being an ingredient of its own, such as "salt and pepper".
+    Ingredient names can start with a preparation, "dried oregano", so it has to end with one"""
+    quantity, _ = parse_quantity(text)
+    words = _bracketPattern.sub('', text).lower().split()
+    if quantity is not None or not words:
+        return False
+    return words[-1] in PREPARATIONS or words[-1].endswith('ed') or words[0] in ('cut', 'to')
+
+
+def parse_recipe(recipe):
+    parsed = []
+    for text in split_recipe(recipe):
+        if parsed and is_preparation(text):
+            # "4 large bell peppers, tops cut off and seeds removed" is one ingredient
+            previous = parsed[-1]
+            preparation = ', '.join(filter(None, [previous.preparation, text.lower()]))
+            parsed[-1] = previous._replace(preparation=preparation, text=f'{previous.text}, {text}')
+        else:
+            parsed.append(parse_ingredient(text, len(parsed)))
+    return parsed
+
+
+def plural(name, display_name, quantity, unit):
+    """Returns the name to list an ingredient under. Counted ingredients are pluralized by how many are needed, so
+    "1 onion" but "2 onions", and measured ones keep the name as the recipe wrote it, so "2 cups broccoli florets" but
+    "2 cups brown rice" """
+    if unit or quantity is None:
+        return display_name or name
+    if quantity <= 1:
+        return name
+    return name + 'es' if name.endswith(('o', 'ch', 'sh')) else name + 's'
+
+
+def format_quantity(quantity, unit):
+    """Returns a readable amount, such as "1 1/2 cups", or an empty string if there is no quantity"""
+    if quantity is None:
+        return ''
+
+    whole = int(quantity)
+    fraction = {0.25: '1/4', 0.5: '1/2', 0.75: '3/4'}.get(round(quantity - whole, 2))
+    if fraction:
+        amount = f'{whole} {fraction}' if whole else fraction
+    elif quantity == whole:
+        amount = str(whole)
+    else:
+        amount = f'{quantity:.2f}'.rstrip('0').rstrip('.')
+
+    if not unit:
+        return amount
+    if unit in ('g', 'kg', 'ml', 'l') or quantity <= 1:
+        return f'{amount} {unit}'
+    return f'{amount} {unit}es' if unit.endswith('ch') else f'{amount} {unit}s'
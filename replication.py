@@ -0,0 +1,83 @@
+import logging
+import threading
+import time
+import click
+from app import app, db
+
+"""
+
+Replication stand-in, for trying read replicas locally with SQLite files. replicate copies the primary database into
+every replica with SQLite's online backup API, which reads a consistent snapshot of the primary while the application
+keeps using it, so the replicas are never half updated, only behind. Run "flask --app app replicate" once to create
+the replica files, then either keep "flask --app app replicate --interval 1" running, or set REPLICATION_INTERVAL to
+have one application process copy them that often in a background thread.
+
+Only for development and benchmarks. A production database replicates itself, and only the routing in routing.py is
+needed there.
+
+"""
+
+
+def replicate():
+    """Copies the primary into every replica bind, returning how long it took"""
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('The replication stand-in only copies SQLite databases')
+
+    started = time.perf_counter()
+    source = db.engine.raw_connection()
+    try:
+        for bind in app.config['REPLICA_BINDS']:
+            target = db.engines[bind].raw_connection()
+            try:
+                source.driver_connection.backup(target.driver_connection)
+            finally:
+                target.close()
+    finally:
+        source.close()
+    return time.perf_counter() - started
+
+
+class Replicator(threading.Thread):
+    """Background thread that copies the primary into the replicas every REPLICATION_INTERVAL seconds"""
+
+    def __init__(self):
+        super().__init__(name='replicator', daemon=True)
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(app.config['REPLICATION_INTERVAL']):
+            try:
+                with app.app_context():
+                    replicate()
+            except Exception:
+                logging.exception('REPLICATION - copying the primary failed')
+
+    def stop(self):
+        self.stopped.set()
+
+
+_replicator = None
+
+
+def start_replicator():
+    global _replicator
+    if _replicator is None:
+        _replicator = Replicator()
+        _replicator.start()
+    return _replicator
+
+
+@app.cli.command('replicate')
+@click.option('--interval', type=float, help='Keep copying, waiting this many seconds between copies.')
+def replicate_command(interval):
+    """Copies the primary SQLite database into every replica."""
+    if not app.config['REPLICA_BINDS']:
+        click.echo('No replicas are configured, set SQLALCHEMY_REPLICA_URIS')
+        return
+
+    while True:
+        seconds = replicate()
+        click.echo(f'Copied the primary to {len(app.config["REPLICA_BINDS"])} replicas in {seconds * 1000:.0f}ms')
+        if not interval:
+            return
+        time.sleep(interval)
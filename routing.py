@@ -0,0 +1,66 @@
+import random
+import time
+from flask import current_app, g, has_request_context, request
+from flask import session as flask_session
+from flask_sqlalchemy.session import Session
+
+"""
+
+Read/write routing for read replicas. When replicas are configured with SQLALCHEMY_REPLICA_URIS, the SELECTs a GET
+request runs go to one of them, picked at random once per request, and everything else goes to the primary: every
+write, every statement of any other kind of request, and everything run outside a request, such as the CLI commands
+and the scheduler.
+
+Replicas lag the primary, so once a request writes, the rest of it reads from the primary too, and so do that
+browser's requests for the next REPLICA_STICKY_SECONDS, which is how the page someone is redirected to after a POST
+shows what they just did. REPLICA_STICKY_SECONDS should be longer than the replicas usually lag by.
+
+This module is imported before db is created, so it cannot import app, see app.py. replication.py keeps SQLite replica
+files in step with the primary for trying this locally.
+
+"""
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# the time until which this browser reads from the primary, in its session cookie
+PRIMARY_UNTIL = '_primary_until'
+
+
+def _is_read(clause):
+    return clause is not None and getattr(clause, 'is_select', False)
+
+
+def stick_to_primary():
+    """Sends the rest of this request, and this browser's requests for the next REPLICA_STICKY_SECONDS, to the
+    primary"""
+    if has_request_context() and current_app.config['REPLICA_BINDS'] and not g.get('usePrimary'):
+        g.usePrimary = True
+        flask_session[PRIMARY_UNTIL] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+
+
+def replica_bind():
+    """Returns the replica bind key this request reads from, or None if it should read from the primary"""
+    if not has_request_context() or request.method not in READ_METHODS:
+        return None
+    binds = current_app.config['REPLICA_BINDS']
+    if not binds or g.get('usePrimary') or flask_session.get(PRIMARY_UNTIL, 0) > time.time():
+        return None
+
+    if 'replicaBind' not in g:
+        g.replicaBind = random.choice(binds)
+    return g.replicaBind
+
+
+class RoutingSession(Session):
+    """Session that sends a GET request's reads to a replica, and everything else to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                stick_to_primary()
+            elif _is_read(clause):
+                replica = replica_bind()
+                if replica is not None:
+                    return self._db.engines[replica]
+        # writes, and anything that is not a SELECT such as a PRAGMA, run on the primary
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
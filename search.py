@@ -0,0 +1,49 @@
+import re
+from sqlalchemy import select, table, column
+from app import app, db
+from models import User
+from streaming import PageStream
+
+"""
+
+Full text search over users, backed by the users_fts FTS5 index declared alongside the User model. Results are ranked
+by relevance, every word of the query is matched as a prefix, and results are paged. Other databases fall back to a
+bounded ILIKE search.
+
+"""
+
+_usersFts = table('users_fts', column('rowid'), column('rank'), column('users_fts'))
+
+
+def match_expression(query):
+    """Turns free text into an FTS5 query where every word must match the start of a word in the index"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_query(query, exclude_id, page=1, page_size=20):
+    """Builds the statement for one page of search results, best matches first. One extra row is fetched so the caller
+    can tell whether another page follows"""
+    offset = (page - 1) * page_size
+
+    if db.engine.dialect.name != 'sqlite':
+        pattern = f'%{query}%'
+        return (select(User)
+                .where(User.id != exclude_id,
+                       User.firstname.ilike(pattern) | User.lastname.ilike(pattern) | User.email.ilike(pattern))
+                .order_by(User.id).limit(page_size + 1).offset(offset))
+
+    return (select(User)
+            .join(_usersFts, _usersFts.c.rowid == User.id)
+            .where(_usersFts.c.users_fts.op('MATCH')(match_expression(query)), User.id != exclude_id)
+            .order_by(_usersFts.c.rank)
+            .limit(page_size + 1).offset(offset))
+
+
+def search_users(query, exclude_id, page=1, page_size=None):
+    """Returns a page of users matching the query, excluding the user who is searching, as a PageStream that reads them
+    as they are rendered. Its has_more says whether there are more"""
+    page_size = page_size or app.config['SEARCH_PAGE_SIZE']
+    if not match_expression(query):
+        return PageStream(None, page_size)
+    return PageStream(search_query(query, exclude_id, page, page_size), page_size)
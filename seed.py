@@ -0,0 +1,176 @@
+import click
+from sqlalchemy import select
+from app import app, db
+from models import User, Meal, Quiz
+from users.quizQuestions import easy_quiz, intermediate_quiz, advanced_quiz
+
+"""
+
+Idempotent loader for the base catalog of meals and quizzes, plus the test users that are useful when trying out the
+application. Everything is added in a single transaction, and anything that is already present (matched on meal name,
+quiz name or user email) is skipped, so it is safe to run on every deploy. New quizzes or meal recipes can be added
+here as desired. Run with "flask --app app seed-db", adding --with-test-users outside of production.
+
+It is important to note, that quiz and meal content have been generated by OpenAI’s ‘Chat Generative Pre-Trained
+Transformer, model 3.5’, and not by myself. This is for prototype demonstration purposes, and each meal recipe,
+quiz title, quiz questions and answers have been generated using artificial intelligence This is because I am not
+an expert in designing quiz questions or meal recipes, and the focus of this project is the computer science
+and software engineering aspects applied in creating this project, which have all been written by myself alone.
+
+Once again, quiz and meal recipe content, is purely mock up data.
+
+"""
+
+TEST_USERS = [
+    dict(email='test@emailUser.com', firstname='Max', lastname='Ramage', password='userPassword!', role='user',
+         completed_onboarding=True),
+    dict(email='test@email.com', firstname='Jane', lastname='Doe', password='userPassword!', role='user',
+         completed_onboarding=False),
+]
+
+
+def base_meals():
+    """Returns the meals that make up the meal progression tree"""
+    easyMeal = Meal(mealName="Simple Stir Fry", mealDescription="A simple and tasty stir fry meal, which is a "
+                                                                "core foundation in any home chefs repertoire of "
+                                                                "recipes!",
+                    recipe="1 cup of cooked brown rice,"
+                           "2 tablespoons olive oil,"
+                           "1 sliced bell pepper,"
+                           "1 cup of broccoli florets,"
+                           "2 cloves of minced garlic,"
+                           "2 tablespoons of soy sauce,"
+                           "salt and pepper",
+                    recipeInstructions="1. Heat the olive oil in a large pan over medium heat,"
+                                       "2. Add the bell pepper, carrot, broccoli, and mushrooms. Sauté for about "
+                                       "5-7 minutes or until vegetables are tender "
+                                       "3. Add the minced garlic and sauté for another minute,"
+                                       "4. In a small bowl, mix the soy sauce and maple syrup. Pour this mixture "
+                                       "over the vegetables, "
+                                       "5. Stir well to combine everything and cook for another 2 minutes,"
+                                       "6. Serve the stir-fry over the cooked brown rice.",
+                    mealDifficulty=1,
+                    imageUrl="https://www.eatingbyelaine.com/wp-content/uploads/2023/10/EBE-Veggie-Stir-Fry-34.jpg",
+                    veganCo2=1.5, meatCo2=2.3)
+
+    intermediateMeal = Meal(mealName="Intermediate Vegetable Curry",
+                            mealDescription="An intermediate vegetable curry, "
+                                            "that is full of flavour and is "
+                                            "guarenteed to enhance your cooking "
+                                            "skills!",
+                            recipe="2 tablespoons of coconut oil,"
+                                   "1 chopped onion,"
+                                   "1 chopped bell pepper,"
+                                   "1 chopped carrot,"
+                                   "1 cup of broccoli florets,"
+                                   "1 cup of diced tomatoes (canned or fresh),"
+                                   "1 tablespoon of curry powder,"
+                                   "1 teaspoon of turmeric,"
+                                   "1 can of coconut milk,"
+                                   "Salt and pepper",
+                            recipeInstructions="1. Use the cooked brown rice set aside from the "
+                                               "previous recipe or cook a fresh batch,"
+                                               "2. Heat coconut oil in a large pot over medium "
+                                               "heat, "
+                                               "3. Add the onion and sauté until translucent,"
+                                               "4. Add the bell pepper, carrot, and broccoli. "
+                                               "Cook for about 5 minutes, "
+                                               "5. Stir in the curry powder and turmeric, "
+                                               "cooking for another minute until fragrant, "
+                                               "6. Add the diced tomatoes and coconut milk. "
+                                               "Bring to a simmer, "
+                                               "7. Reduce heat and let it simmer for 15-20 "
+                                               "minutes, or until the vegetables are tender "
+                                               "and the flavors have melded together, "
+                                               "8. Season with salt and pepper,"
+                                               "9. Serve the curry over brown rice.",
+                            mealDifficulty=2,
+                            imageUrl="https://fullofplants.com/wp-content/uploads/2019/07/easy-spicy-vietnamese"
+                                     "-curry-vegan-vegetarian-with-tofu-mushrooms-broccoli-taro-eggplant-24"
+                                     "-1400x2100.jpg", veganCo2=1.2, meatCo2=2.6)
+
+    advancedMeal = Meal(mealName="Advanced Stuffed Peppers",
+                        mealDescription="An advanced and tasty recipe, that will provide a challenge to your "
+                                        "vegan cooking skills, and enhance your overall ability nicely.",
+                        recipe="4 large bell peppers, tops cut off and seeds removed,"
+                               "1 tablespoon olive oil,"
+                               "1 diced onion,"
+                               "2 cloves of minced garlic,"
+                               "1 diced carrot,"
+                               "1 cup of chopped mushrooms,"
+                               "1 cup of finely chopped broccoli florets,"
+                               "1 teaspoon of cumin,"
+                               "1 teaspoon of paprika,"
+                               "1 and a half cups of cooked brown rice,"
+                               "Salt and pepper",
+                        recipeInstructions="1. Preheat the oven to 375°F (190°C),"
+                                           "2. In a skillet, heat olive oil over medium heat. Add onion and "
+                                           "garlic, and saute until onion is translucent, "
+                                           "3. Add the carrot, mushrooms, and broccoli. Cook until vegetables are "
+                                           "slightly tender, "
+                                           "4. Stir in cumin, paprika, and then the cooked rice and mix well, "
+                                           "5. Add the diced tomatoes and season with salt and pepper. Cook for a "
+                                           "few more minutes until everything is heated through, "
+                                           "6. Stuff the mixture into the hollowed-out bell peppers, "
+                                           "7. Place the stuffed peppers in a baking dish and cover with foil, "
+                                           "8. Bake for 30-35 minutes, or until the peppers are tender,"
+                                           "9. Serve hot, possibly with a side of green salad",
+                        mealDifficulty=3,
+                        imageUrl="https://www.aheadofthyme.com/wp-content/uploads/2018/07/vegan-stuffed-peppers.jpg", veganCo2=2.3, meatCo2=3.4)
+
+    return [easyMeal, intermediateMeal, advancedMeal]
+
+
+def base_quizzes():
+    """Returns (quiz, questions) pairs for the knowledge base"""
+    return [easy_quiz(), intermediate_quiz(), advanced_quiz()]
+
+
+def seed(with_test_users=False):
+    """Adds any missing catalog content, and optionally the test users, in one transaction. Returns how many meals,
+    quizzes and users were added"""
+    existingMeals = set(db.session.execute(select(Meal.mealName)).scalars())
+    existingQuizzes = set(db.session.execute(select(Quiz.quizName)).scalars())
+
+    meals = [meal for meal in base_meals() if meal.mealName not in existingMeals]
+    db.session.add_all(meals)
+
+    quizzes = 0
+    for quiz, questions in base_quizzes():
+        if quiz.quizName in existingQuizzes:
+            continue
+        db.session.add(quiz)
+        for question in questions:
+            question.quiz = quiz
+        db.session.add_all(questions)
+        quizzes += 1
+
+    users = 0
+    if with_test_users:
+        existingEmails = set(db.session.execute(
+            select(User.email).where(User.email.in_([user['email'] for user in TEST_USERS]))
+        ).scalars())
+        for user in TEST_USERS:
+            if user['email'] not in existingEmails:
+                db.session.add(User(**user))
+                users += 1
+
+    db.session.commit()
+    return len(meals), quizzes, users
+
+
+@app.cli.command('seed-db')
+@click.option('--with-test-users', is_flag=True, help='Also add the test users, do not use in production.')
+def seed_db_command(with_test_users):
+    """Loads any missing base meals and quizzes."""
+    meals, quizzes, users = seed(with_test_users)
+    click.echo(f'Added {meals} meals, {quizzes} quizzes and {users} users')
+
+
+@app.cli.command('reset-db')
+@click.confirmation_option(prompt='This deletes everything in the database, continue?')
+def reset_db_command():
+    """Drops every table, then recreates the schema and loads the base catalog and test users."""
+    from models import init_db
+    init_db()
+    click.echo('Database reset')
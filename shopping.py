@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict, namedtuple
+from sqlalchemy import select, func
+from app import app, db
+from models import Ingredient
+from catalog import catalog_version
+from recipes import format_quantity, plural
+
+"""
+
+Shopping list for the next meals in a user's progression. The ingredients of every meal are parsed into the
+ingredients table when the recipe is saved, so the list is one GROUP BY query that adds up each ingredient by name and
+unit across the meals. The result only depends on which meals are on the list, so it is cached by their IDs and the
+catalog version, and every user at the same point in the progression shares the same entry.
+
+"""
+
+ShoppingItem = namedtuple('ShoppingItem', ['name', 'unit', 'quantity', 'amount', 'meals'])
+
+_lists = OrderedDict()
+_lock = threading.Lock()
+
+
+def shopping_list_query(mealIDs):
+    return (select(Ingredient.name, func.max(Ingredient.display_name), Ingredient.unit, func.sum(Ingredient.quantity),
+                   func.count(func.distinct(Ingredient.meal_id)))
+            .where(Ingredient.meal_id.in_(mealIDs))
+            .group_by(Ingredient.name, Ingredient.unit)
+            .order_by(Ingredient.name, Ingredient.unit))
+
+
+def _load_shopping_list(mealIDs):
+    return tuple(ShoppingItem(name=plural(name, displayName, quantity, unit), unit=unit, quantity=quantity,
+                              amount=format_quantity(quantity, unit), meals=meals)
+                 for name, displayName, unit, quantity, meals in db.session.execute(shopping_list_query(mealIDs)))
+
+
+def shopping_list(mealIDs):
+    """Returns the ingredients needed for all of the meals, with the amounts of each added together"""
+    if not mealIDs:
+        return ()
+
+    key = (tuple(mealIDs), catalog_version()[0])
+    with _lock:
+        items = _lists.get(key)
+        if items is not None:
+            _lists.move_to_end(key)
+            return items
+
+    items = _load_shopping_list(mealIDs)
+    with _lock:
+        _lists[key] = items
+        while len(_lists) > app.config['SHOPPING_LIST_CACHE_SIZE']:
+            _lists.popitem(last=False)
+    return items
+
+
+def clear_shopping_lists():
+    with _lock:
+        _lists.clear()
@@ -0,0 +1,71 @@
+from flask import get_flashed_messages, render_template, stream_template
+from app import app, db
+
+"""
+
+Streamed rendering for the pages that list an open ended number of rows, the home feed and user search. The template
+is sent to the client in chunks of about STREAM_CHUNK_SIZE characters as it renders, so the top of the page goes out
+before the rows below it have been formatted, and the rows are read from the database STREAM_YIELD_PER at a time as
+the template loops over them, so only one batch of them is held in memory at once however long the page is.
+
+The session cookie goes out with the headers, before anything is rendered, so stream_page takes any flashed messages
+out of the session first. Set STREAM_PAGES to false to render these pages in full before sending them.
+
+"""
+
+
+class PageStream:
+    """One page of rows from a statement that fetches one row more than the page, read as the template iterates over
+    it. The extra row is not yielded, it only tells whether another page follows: once iteration has finished,
+    has_more says whether it does, and next_cursor holds cursor(last row on the page). Can only be iterated once"""
+
+    def __init__(self, statement, page_size, cursor=None):
+        self.statement = statement
+        self.page_size = page_size
+        self.cursor = cursor
+        self.count = 0
+        self.has_more = False
+        self.next_cursor = None
+
+    def __iter__(self):
+        if self.statement is None:
+            return
+
+        result = db.session.execute(
+            self.statement.execution_options(yield_per=app.config['STREAM_YIELD_PER'])
+        ).scalars()
+        try:
+            last = None
+            for row in result:
+                if self.count == self.page_size:
+                    self.has_more = True
+                    self.next_cursor = self.cursor(last) if self.cursor else None
+                    break
+                self.count += 1
+                last = row
+                yield row
+        finally:
+            result.close()
+
+
+def _buffered(chunks, size):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_page(template_name, **context):
+    """Renders the template to the client as it goes"""
+    if not app.config['STREAM_PAGES']:
+        return render_template(template_name, **context)
+
+    # read the flashed messages now, so they are removed from the session before its cookie is sent
+    get_flashed_messages(with_categories=True)
+    return app.response_class(_buffered(stream_template(template_name, **context), app.config['STREAM_CHUNK_SIZE']),
+                              mimetype='text/html')
@@ -0,0 +1,233 @@
+import random
+import time
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, insert, update, func
+from app import app, db
+from models import User, Friendship, Post, Meal, UserMeal, Quiz, Question, UserQuiz, QuizAttempt, LedgerEntry
+from models import ALLERGEN_BITS, canonical_pair
+from passwords import hash_password
+from attempts import encode_answers
+from catalog import bump_catalog_version
+from co2 import rebuild_rollups
+from ledger import rebuild_totals, COUNTERS
+from friends import clear_friend_cache
+from leaderboard import clear_rankings
+from identity import clear_identities
+
+"""
+
+Synthetic data for trying the application, and benchmarking it, at production sizes. generate adds users who have
+friends, friend requests, posts, completed meals and quiz attempts, and optionally more quizzes, on top of whatever is
+already in the database. Run with "flask --app app generate-data --users 10000 --quizzes 20", never against production.
+
+The friendship graph grows by preferential attachment, so a few users have hundreds of friends while most have a
+handful, the way real social graphs do, and how many posts each user writes is heavy tailed too. Every completion
+is written to the ledger as the application would write it, and the users' totals and the CO2 rollups are then
+rebuilt from the ledger, so "audit-ledger" passes afterwards. Rows are inserted in chunks of GENERATE_CHUNK_SIZE with
+one statement each, and the generator is deterministic for a given --seed.
+
+Every generated user has the email user<number>@synthetic.example.com and the password SYNTHETIC_PASSWORD.
+
+"""
+
+SYNTHETIC_DOMAIN = 'synthetic.example.com'
+SYNTHETIC_PASSWORD = 'syntheticPassword!'
+GENERATE_CHUNK_SIZE = 5000
+
+FIRST_NAMES = ('Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Riley', 'Casey', 'Jamie', 'Robin', 'Avery', 'Quinn',
+               'Charlie', 'Rowan', 'Elliot', 'Harper', 'Kai', 'Noor', 'Priya', 'Mateo', 'Yuki', 'Amara', 'Luca')
+LAST_NAMES = ('Smith', 'Jones', 'Williams', 'Brown', 'Taylor', 'Davies', 'Evans', 'Patel', 'Khan', 'Nguyen',
+              'Garcia', 'Silva', 'Murphy', 'Kowalski', 'Okafor', 'Tanaka', 'Larsen', 'Rossi', 'Cohen', 'Walsh')
+REFLECTIONS = ('Cooked this for the first time tonight and it came out better than expected.',
+               'Took longer than the recipe said, but everyone at the table had seconds.',
+               'Swapped a couple of the vegetables for what was in the fridge and it still worked well.',
+               'A bit bland the first time round, more garlic and a squeeze of lemon next time.')
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def _insert(connection, model, rows):
+    for chunk in _chunks(rows, GENERATE_CHUNK_SIZE):
+        connection.execute(insert(model), chunk)
+
+
+def _heavy_tailed(rng, mean, cap):
+    # a Pareto variate with shape 2 has a mean of 2
+    return min(cap, int(rng.paretovariate(2) * mean / 2))
+
+
+def _group(cursors):
+    groups = {}
+    for user_id, cursor in cursors.items():
+        groups.setdefault(cursor, []).append(user_id)
+    return groups
+
+
+def _friend_pairs(rng, user_ids, friends_per_user):
+    """Yields (requester, requested) pairs, each new user befriending friends_per_user earlier users picked with
+    probability proportional to how many friends they already have, so the degrees follow a power law. One pick in ten
+    is uniform instead, so users who joined late still make friends with one another"""
+    endpoints = []
+    for position, user_id in enumerate(user_ids):
+        wanted = min(friends_per_user, position)
+        chosen = set()
+        while len(chosen) < wanted:
+            if endpoints and rng.random() < 0.9:
+                chosen.add(rng.choice(endpoints))
+            else:
+                chosen.add(user_ids[rng.randrange(position)])
+        for friend_id in chosen:
+            endpoints.extend((user_id, friend_id))
+            yield (user_id, friend_id) if rng.random() < 0.5 else (friend_id, user_id)
+
+
+def _quizzes(connection, rng, count, questions_per_quiz):
+    order = connection.execute(select(func.coalesce(func.max(Quiz.order), 0))).scalar()
+    quizIDs = []
+    for number in range(count):
+        quizIDs.append(connection.execute(insert(Quiz).values(
+            quizName=f'Synthetic Quiz {order + number + 1}', quizDescription='Generated quiz for load testing.',
+            order=order + number + 1)).inserted_primary_key[0])
+
+    _insert(connection, Question, [
+        dict(quizID=quizID, questionText=f'Generated question {position + 1}?', correctAnswer=f'Answer {position}',
+             otherOptions=[f'Option {position}{letter}' for letter in 'abc'])
+        for quizID in quizIDs for position in range(questions_per_quiz)])
+    if quizIDs:
+        bump_catalog_version(connection)
+    return quizIDs
+
+
+def generate(users, quizzes=0, friends_per_user=5, posts_per_user=3, questions_per_quiz=5, seed=0, report=None):
+    """Adds the synthetic users and their history, and the extra quizzes. Returns how many rows of each kind were
+    added"""
+    rng = random.Random(seed)
+    report = report or (lambda message: None)
+    now = datetime.utcnow()
+    counts = {}
+
+    with db.engine.begin() as connection:
+        counts['quizzes'] = len(_quizzes(connection, rng, quizzes, questions_per_quiz))
+
+        first = connection.execute(
+            select(func.count()).select_from(User).where(User.email.like(f'%@{SYNTHETIC_DOMAIN}'))
+        ).scalar()
+        # every user gets the same hash, hashing each password would take most of the run
+        password = hash_password(SYNTHETIC_PASSWORD)
+        allergens = list(ALLERGEN_BITS.values())
+        _insert(connection, User, [
+            dict(email=f'user{number}@{SYNTHETIC_DOMAIN}', firstname=rng.choice(FIRST_NAMES),
+                 lastname=rng.choice(LAST_NAMES), password=password, role='user', completed_onboarding=True,
+                 allergen_mask=rng.choice(allergens) if rng.random() < 0.2 else 0)
+            for number in range(first, first + users)])
+        emails = dict(connection.execute(
+            select(User.id, User.email).where(User.email.like(f'%@{SYNTHETIC_DOMAIN}')).order_by(User.id)
+            .offset(first)
+        ).all())
+        userIDs = list(emails)
+        counts['users'] = len(userIDs)
+        report(f'{len(userIDs)} users')
+
+        friendships = []
+        for requester, requested in _friend_pairs(rng, userIDs, friends_per_user):
+            low, high = canonical_pair(requester, requested)
+            friendships.append(dict(requester_id=requester, requested_id=requested, requester_email=emails[requester],
+                                    requested_email=emails[requested], user_low_id=low, user_high_id=high,
+                                    status='accepted' if rng.random() < 0.85 else 'pending'))
+        _insert(connection, Friendship, friendships)
+        counts['friendships'] = len(friendships)
+        report(f'{len(friendships)} friendships')
+
+        meals = connection.execute(
+            select(Meal.mealID, Meal.mealName, Meal.mealDifficulty, Meal.meatCo2, Meal.veganCo2)
+            .order_by(Meal.mealDifficulty, Meal.mealID)
+        ).all()
+        posts, userMeals, ledger = [], [], []
+        cursors = {}
+        for user_id in userIDs:
+            for _ in range(_heavy_tailed(rng, posts_per_user, posts_per_user * 50)):
+                meal = rng.choice(meals) if meals else None
+                posts.append(dict(user_id=user_id, email=emails[user_id],
+                                  title=f'Reflective account of {meal.mealName}' if meal else 'Reflective account',
+                                  body=rng.choice(REFLECTIONS), public=rng.random() < 0.6,
+                                  dateCreated=now - timedelta(minutes=rng.randrange(90 * 24 * 60))))
+
+            # meals are completed in progression order, so the cursor sits on the first one not yet completed
+            completed = rng.randint(0, len(meals))
+            for position, meal in enumerate(meals[:completed]):
+                when = now - timedelta(days=(completed - position) * 7, minutes=rng.randrange(24 * 60))
+                userMeals.append(dict(user_id=user_id, meal_id=meal.mealID, completed=True, completion_date=when))
+                ledger.append(dict(user_id=user_id, reason='meal', reference=meal.mealID, created=when,
+                                   experiencePoints=25, meals_completed=1, quizzes_completed=0,
+                                   totalMeatCo2=meal.meatCo2, totalVeganCo2=meal.veganCo2))
+            if completed:
+                cursor = meals[min(completed, len(meals) - 1)]
+                cursors[user_id] = (cursor.mealDifficulty, cursor.mealID)
+        _insert(connection, Post, posts)
+        _insert(connection, UserMeal, userMeals)
+        counts['posts'], counts['meals completed'] = len(posts), len(userMeals)
+        report(f'{len(posts)} posts, {len(userMeals)} meals completed')
+
+        for (difficulty, mealID), ids in _group(cursors).items():
+            for chunk in _chunks(ids, GENERATE_CHUNK_SIZE):
+                connection.execute(update(User).where(User.id.in_(chunk))
+                                   .values(progressDifficulty=difficulty, progressMealID=mealID))
+
+        answerKeys = {}
+        for quizID, questionID, correctAnswer, otherOptions in connection.execute(
+                select(Question.quizID, Question.questionID, Question.correctAnswer, Question.otherOptions)):
+            answerKeys.setdefault(quizID, []).append((questionID, correctAnswer, otherOptions or []))
+
+        userQuizzes, attempts = [], []
+        for user_id in userIDs:
+            for quizID, questions in answerKeys.items():
+                if rng.random() >= 0.4:
+                    continue
+                when = now - timedelta(minutes=rng.randrange(90 * 24 * 60))
+                answers = {questionID: correct if rng.random() < 0.7 else rng.choice(others or [correct])
+                           for questionID, correct, others in questions}
+                score = sum(answers[questionID] == correct for questionID, correct, _ in questions)
+                expAwarded = 2 + score * 2
+                userQuizzes.append(dict(user_id=user_id, quizID=quizID, completed=True, completionDate=when))
+                attempts.append(dict(user_id=user_id, quizID=quizID, answers=encode_answers(answers), score=score,
+                                     totalQuestions=len(questions), expAwarded=expAwarded, completionDate=when))
+                ledger.append(dict(user_id=user_id, reason='quiz', reference=quizID, created=when,
+                                   experiencePoints=expAwarded, meals_completed=0, quizzes_completed=1,
+                                   totalMeatCo2=0.0, totalVeganCo2=0.0))
+        _insert(connection, UserQuiz, userQuizzes)
+        _insert(connection, QuizAttempt, attempts)
+        counts['quizzes completed'] = len(userQuizzes)
+        report(f'{len(userQuizzes)} quizzes completed')
+
+        ledger.sort(key=lambda entry: entry['created'])
+        _insert(connection, LedgerEntry, [{column: entry[column] for column in
+                                           ('user_id', 'reason', 'reference', 'created', *COUNTERS)}
+                                          for entry in ledger])
+        rebuild_rollups(connection)
+        counts['ledger entries'] = len(ledger)
+
+    rebuild_totals()
+    db.session.commit()
+    clear_friend_cache()
+    clear_rankings()
+    clear_identities()
+    return counts
+
+
+@app.cli.command('generate-data')
+@click.option('--users', type=int, default=1000, show_default=True)
+@click.option('--quizzes', type=int, default=0, show_default=True, help='Quizzes to add to the catalog.')
+@click.option('--friends', type=int, default=5, show_default=True, help='Friends each new user adds.')
+@click.option('--posts', type=int, default=3, show_default=True, help='Average posts per user.')
+@click.option('--questions', type=int, default=5, show_default=True, help='Questions in each added quiz.')
+@click.option('--seed', type=int, default=0, show_default=True, help='Random seed, the same seed adds the same data.')
+def generate_data_command(users, quizzes, friends, posts, questions, seed):
+    """Adds synthetic users, friendships, posts, meal and quiz history, and quizzes. Never run in production."""
+    started = time.perf_counter()
+    counts = generate(users, quizzes, friends, posts, questions, seed, report=click.echo)
+    click.echo(', '.join(f'{count} {name}' for name, count in counts.items()) +
+               f' added in {time.perf_counter() - started:.1f}s')
@@ -1,11 +1,15 @@
 import logging
 from datetime import datetime
-import bcrypt
-from flask import Blueprint, render_template, flash, redirect, url_for, request, session
+from flask import Blueprint, render_template, flash, redirect, url_for, request, session, abort, jsonify
 from flask_login import login_user, current_user, login_required, logout_user
 from flask_login import current_user
-from app import db
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from app import app, db
 from users.forms import RegisterForm, LoginForm
+from passwords import check_password, needs_rehash, hash_password
+from conditional import conditional, progress_values
+from budgets import query_budget
 
 users_blueprint = Blueprint('users', __name__, template_folder='templates')
 
@@ -19,9 +23,13 @@ def login():
 
         if not user:
             flash('There is no user with the email address you entered', 'error')
-        elif not bcrypt.checkpw(form.password.data.encode('utf-8'), user.password):
+        elif not check_password(form.password.data, user.password):
             flash('Incorrect password', 'error')
         else:
+            if needs_rehash(user.password):
+                user.password = hash_password(form.password.data)
+                db.session.commit()
+
             login_user(user)
 
             if not user.completed_onboarding:
@@ -36,10 +44,62 @@ def login():
 
 @users_blueprint.route('/profile')
 @login_required
+@conditional(lambda: rank_of(current_user.id))
+@query_budget(6)
 def profile():
     user_id = current_user.id
+    rank, _ = rank_of(user_id)
+
+    return render_template('users/profile.html', name=current_user.firstname, rank=rank)
+
+
+@users_blueprint.route('/leaderboard')
+@login_required
+@query_budget(7)
+def leaderboard():
+    friendsOnly = request.args.get('scope') == 'friends'
+
+    if friendsOnly:
+        return render_template('users/leaderboard.html', friends_only=True,
+                               friends=leaderboards.friends(current_user.id))
+
+    rank, experiencePoints = rank_of(current_user.id)
+    return render_template('users/leaderboard.html', friends_only=False, top=leaderboards.top(),
+                           around=leaderboards.around(current_user.id), rank=rank,
+                           experience_points=experiencePoints)
+
+
+def _co2_scope_series():
+    scope = request.args.get('scope', 'me')
+    if scope not in ('me', 'friends', 'everyone'):
+        abort(400)
+    try:
+        start, end = date_range(request.args.get('start'), request.args.get('end'))
+    except ValueError:
+        abort(400)
+
+    userIDs = {'me': [current_user.id], 'friends': get_friend_ids(current_user.id) | {current_user.id},
+               'everyone': None}[scope]
+    return scope, start, end, co2_series(start, end, userIDs)
+
+
+@users_blueprint.route('/co2')
+@login_required
+@query_budget(3)
+def co2_dashboard():
+    scope, start, end, series = _co2_scope_series()
+    mostSaved = max([day['co2Saved'] for day in series] + [0])
+    return render_template('users/co2.html', scope=scope, start=start, end=end, series=series,
+                           totals=co2_totals(series), most_saved=mostSaved)
+
 
-    return render_template('users/profile.html', name=current_user.firstname)
+@users_blueprint.route('/api/co2')
+@login_required
+@query_budget(3)
+def co2_json():
+    scope, start, end, series = _co2_scope_series()
+    return jsonify(scope=scope, start=start.isoformat(), end=end.isoformat(), totals=co2_totals(series),
+                   days=series)
 
 
 @users_blueprint.route('/account')
@@ -52,7 +112,19 @@ def account():
                            lastname=current_user.lastname)
 
 
-from models import User, Meal, UserMeal, Quiz, UserQuiz, Question, Friendship, Post
+from models import User, UserMeal, UserQuiz, QuizAttempt, Friendship, Post, canonical_pair, allergen_mask
+from friends import friendship_accepted, friendship_declined, get_friend_ids
+from search import search_users as find_users
+from streaming import stream_page
+from catalog import get_catalog, get_meal, get_quiz, get_questions, safe_meals
+from progression import progress_cursor, next_meal_ids, completed_from_cursor, is_completed, advance_progress
+from attempts import grade_attempt, review_attempt, attempt_history
+from ledger import award, claim_daily_reward
+import leaderboard as leaderboards
+from leaderboard import rank_of
+from identity import evict_identity
+from co2 import co2_series, co2_totals, date_range
+from shopping import shopping_list as build_shopping_list
 
 
 @users_blueprint.route('/register', methods=['GET', 'POST'])
@@ -95,57 +167,26 @@ def register():
 
 
 @users_blueprint.route('/termsAndConditions')
+@conditional()
+@query_budget(3)
 def terms_and_conditions():
     return render_template('users/termsAndConditions.html')
 
 
 @users_blueprint.route('/updateAllergies', methods=['GET', 'POST'])
 @login_required
+@query_budget(2)
 def updateAllergies():
-    current_user.allergic_to_celery = False
-    current_user.allergic_to_gluten = False
-    current_user.allergic_to_lupin = False
-    current_user.allergic_to_mustard = False
-    current_user.allergic_to_peanuts = False
-    current_user.allergic_to_sesame = False
-    current_user.allergic_to_soybeans = False
-    current_user.allergic_to_sulphur_dioxide = False
-    current_user.allergic_to_tree_nuts = False
-
     if request.method == 'POST':
         if 'allergen' in request.form:
             allergens = request.form.getlist('allergen')
 
-            for allergen in allergens:
-                if allergen == 'celery':
-                    current_user.allergic_to_celery = True
-                elif allergen == 'gluten':
-                    current_user.allergic_to_gluten = True
-                elif allergen == 'lupin':
-                    current_user.allergic_to_lupin = True
-                elif allergen == 'mustard':
-                    current_user.allergic_to_mustard = True
-                elif allergen == 'peanuts':
-                    current_user.allergic_to_peanuts = True
-                elif allergen == 'sesame':
-                    current_user.allergic_to_sesame = True
-                elif allergen == 'soybeans':
-                    current_user.allergic_to_soybeans = True
-                elif allergen == 'sulphur_dioxide':
-                    current_user.allergic_to_sulphur_dioxide = True
-                elif allergen == 'tree_nuts':
-                    current_user.allergic_to_tree_nuts = True
-
-            if 'none' in allergens:
-                current_user.allergic_to_celery = False
-                current_user.allergic_to_gluten = False
-                current_user.allergic_to_lupin = False
-                current_user.allergic_to_mustard = False
-                current_user.allergic_to_peanuts = False
-                current_user.allergic_to_sesame = False
-                current_user.allergic_to_soybeans = False
-                current_user.allergic_to_sulphur_dioxide = False
-                current_user.allergic_to_tree_nuts = False
+            # one UPDATE rather than loading the whole row just to change the mask
+            db.session.execute(
+                update(User).where(User.id == current_user.id)
+                .values(allergen_mask=0 if 'none' in allergens else allergen_mask(allergens), **progress_values())
+                .execution_options(synchronize_session=False)
+            )
 
             flash("Allergy information updated!")
             db.session.commit()
@@ -156,37 +197,22 @@ def updateAllergies():
 
 @users_blueprint.route('/onboarding', methods=['GET', 'POST'])
 @login_required
+@query_budget(2)
 def onboarding():
     if not current_user or current_user.completed_onboarding:
         return redirect(url_for('users.profile'))
 
-    if 'allergen' in request.form:
-        allergens = request.form.getlist('allergen')
-
-        for allergen in allergens:
-            if allergen == 'celery':
-                current_user.allergic_to_celery = True
-            elif allergen == 'gluten':
-                current_user.allergic_to_gluten = True
-            elif allergen == 'lupin':
-                current_user.allergic_to_lupin = True
-            elif allergen == 'mustard':
-                current_user.allergic_to_mustard = True
-            elif allergen == 'peanuts':
-                current_user.allergic_to_peanuts = True
-            elif allergen == 'sesame':
-                current_user.allergic_to_sesame = True
-            elif allergen == 'soybeans':
-                current_user.allergic_to_soybeans = True
-            elif allergen == 'sulphur_dioxide':
-                current_user.allergic_to_sulphur_dioxide = True
-            elif allergen == 'tree_nuts':
-                current_user.allergic_to_tree_nuts = True
-
     if request.method == 'POST':
         if 'completed_onboarding' in request.form:
-            current_user.completed_onboarding = True
+            db.session.execute(
+                update(User).where(User.id == current_user.id)
+                .values(completed_onboarding=True,
+                        allergen_mask=User.allergen_mask.op('|')(allergen_mask(request.form.getlist('allergen'))),
+                        **progress_values())
+                .execution_options(synchronize_session=False)
+            )
             db.session.commit()
+            evict_identity(current_user.id)
             flash('Onboarding completed successfully!')
             return redirect(url_for('users.profile'))
 
@@ -195,23 +221,26 @@ def onboarding():
 
 @users_blueprint.route('/mealTree')
 @login_required
+@conditional()
+@query_budget(10)
 def mealTree():
-    meals = Meal.query.order_by(Meal.mealDifficulty).all()
+    safeOnly = request.args.get('safe') == '1'
+    meals = safe_meals(current_user.allergen_mask) if safeOnly else get_catalog().meals
 
-    completed_meals_ids = {user_meal.meal_id for user_meal in current_user.user_meals.filter_by(completed=True).all()}
+    cursor = progress_cursor(current_user)
+    completedFromCursor = completed_from_cursor(current_user.id, cursor)
+    completed_meals_ids = {meal.mealID for meal in meals if is_completed(meal, cursor, completedFromCursor)}
 
-    nextMeal = None
-    for meal in meals:
-        if meal.mealID not in completed_meals_ids:
-            nextMeal = meal
-            break
+    nextMealIDs = next_meal_ids(current_user.id, cursor, 1, current_user.allergen_mask if safeOnly else 0)
+    nextMeal = get_meal(nextMealIDs[0]) if nextMealIDs else None
 
     return render_template('users/mealTree.html', user=current_user, meals=meals,
-                           completed_meals_ids=completed_meals_ids, next_meal=nextMeal)
+                           completed_meals_ids=completed_meals_ids, next_meal=nextMeal, safe_only=safeOnly)
 
 
 @users_blueprint.route('/complete_meal/<int:meal_id>', methods=['POST'])
 @login_required
+@query_budget(15)
 def complete_meal(meal_id):
     reflection = request.form.get('reflection', '')
     makePublic = request.form.get('make_public') == 'true'
@@ -220,8 +249,11 @@ def complete_meal(meal_id):
         flash('Your reflection must be between 25 and 500 characters to mark this meal as complete!')
         return redirect(url_for('users.meal_detail', meal_id=meal_id))
 
+    meal = get_meal(meal_id)
+    if not meal:
+        abort(404)
+
     userMeal = UserMeal.query.filter_by(user_id=current_user.id, meal_id=meal_id).first()
-    meal = Meal.query.get_or_404(meal_id)
 
     if not userMeal:
         new_user_meal = UserMeal(user_id=current_user.id, meal_id=meal_id, completed=True)
@@ -230,6 +262,9 @@ def complete_meal(meal_id):
     if userMeal and not userMeal.completed:
         userMeal.completed = True
 
+    db.session.flush()
+    advance_progress(current_user.id, progress_cursor(current_user))
+
     newPost = Post(
         user_id=current_user.id,
         email=current_user.email,
@@ -240,14 +275,8 @@ def complete_meal(meal_id):
     db.session.add(newPost)
 
     expAwarded = 25
-    current_user.experiencePoints += expAwarded
-    current_user.meals_completed += 1
-
-    current_user.totalMeatCo2 += meal.meatCo2
-    current_user.totalVeganCo2 += meal.veganCo2
-
-    current_user.co2Reduction = current_user.totalMeatCo2 - current_user.totalVeganCo2
-    current_user.co2ReductionPercent = (current_user.totalMeatCo2 / current_user.totalVeganCo2) * 100
+    award(current_user.id, 'meal', reference=meal_id, experiencePoints=expAwarded, meals_completed=1,
+          totalMeatCo2=meal.meatCo2, totalVeganCo2=meal.veganCo2)
 
     db.session.commit()
     flash(f'Meal completed! + {expAwarded} EXP. You can view your reflective account on the home page!')
@@ -256,8 +285,13 @@ def complete_meal(meal_id):
 
 @users_blueprint.route('/meal_detail/<int:meal_id>')
 @login_required
+@conditional()
+@query_budget(7)
 def meal_detail(meal_id):
-    meal = Meal.query.get_or_404(meal_id)
+    meal = get_meal(meal_id)
+    if not meal:
+        abort(404)
+
     user_meal = UserMeal.query.filter_by(user_id=current_user.id, meal_id=meal_id).first()
 
     completed = user_meal and user_meal.completed
@@ -267,11 +301,14 @@ def meal_detail(meal_id):
 
 @users_blueprint.route('/knowledgeBase')
 @login_required
+@conditional()
+@query_budget(7)
 def knowledgeBase():
-    quizzes = Quiz.query.order_by(Quiz.order).all()
+    quizzes = get_catalog().quizzes
 
-    completed_quizzes_IDs = [user_quiz.quizID for user_quiz in
-                             current_user.user_quizzes.filter_by(completed=True).all()]
+    completed_quizzes_IDs = db.session.execute(
+        select(UserQuiz.quizID).filter_by(user_id=current_user.id, completed=True)
+    ).scalars().all()
 
     return render_template('users/knowledgeBase.html', user=current_user, quizzes=quizzes,
                            completed_quiz_IDs=completed_quizzes_IDs)
@@ -279,130 +316,106 @@ def knowledgeBase():
 
 @users_blueprint.route('/complete_quiz/<int:quizID>', methods=['POST'])
 @login_required
+@query_budget(13)
 def complete_quiz(quizID):
-    user_quiz = UserQuiz.query.filter_by(user_id=current_user.id, quizID=quizID).first()
-
-    quiz = Quiz.query.get(quizID)
+    quiz = get_quiz(quizID)
     if not quiz:
         flash('No quiz has been found here')
         return redirect(url_for('users.knowledgeBase'))
 
-    if user_quiz:
-        user_quiz.completed = True
-    else:
-        new_user_quiz = UserQuiz(user_id=current_user.id, quizID=quizID, completed=True)
-        db.session.add(new_user_quiz)
-
-        questions = Question.query.filter_by(quizID=quizID).all()
-
-        totalUserAnswers = []
-        correctCount = 0
-        totalQuestions = 0
-        for question in questions:
-            totalQuestions += 1
-            userAnswer = request.form.get(f'question_{question.questionID}')
-            isCorrect = userAnswer == question.correctAnswer
-            totalUserAnswers.append((userAnswer, isCorrect))
-            if userAnswer == question.correctAnswer:
-                correctCount += 1
+    attempt = grade_attempt(current_user.id, quizID, request.form)
 
-        correctQuestionExperience = correctCount * 2
-        expAwarded = 2 + correctQuestionExperience  # 2 points for completion and additional 2 xp per correct answer
-        current_user.experiencePoints += expAwarded
+    user_quiz = UserQuiz.query.filter_by(user_id=current_user.id, quizID=quizID).first()
+    if user_quiz and user_quiz.completed:
+        flash(f'Quiz retaken! You scored {attempt.score} out of a possible {attempt.totalQuestions} this time.')
+    else:
+        if user_quiz:
+            user_quiz.completed = True
+            user_quiz.completionDate = datetime.utcnow()
+        else:
+            db.session.add(UserQuiz(user_id=current_user.id, quizID=quizID, completed=True))
 
-        current_user.quizzes_completed += 1
+        # 2 points for completion and additional 2 xp per correct answer, only awarded for the first attempt
+        attempt.expAwarded = 2 + attempt.score * 2
+        award(current_user.id, 'quiz', reference=quizID, experiencePoints=attempt.expAwarded, quizzes_completed=1)
+        flash(f'Quiz completed! + {attempt.expAwarded} EXP. You scored {attempt.score} out of a possible '
+              f'{attempt.totalQuestions} in that quiz!')
 
+    db.session.add(attempt)
     db.session.commit()
-    flash(f'Quiz completed! + {expAwarded} EXP. You scored {correctCount} out of a possible {totalQuestions} in that'
-          f' quiz!')
-    return redirect(url_for('users.reviewQuiz', quizID=quizID, user_answers=totalUserAnswers))
+    return redirect(url_for('users.reviewQuiz', attemptID=attempt.id))
 
 
-#    return redirect(url_for('users.knowledgeBase'))
-
-
-@users_blueprint.route('/review_quiz/<int:quizID>')
+@users_blueprint.route('/review_quiz/<int:attemptID>')
 @login_required
-def reviewQuiz(quizID):
-    userAnswers = request.args.getlist('totalUserAnswers')
-    questions = Question.query.filter_by(quizID=quizID).all()
-
-    questionAnswers = zip(questions, userAnswers)
+@query_budget(7)
+def reviewQuiz(attemptID):
+    attempt = db.session.get(QuizAttempt, attemptID)
+    if not attempt or attempt.user_id != current_user.id:
+        abort(404)
 
-    return render_template('users/reviewQuiz.html', questionAnswers=questionAnswers)
+    return render_template('users/reviewQuiz.html', attempt=attempt, quiz=get_quiz(attempt.quizID),
+                           questionAnswers=review_attempt(attempt),
+                           attempts=attempt_history(current_user.id, attempt.quizID))
 
 
 @users_blueprint.route('/quiz_detail/<int:quizID>')
 @login_required
+@conditional()
+@query_budget(7)
 def quiz_detail(quizID):
-    quiz = Quiz.query.get_or_404(quizID)
-    questions = Question.query.filter_by(quizID=quizID).all()
-    user_quiz = UserQuiz.query.filter_by(user_id=current_user.id, quizID=quizID).first()
+    quiz = get_quiz(quizID)
+    if not quiz:
+        abort(404)
 
-    completed = user_quiz and user_quiz.completed
+    questions = get_questions(quizID)
+    attempts = attempt_history(current_user.id, quizID)
 
-    return render_template('users/quizDetails.html', questions=questions, quiz=quiz, completed=completed)
+    return render_template('users/quizDetails.html', questions=questions, quiz=quiz, completed=bool(attempts),
+                           attempts=attempts)
 
 
 @users_blueprint.route('/shoppingList')
 @login_required
+@query_budget(7)
 def shopping_list():
-    meals = Meal.query.order_by(Meal.mealDifficulty).all()
+    safeOnly = request.args.get('safe') == '1'
+    mealCount = min(max(request.args.get('meals', app.config['SHOPPING_LIST_MEALS'], type=int), 1), 10)
 
-    completed_meals_ids = {user_meal.meal_id for user_meal in current_user.user_meals.filter_by(completed=True).all()}
+    mealIDs = next_meal_ids(current_user.id, progress_cursor(current_user), mealCount,
+                            current_user.allergen_mask if safeOnly else 0)
+    meals = [get_meal(mealID) for mealID in mealIDs]
 
-    current_meal = None
-    next_meal = None
-    found_current = False
-
-    for meal in meals:
-        if meal.mealID not in completed_meals_ids:
-            if not found_current:
-                current_meal = meal
-                found_current = True
-            else:
-                next_meal = meal
-                break
-
-    currentIngredients = current_meal.recipe.split(",") if current_meal else []
-    nextIngredients = next_meal.recipe.split(",") if next_meal else []
-
-    return render_template('users/shoppingList.html', user=current_user,
-                           current_meal=current_meal, next_meal=next_meal,
-                           current_ingredients=currentIngredients, next_ingredients=nextIngredients)
+    return render_template('users/shoppingList.html', user=current_user, meals=meals,
+                           items=build_shopping_list(mealIDs), meal_count=mealCount, safe_only=safeOnly)
 
 
 def daily_login_reward(user):
     today = datetime.utcnow().date()
     loginRewardXP = 2
 
-    if user.lastLogin != today:
-        user.experiencePoints += loginRewardXP
-        user.lastLogin = today
-
-        flash(f"You have been awarded a daily login bonus of +{loginRewardXP} XP.")
-
+    if user.lastLogin != today and claim_daily_reward(user.id, today, loginRewardXP):
         db.session.commit()
+        flash(f"You have been awarded a daily login bonus of +{loginRewardXP} XP.")
 
 
 @users_blueprint.route('/search_users', methods=['GET'])
 @login_required
+@query_budget(2)
 def search_users():
     query = request.args.get('query', '')
     if not query:
         flash('You must enter a user email before attempting to search!')
         return redirect(url_for('index'))
 
-    searchResults = User.query.filter(
-        User.id != current_user.id,
-        (User.firstname.ilike(f'%{query}%') | User.lastname.ilike(f'%{query}%') | User.email.ilike(f'%{query}%'))
-    ).all()
-
-    return render_template('main/index.html', search_results=searchResults)
+    page = max(request.args.get('page', 1, type=int), 1)
+    return stream_page('main/index.html', search_results=find_users(query, current_user.id, page),
+                       search_query=query, search_page=page)
 
 
 @users_blueprint.route('/send_friend_request/<int:user_id>', methods=['POST'])
 @login_required
+@query_budget(5)
 def send_friend_request(user_id):
     targetUser = User.query.get(user_id)
     if not targetUser:
@@ -413,14 +426,13 @@ def send_friend_request(user_id):
         flash('You cannot send a friend request to yourself!')
         return redirect(url_for('index', user_id=user_id))
 
-    existingRequest = Friendship.query.filter(
-        ((Friendship.requester_id == current_user.id) & (Friendship.requested_id == user_id)) |
-        ((Friendship.requester_id == user_id) & (Friendship.requested_id == current_user.id))
-    ).first()
+    userLowID, userHighID = canonical_pair(current_user.id, user_id)
+    existingRequest = Friendship.query.filter_by(user_low_id=userLowID, user_high_id=userHighID).first()
 
+    alreadyRequested = (f'You have already sent friends with {targetUser.email} or have sent a pending friend request '
+                        f'to this user!')
     if existingRequest:
-        flash(f'You have already sent friends with {targetUser.email} or have sent a pending friend request to this '
-              f'user!')
+        flash(alreadyRequested)
         return redirect(url_for('index', user_id=current_user.id))
 
     newRequest = Friendship(
@@ -430,18 +442,26 @@ def send_friend_request(user_id):
         requested_email=targetUser.email
     )
     db.session.add(newRequest)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # the other user sent a request to us at the same moment, the unique pair index keeps only one of them
+        db.session.rollback()
+        flash(alreadyRequested)
+        return redirect(url_for('index', user_id=current_user.id))
     flash(f'You have sent a friend request to {targetUser.email}!')
     return redirect(url_for('index', user_id=user_id))
 
 
 @users_blueprint.route('/accept_friend_request/<int:request_id>', methods=['POST'])
 @login_required
+@query_budget(4)
 def accept_friend_request(request_id):
     friendship = Friendship.query.get(request_id)
     if friendship and friendship.requested_id == current_user.id:
         friendship.status = 'accepted'
         db.session.commit()
+        friendship_accepted(friendship)
         flash('You have accepted this friend request!')
     else:
         flash('There is no pending friend requests here')
@@ -450,11 +470,13 @@ def accept_friend_request(request_id):
 
 @users_blueprint.route('/decline_friend_request/<int:request_id>', methods=['POST'])
 @login_required
+@query_budget(4)
 def decline_friend_request(request_id):
     friendship = Friendship.query.get(request_id)
     if friendship and friendship.requested_id == current_user.id:
         friendship.status = 'declined'
         db.session.commit()
+        friendship_declined(friendship)
         flash('You have declined this user\'s friend request')
     else:
         flash('There is no pending friend request here')